@@ -1,13 +1,49 @@
 #! /usr/bin/python
 
 import argparse
+import itertools
 import json
 import math
 import os
+import re
 import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 
 from solid import *
 from solid.utils import *
+from solid.solidpython import IncludedOpenSCADObject, _ScadStyle, py2openscad
+from solid.geometry2d import evaluate_2d
+from solid.export2d import write_dxf, write_svg
+
+from KeyLayout import KeyLayout
+from BuildProfile import BuildProfile, count_nodes, profiled
+
+
+class switch_holes(IncludedOpenSCADObject):
+    '''
+    Call to the switch_holes() module that BoardBuilder.holes_library() defines in holes.scad.  Anywhere else, it pulls
+    in holes.scad with `use`, so the hole geometry is written, and built by OpenSCAD, only once no matter how many
+    layers cut it.  Pass holes_file=None for the call inside holes.scad itself.  The equivalent CSG tree is kept in
+    `body` for anything that needs the actual cutout geometry rather than the module call.
+    '''
+    __slots__ = ('body',)
+
+    def __init__(self, body=None, holes_file="holes.scad"):
+        IncludedOpenSCADObject.__init__(self, 'switch_holes', {}, holes_file, use_not_include=True)
+        self.body = body
+
+        if holes_file is None:
+            self.include_string = ''
+
+    def _get_include_path(self, include_file_path):
+
+        # holes.scad is written alongside the files that use it, so keep the path relative to them rather than
+        # searching sys.path.
+        return include_file_path
+
 
 class BoardBuilder:
     def __init__(self, kle_json,
@@ -21,10 +57,28 @@ class BoardBuilder:
                        max_wall                 = 10.0,
                        hole_side_count          = -1,
                        stab_vertical_adjustment =  0.0,
-                       stab_height_adjustment   =  0.0):
-
-        with open(kle_json, encoding='utf-8') as f:
-            self.layout = json.loads(f.read())
+                       stab_height_adjustment   =  0.0,
+                       data_driven_holes        = False,
+                       compact                  = False,
+                       precision                = None,
+                       dedupe                   = False,
+                       optimize                 = False,
+                       render_cache             = None,
+                       observers                = None):
+
+        # BuildObservers to report each step's timing and counters to.  See BuildProfile.
+        self.observers = list(observers) if observers else []
+
+        # Accept either a path to the KLE JSON file or an already-parsed KeyLayout, so that callers building many
+        # variants of the same board only need to parse it once.
+        if isinstance(kle_json, KeyLayout):
+            self.layout = kle_json
+        elif self.observers:
+            start = time.perf_counter()
+            self.layout = KeyLayout.load(kle_json)
+            self.notify('parse', time.perf_counter() - start, keys=len(self.layout))
+        else:
+            self.layout = KeyLayout.load(kle_json)
 
         self.min_x = 10000
         self.max_x = 0
@@ -33,8 +87,17 @@ class BoardBuilder:
 
         self.show_points              = show_points
         self.stabs                    = stabs
+        self.default_stab             = { 'type' : stabs }
         self.stab_vertical_adjustment = stab_vertical_adjustment
         self.stab_height_adjustment   = stab_height_adjustment
+        self.data_driven_holes        = data_driven_holes
+        # How the .scad files are written.  See solid.scad_render().
+        self.scad_options             = { 'compact' : compact, 'precision' : precision, 'dedupe' : dedupe,
+                                          'optimize' : optimize, 'cache' : render_cache }
+        # While set to a list, write_scad() adds each (scad_object, filepath, file_header) to it rather than rendering
+        # right away, for render_board() to write them all at once in parallel.
+        self.deferred_writes          = None
+        self.evaluated_layers         = {}
 
         self.corner_radius = corner_radius
 
@@ -87,47 +150,102 @@ class BoardBuilder:
         self.top_wall_thickness    = min(max_wall_thickness, self.top_pad)
         self.bottom_wall_thickness = min(max_wall_thickness, self.bottom_pad)
 
-        # Build the bottom plate after the top one because the plate dimensions are calculated
-        # while building the top plate.
-        #
-        # TODO: Break out the top plate construction, and add parameters so that the order
-        #       of construction doesn't have any hidden dependencies and we don't have to
-        #       explicitly apply corners and such more than once.
-        self.base_top_plate    = self.build_base_top_plate()
-        self.base_bottom_plate = self.build_base_bottom_plate()
+        # The plate is sized from the bounds of all the transformed key spaces, plus padding.  Everything below
+        # depends on these dimensions, so work them out up front; they're cheap.
+        self.key_space_corners = self.layout.key_space_corners()
+        key_space_bounds       = self.layout.bounds(self.key_space_corners)
 
-        if (corner_radius > 0):
-            self.base_top_plate    = self.apply_corners(self.base_top_plate)
-            self.base_bottom_plate = self.apply_corners(self.base_bottom_plate)
+        if key_space_bounds:
+            self.min_x, self.min_y, self.max_x, self.max_y = key_space_bounds
 
-        if (self.num_holes > 3 and self.hole_diameter > 0):
-            self.base_top_plate    = self.apply_screw_holes(self.base_top_plate)
-            self.base_bottom_plate = self.apply_screw_holes(self.base_bottom_plate)
+        self.interior_width  = self.max_x - self.min_x
+        self.interior_height = self.max_y - self.min_y
 
-        # Create any mid layers by subtracting stuff from the bottom plate.
-        self.mid_layer_closed = self.build_mid_layers(self.base_bottom_plate)
+        self.exterior_width  = self.interior_width  + self.left_pad + self.right_pad
+        self.exterior_height = self.interior_height + self.bottom_pad + self.top_pad
+
+    # The layers themselves are only built the first time they're asked for, then cached, so e.g. a caller that only
+    # wants the holes doesn't pay for the plates and mid layers.  Dependencies beyond the plate dimensions:
+    #
+    #   hole_placements             the layout
+    #   holes                       hole_placements
+    #   base_top_plate              holes
+    #   base_bottom_plate           -
+    #   mid_layer_closed            base_bottom_plate
+    #   mid_layer_closed_sectioned  mid_layer_closed
+    #
+    # Any of these can still be assigned to directly to replace the generated geometry.
+
+    @cached_property
+    def hole_placements(self):
+
+        # Each key's placement (x, y, rotation, rx, ry, variant), where variant indexes the distinct cutouts in
+        # self.hole_variants.
+        return self.build_hole_placements()
+
+    @cached_property
+    def holes(self):
+
+        # The justified keyholes, also rendered as a separate drawing, convenient for subtraction from a custom plate
+        # designed elsewhere.
+        return self.build_holes()
+
+    @cached_property
+    def base_top_plate(self):
+        return self.finish_plate(self.build_base_top_plate())
+
+    @cached_property
+    def base_bottom_plate(self):
+        return self.finish_plate(self.build_base_bottom_plate())
 
+    @cached_property
+    def mid_layer_closed(self):
+
+        # Create any mid layers by subtracting stuff from the bottom plate.
+        #
         # TODO: Option to generate an open mid-layer?  Consider:
         #       1. Default opening placement (middle of the top, etc?)
         #       2. Default size (USB recepticle sizes?)
         #       3. Args to control the above.
+        return self.build_mid_layers(self.base_bottom_plate)
+
+    @cached_property
+    def mid_layer_closed_sectioned(self):
 
         # Create an optional material space-optimized representation of the mid-plate to give
         # the user the option of tightly packing multiple mid layers on a single drawing, if
         # they want to go to that level.
-        self.mid_layer_closed_sectioned = self.build_sectioned_mid_layer(self.mid_layer_closed)
-
-    def update_mins_maxes(self, points):
-        for point in points:
-            if self.min_x > point[0]:
-                self.min_x = point[0]
-            if self.max_x < point[0]:
-                self.max_x = point[0]
-            if self.min_y > point[1]:
-                self.min_y = point[1]
-            if self.max_y < point[1]:
-                self.max_y = point[1]
+        return self.build_sectioned_mid_layer(self.mid_layer_closed)
+
+    def notify(self, name, seconds, **counters):
+        for observer in self.observers:
+            observer.phase(name, seconds, **counters)
+
+    def write_scad(self, scad_object, filepath, file_header=''):
+        if self.deferred_writes is not None:
+            return self.deferred_writes.append((scad_object, filepath, file_header))
+
+        if not self.observers:
+            return scad_render_to_file(scad_object, filepath, file_header=file_header, include_orig_code=False,
+                                       **self.scad_options)
+
+        start = time.perf_counter()
+        scad_render_to_file(scad_object, filepath, file_header=file_header, include_orig_code=False, **self.scad_options)
+        self.notify('scad_render_to_file', time.perf_counter() - start,
+                    nodes=count_nodes(scad_object), bytes=os.path.getsize(filepath), file=os.path.basename(filepath))
+
+    def finish_plate(self, plate):
+
+        # Corners and screw holes common to the top and bottom plates.
+        if (self.corner_radius > 0):
+            plate = self.apply_corners(plate)
+
+        if (self.num_holes > 3 and self.hole_diameter > 0):
+            plate = self.apply_screw_holes(plate)
 
+        return plate
+
+    @profiled('apply_corners')
     def apply_corners(self, plate):
 
         def build_corner():
@@ -158,6 +276,7 @@ class BoardBuilder:
             )
         )
 
+    @profiled('apply_screw_holes')
     def apply_screw_holes(self, plate):
 
         def build_screw_hole_row(y, row_wall_thickness, row_is_top):
@@ -227,6 +346,7 @@ class BoardBuilder:
         else:
             return plate
 
+    @profiled('switch_hole')
     def switch_hole(self, width_factor, height_factor, stab_style):
 
         def stab_geometry():
@@ -294,8 +414,7 @@ class BoardBuilder:
                     square(size=[3.3, 14 + height_fudge])
                 )
 
-            bottom_fudge = stab_style['bottom_fudge'] if 'bottom_fudge' in stab_style else self.stab_vertical_adjustment
-            height_fudge = stab_style['height_fudge'] if 'height_fudge' in stab_style else self.stab_height_adjustment
+            bottom_fudge, height_fudge = self.stab_fudges(stab_style)
 
             if stab_style['type'] == 'cherry':
                 return cherry_stab()
@@ -358,241 +477,196 @@ class BoardBuilder:
 
         hole = square(size=[14, 14], center=True)
 
-        if width_factor >= 2.0 or height_factor >= 2.0:
+        spacing = self.stab_spacing(width_factor, height_factor)
 
-            # The spacebar stab spacing numbers came from:
-            #   https://deskthority.net/wiki/Space_bar_dimensions
-            #
-            # TODO: Add some means of specifying and generating spacebar mount style variants.
+        if spacing is not None:
 
-            if width_factor >= 8.0 or height_factor >= 8.0:
+            stab = build_stab(spacing)
 
-                stab = build_stab(133.35)       # == 5.25 inches.  Metric and imperial specs match.
+            # Important note: Because the plate gets flipped at the end, we have to build
+            #   the geometry upside down!  i.e. notice the mirror call
 
-            elif width_factor >= 7.0 or height_factor >= 7.0:
+            hole = union()(
+                hole,
+                mirror( [ 0, 1, 0 ] )(stab)
+            )
 
-                stab = build_stab(114.3)        # == 4.5 inches.  Not given in metric spec.
+            if height_factor > width_factor:
 
-            elif width_factor >= 6.25 or height_factor >= 6.25:
+                hole = rotate( [ 0, 0, 90 ] )(hole)
 
-                stab = build_stab(100.0)
+        return hole
 
-            #elif width_factor >= 6.0 or height_factor >= 6.0:
+    def stab_spacing(self, width_factor, height_factor):
 
-                # TODO: Deal with this asymmetrical case.
+        # The distance between the stabs of a key this size, or None if it's too small to need them.
+        if width_factor < 2.0 and height_factor < 2.0:
+            return None
 
-            elif width_factor >= 3.0 or height_factor >= 3.0:
+        # The spacebar stab spacing numbers came from:
+        #   https://deskthority.net/wiki/Space_bar_dimensions
+        #
+        # TODO: Add some means of specifying and generating spacebar mount style variants.
 
-                stab = build_stab(38.1)     # == 1.5 inches.  Metric and imperial specs match here...
+        if width_factor >= 8.0 or height_factor >= 8.0:
 
-            else:
+            return 133.35       # == 5.25 inches.  Metric and imperial specs match.
 
-                # Watch out!
-                # The metric spec calls for 23.8.  But in practice, that makes the inserts rub against
-                # the housing, and even catch the clips and possibly stick with some caps! (I experienced
-                # this with DSA, and GMK to a lesser extent)
-                # stab = build_stab(23.8)
-                #
-                # The imperial spec calls for 0.94 inches, which comes out to 23.876, possibly large
-                # enough to avoid the rubbing and clip catch.  Here we go with 23.88 for margin, within
-                # tolerance for both.
-                #
-                # NOTE: Speaking of the imperial spec, there's an error on the 1x2 drawing.  See the
-                #       description in build_stab().
-                stab = build_stab(23.88)
+        elif width_factor >= 7.0 or height_factor >= 7.0:
 
-            # Important note: Because the plate gets flipped at the end, we have to build
-            #   the geometry upside down!  i.e. notice the mirror call
+            return 114.3        # == 4.5 inches.  Not given in metric spec.
 
-            hole = union()(
-                hole,
-                mirror( [ 0, 1, 0 ] )(stab)
-            )
+        elif width_factor >= 6.25 or height_factor >= 6.25:
 
-            if height_factor > width_factor:
+            return 100.0
 
-                hole = rotate( [ 0, 0, 90 ] )(hole)
+        #elif width_factor >= 6.0 or height_factor >= 6.0:
 
-        return hole
+            # TODO: Deal with this asymmetrical case.
 
-    def build_base_top_plate(self):
-        key_hole_squares = []
+        elif width_factor >= 3.0 or height_factor >= 3.0:
 
-        rx = 0
-        ry = 0
-        r = 0
-
-        cursor_x = 0
-        cursor_y = 0
-
-        standard_key_spacing = 19.05    # From an older Cherry spec.
-        key_space_points = []
-
-        for row in self.layout:
-
-            cursor_x = rx
-
-            height_increment = standard_key_spacing
-            next_key_width_factor  = 1.0
-            next_key_height_factor = 1.0
-            skip_next = False
-            next_stab = { 'type' : self.stabs }
-
-            if type(row) == list:
-                for e in row:
-
-                    # All this handling is from keyboard-layout-editor.com's generated JSON.
-                    #
-                    if type(e) == dict:
-                        if 'r' in e:    # Rotation angle
-                            r = e['r']
-                        if 'w' in e:                        # Forcing next key's unit width
-                            next_key_width_factor = e['w']
-                        if 'h' in e:                        # Forcing next key's unit height
-                            next_key_height_factor = e['h']
-                        if 'rx' in e:                               # Redefining the cursor's "reset" x coordinate.
-                            rx = e['rx'] * standard_key_spacing
-                            cursor_x = rx
-                            cursor_y = ry
-                        if 'ry' in e:                               # Redefining the cursor's "reset" y coordinate.
-                            ry = e['ry'] * standard_key_spacing
-                            cursor_x = rx
-                            cursor_y = ry
-                        if 'x' in e:                                            # Forcing the cursor's x positioning relative to "here."
-                            cursor_x = cursor_x + (standard_key_spacing * e['x' ] )
-                        if 'y' in e:                                            # Forcing the cursor's y positioning relative to "here."
-                            cursor_y = cursor_y + (standard_key_spacing * e['y' ] )
-                        if 'd' in e:                # Next "key" is really a decal.  Skip it.
-                            skip_next = True
-                        if 'bb_stab' in e:                                        # BoardBuilder-specific wrinkle: force stabilizer style.
-                            next_stab = e['bb_stab']
-
-                    elif skip_next:
-                        skip_next = False
-
-                    else:
-
-                        space_width =  standard_key_spacing * next_key_width_factor
-                        space_height = standard_key_spacing * next_key_height_factor
-
-                        space_relative_x_center = space_width  / 2
-                        space_relative_y_center = space_height / 2
-
-                        def trans2d(translation, point):
-                            return [translation[0] + point[0],
-                                    translation[1] + point[1]]
-
-                        def rotate2d(degrees, point):
-                            rads = degrees * 3.14159 / 180.0
-                            return [point[0] * math.cos(rads) - point[1] * math.sin(rads),
-                                    point[0] * math.sin(rads) + point[1] * math.cos(rads)]
-
-                        def apply_square():
-                            # Apply the transformation on an origin-centered rectangle representing the whole key space.
-                            return [ apply_transform( [ -space_relative_x_center, -space_relative_y_center ] ),
-                                     apply_transform( [  space_relative_x_center, -space_relative_y_center ] ),
-                                     apply_transform( [  space_relative_x_center,  space_relative_y_center ] ),
-                                     apply_transform( [ -space_relative_x_center,  space_relative_y_center ] )]
-
-                        if r != 0.0:
-
-                            def apply_transform(point):
-                                return trans2d( [ rx, ry],
-                                    rotate2d(r,
-                                        trans2d( [ -rx, -ry],
-                                            trans2d( [ cursor_x + space_relative_x_center, cursor_y + space_relative_y_center],
-                                                point
-                                            )
-                                        )
-                                    )
-                                )
+            return 38.1     # == 1.5 inches.  Metric and imperial specs match here...
 
-                            transformed_square = apply_square()
+        else:
 
-                            key_space_points.extend(transformed_square)
+            # Watch out!
+            # The metric spec calls for 23.8.  But in practice, that makes the inserts rub against
+            # the housing, and even catch the clips and possibly stick with some caps! (I experienced
+            # this with DSA, and GMK to a lesser extent)
+            # return 23.8
+            #
+            # The imperial spec calls for 0.94 inches, which comes out to 23.876, possibly large
+            # enough to avoid the rubbing and clip catch.  Here we go with 23.88 for margin, within
+            # tolerance for both.
+            #
+            # NOTE: Speaking of the imperial spec, there's an error on the 1x2 drawing.  See the
+            #       description in build_stab().
+            return 23.88
 
-                            self.update_mins_maxes(transformed_square)
+    def stab_fudges(self, stab_style):
 
-                            key_hole_squares.append(
-                                translate( [ rx, ry, 0 ] )(
-                                    rotate( [ 0, 0, r ] )(
-                                        translate( [ -rx, -ry, 0 ] )(
-                                            translate( [ cursor_x + space_relative_x_center, cursor_y + space_relative_y_center, 0 ] )(
-                                                self.switch_hole(next_key_width_factor, next_key_height_factor, next_stab)
-                                            )
-                                        )
-                                    )
-                                )
-                            )
+        # The (bottom_fudge, height_fudge) tuning for a Costar cutout.  See switch_hole().
+        return (stab_style.get('bottom_fudge', self.stab_vertical_adjustment),
+                stab_style.get('height_fudge', self.stab_height_adjustment))
 
-                        else:
+    def hole_variant_key(self, width_factor, height_factor, stab_style):
 
-                            # Support a simplied, non-rotated set of transformations just to cut down on the size of
-                            # the generated scad file.
+        # Everything a key's cutout depends on:  its stab spacing, whether it's turned on its side, and the stab type,
+        # along with the Costar fudges for the types that have a Costar cutout.  Keys under 2u don't get stabs at all,
+        # so they all share the plain switch cutout.
+        spacing = self.stab_spacing(width_factor, height_factor)
+        if spacing is None:
+            return None
 
-                            def apply_transform(point):
-                                return trans2d( [ cursor_x + space_relative_x_center, cursor_y + space_relative_y_center], point)
+        fudges = self.stab_fudges(stab_style) if stab_style['type'] in ('costar', 'both') else None
+        return (spacing, height_factor > width_factor, stab_style['type'], fudges)
 
-                            transformed_square = apply_square()
+    def switch_hole_variant(self, width_factor, height_factor, stab_style):
 
-                            key_space_points.extend(transformed_square)
+        # Every key whose cutout comes out the same shares the very same one, so build each variant only once.  The
+        # resulting node is shared between all of its keys, which SolidPython renders just fine.  It's frozen, so
+        # that nothing can change it for every key at once, and so copies of the holes share it.
+        variant_key = self.hole_variant_key(width_factor, height_factor, stab_style)
 
-                            self.update_mins_maxes(transformed_square)
+        if variant_key not in self.hole_variant_indices:
+            self.hole_variant_indices[variant_key] = len(self.hole_variants)
+            self.hole_variants.append(
+                (variant_key, self.switch_hole(width_factor, height_factor, stab_style).freeze())
+            )
 
-                            key_hole_squares.append(
-                                    translate( [ cursor_x + space_relative_x_center, cursor_y + space_relative_y_center, 0 ] )(
-                                        self.switch_hole(next_key_width_factor, next_key_height_factor, next_stab)
-                                    )
-                            )
+        return self.hole_variant_indices[variant_key]
 
-                        cursor_x = cursor_x + space_width
+    def build_hole_placements(self):
 
-                        next_key_width_factor  = 1.0
-                        next_key_height_factor = 1.0
-                        next_stab              = { 'type' : self.stabs }
+        # Key placements (x, y, rotation, rx, ry, variant) and the distinct cutouts they refer to, for data-driven
+        # rendering of the holes.
+        self.hole_variants        = []
+        self.hole_variant_indices = {}
 
-                # In KLE, the per-row Y increment seems to be a constant 1u, unlike the X increment, which is the key's entire width
-                cursor_y = cursor_y + height_increment
+        placements = []
 
-        self.interior_width  = self.max_x - self.min_x
-        self.interior_height = self.max_y - self.min_y
+        for key in self.layout:
 
-        self.exterior_width  = self.interior_width  + self.left_pad + self.right_pad
-        self.exterior_height = self.interior_height + self.bottom_pad + self.top_pad
+            stab = key.stab if key.stab is not None else self.default_stab
 
-        # The KLE format assumes origin at upper-left, whereas OpenSCAD is origin at lower-left.  The resulting geometry
-        # thus needs to be flipped.  Define a function to do that, as well as justify the geometry so that even with
-        # rotated holes, keyspaces are justified onto the x and y axes.
-        def transform_from_kle_geometry(geometry):
-            return translate( [ 0, self.interior_height, 0 ] )(
-                mirror( [ 0, 1, 0 ])(
-                    translate( [ -self.min_x, -self.min_y, 0 ] )(
-                        geometry
+            variant = self.switch_hole_variant(key.width_factor, key.height_factor, stab)
+
+            placements.append( (key.x, key.y, key.r, key.rx, key.ry, variant) )
+
+        return placements
+
+    @profiled('build_holes')
+    def build_holes(self):
+        key_hole_squares = []
+
+        for x, y, r, rx, ry, variant in self.hole_placements:
+
+            hole = self.hole_variants[variant][1]
+
+            if r != 0.0:
+
+                key_hole_squares.append(
+                    translate( [ rx, ry, 0 ] )(
+                        rotate( [ 0, 0, r ] )(
+                            translate( [ -rx, -ry, 0 ] )(
+                                translate( [ x, y, 0 ] )(
+                                    hole
+                                )
+                            )
+                        )
                     )
                 )
-            )
 
-        # Save off the justified keyholes as a member to be rendered as a separate drawing, convenient for subtraction
-        # from a custom plate designed elsewhere.
-        self.holes = transform_from_kle_geometry(
+            else:
+
+                # Support a simplied, non-rotated set of transformations just to cut down on the size of
+                # the generated scad file.
+
+                key_hole_squares.append(
+                        translate( [ x, y, 0 ] )(
+                            hole
+                        )
+                )
+
+        return self.transform_from_kle_geometry(
                 key_hole_squares
         )
 
+    def transform_from_kle_geometry(self, geometry):
+
+        # The KLE format assumes origin at upper-left, whereas OpenSCAD is origin at lower-left.  The resulting geometry
+        # thus needs to be flipped.  Also justify the geometry so that even with rotated holes, keyspaces are justified
+        # onto the x and y axes.
+        return translate( [ 0, self.interior_height, 0 ] )(
+            mirror( [ 0, 1, 0 ])(
+                translate( [ -self.min_x, -self.min_y, 0 ] )(
+                    geometry
+                )
+            )
+        )
+
+    @profiled('build_base_top_plate')
+    def build_base_top_plate(self):
+
+        # The plate calls the switch_holes() module from holes.scad instead of carrying its own copy of the hole tree.
+        plate_holes = switch_holes(self.holes)
+
         # Take the padding into account when actually making the top plate itself.
         plate = difference()(
                 square(size=[self.exterior_width, self.exterior_height ] ),
                 translate([self.left_pad, self.bottom_pad, 0])(
-                    self.holes
+                    plate_holes
                 )
             )
 
         if self.show_points:
-            point_collection = [ translate( [ p[0],p[1],1 ] )(circle(r=1, segments=20)) for p in key_space_points ]
+            point_collection = [ translate( [ x, y, 1 ] )(circle(r=1, segments=20)) for x, y in zip(*self.key_space_corners) ]
             plate = union()(
                     plate,
                     color("red")(
                         translate([self.left_pad, self.bottom_pad, 0])(
-                            transform_from_kle_geometry(
+                            self.transform_from_kle_geometry(
                                 point_collection
                             )
                         )
@@ -601,10 +675,12 @@ class BoardBuilder:
 
         return plate
 
+    @profiled('build_base_bottom_plate')
     def build_base_bottom_plate(self):
 
         return square(size=[self.exterior_width, self.exterior_height ] )
 
+    @profiled('build_mid_layers')
     def build_mid_layers(self, plate):
 
         # Interior rectangle is the rectangular bounding box of the all key holes.
@@ -628,6 +704,7 @@ class BoardBuilder:
                     )
                 )
 
+    @profiled('build_sectioned_mid_layer')
     def build_sectioned_mid_layer(self, mid_layer):
         if mid_layer:
 
@@ -684,19 +761,335 @@ class BoardBuilder:
 
             return space_optimized_mid_layer
 
+    def module_body(self, scad_object):
+
+        # scad_object's code, to go between the braces of a module definition.
+        code = scad_render(scad_object, **self.scad_options).strip()
+        if self.scad_options['compact']:
+            return code
+        return "\n\t{0}\n".format(code.replace("\n", "\n\t"))
+
+    @profiled('holes_library')
+    def holes_library(self):
+
+        # The switch_holes() module for holes.scad.  Normally it just wraps self.holes.
+        #
+        # In data-driven mode it's one module per distinct cutout, a table of key placements, and a switch_holes()
+        # that walks the table.  OpenSCAD only has to parse and build each cutout once, no matter how many keys share
+        # it.
+        if not self.data_driven_holes:
+            return "module switch_holes() {{{0}}}\n".format(self.module_body(self.holes))
+
+        # Working out the placements also works out the variants they refer to.
+        placements = self.hole_placements
+
+        # Placements are written as the rest of the .scad files' numbers are, per the board's compact and precision
+        # options.
+        style = _ScadStyle(self.scad_options['compact'], self.scad_options['precision'])
+
+        def number(value):
+            return py2openscad(value, style)
+
+        library = ""
+
+        for index, (variant_key, hole) in enumerate(self.hole_variants):
+            if variant_key is None:
+                library += "// Plain switch cutout\n"
+            else:
+                spacing, rotated, stab_type, fudges = variant_key
+                library += "// {0:g}mm {1} stabs{2}\n".format(spacing, stab_type, ", rotated" if rotated else "")
+
+            library += "module switch_hole_{0}() {{{1}}}\n\n".format(index, self.module_body(hole))
+
+        library += "module switch_hole_variant(variant) {\n"
+        for index in range(len(self.hole_variants)):
+            library += "\t{0}if (variant == {1}) switch_hole_{1}();\n".format("else " if index else "", index)
+        library += "}\n\n"
+
+        # Columns:  x, y, rotation, rotation origin x, rotation origin y, variant
+        library += "switch_hole_placements = [\n"
+        library += ",\n".join("\t[{0}, {1}, {2}, {3}, {4}, {5}]".format(
+                        number(x), number(y), number(r), number(rx), number(ry), variant)
+                        for x, y, r, rx, ry, variant in placements)
+        library += "\n];\n\n"
+
+        # Same transformation stack as build_base_top_plate() uses for each key and transform_from_kle_geometry() uses
+        # for the whole set.
+        library += ("module switch_holes() {{\n"
+                    "\ttranslate([0, {0}, 0]) mirror([0, 1, 0]) translate([{1}, {2}, 0])\n"
+                    "\t\tfor (k = switch_hole_placements)\n"
+                    "\t\t\ttranslate([k[3], k[4], 0]) rotate([0, 0, k[2]]) translate([-k[3], -k[4], 0])\n"
+                    "\t\t\t\ttranslate([k[0], k[1], 0]) switch_hole_variant(k[5]);\n"
+                    "}}\n").format(number(self.interior_height), number(-self.min_x), number(-self.min_y))
+
+        return library
+
     def render_top_plate(self, output_dir):
-        scad_render_to_file(self.base_top_plate, os.path.join(output_dir, "top.scad"),   include_orig_code=False)
-        scad_render_to_file(self.holes,          os.path.join(output_dir, "holes.scad"), include_orig_code=False)
+
+        # top.scad uses holes.scad for its cutouts, so the holes are only serialized once.
+        self.write_scad(switch_holes(holes_file=None), os.path.join(output_dir, "holes.scad"), file_header=self.holes_library())
+        self.write_scad(self.base_top_plate,           os.path.join(output_dir, "top.scad"))
 
     def render_bottom_plate(self, output_dir):
-        scad_render_to_file(self.base_bottom_plate, os.path.join(output_dir, "bottom.scad"), include_orig_code=False)
+        self.write_scad(self.base_bottom_plate, os.path.join(output_dir, "bottom.scad"))
 
     def render_mid_layers(self, output_dir):
         if self.mid_layer_closed:
-            scad_render_to_file(self.mid_layer_closed, os.path.join(output_dir, "mid_closed.scad"), include_orig_code=False)
+            self.write_scad(self.mid_layer_closed, os.path.join(output_dir, "mid_closed.scad"))
 
         if self.mid_layer_closed_sectioned:
-            scad_render_to_file(self.mid_layer_closed_sectioned, os.path.join(output_dir, "mid_closed_sectioned.scad"), include_orig_code=False)
+            self.write_scad(self.mid_layer_closed_sectioned, os.path.join(output_dir, "mid_closed_sectioned.scad"))
+
+    def layer_outlines(self, layer):
+
+        # Flattened outlines of one of the layers above, e.g. 'base_top_plate', evaluated in-process and cached so that
+        # writing both a DXF and an SVG only evaluates each layer once.
+        if layer not in self.evaluated_layers:
+            start = time.perf_counter()
+            self.evaluated_layers[layer] = evaluate_2d(getattr(self, layer))
+            self.notify('evaluate_2d', time.perf_counter() - start)
+        return self.evaluated_layers[layer]
+
+    def write_layers(self, output_dir, layers, writer, extension):
+        for layer, name in layers:
+            if getattr(self, layer):
+                outlines = self.layer_outlines(layer)
+                filepath = os.path.join(output_dir, name + extension)
+
+                start = time.perf_counter()
+                writer(outlines, filepath)
+
+                if self.observers:
+                    self.notify(writer.__name__, time.perf_counter() - start,
+                                bytes=os.path.getsize(filepath), file=os.path.basename(filepath))
+
+    # Cut-ready counterparts of the render_* methods, written straight from the plate outlines without OpenSCAD.
+    # Circles and rounded corners come out as true arcs.
+    top_plate_layers  = [ ('base_top_plate', 'top'), ('holes', 'holes') ]
+    bottom_layers     = [ ('base_bottom_plate', 'bottom') ]
+    mid_layers        = [ ('mid_layer_closed', 'mid_closed'), ('mid_layer_closed_sectioned', 'mid_closed_sectioned') ]
+
+    def render_top_plate_dxf(self, output_dir):
+        self.write_layers(output_dir, self.top_plate_layers, write_dxf, ".dxf")
+
+    def render_top_plate_svg(self, output_dir):
+        self.write_layers(output_dir, self.top_plate_layers, write_svg, ".svg")
+
+    def render_bottom_plate_dxf(self, output_dir):
+        self.write_layers(output_dir, self.bottom_layers, write_dxf, ".dxf")
+
+    def render_bottom_plate_svg(self, output_dir):
+        self.write_layers(output_dir, self.bottom_layers, write_svg, ".svg")
+
+    def render_mid_layers_dxf(self, output_dir):
+        self.write_layers(output_dir, self.mid_layers, write_dxf, ".dxf")
+
+    def render_mid_layers_svg(self, output_dir):
+        self.write_layers(output_dir, self.mid_layers, write_svg, ".svg")
+
+
+#------------------------------------------------------------------------------
+# Batch builds.  These live at module level so that ProcessPoolExecutor workers can pickle them.
+
+# BoardBuilder constructor arguments, which are also the command line's argument names
+board_options = ( 'horizontal_pad', 'vertical_pad', 'corner_radius', 'num_holes', 'hole_diameter', 'show_points',
+                  'stabs', 'max_wall', 'hole_side_count', 'stab_vertical_adjustment', 'stab_height_adjustment',
+                  'data_driven_holes', 'compact', 'precision', 'dedupe', 'optimize' )
+
+def render_board(board, output_dir, dxf=False, svg=False, jobs=None):
+
+    # With jobs > 1, the .scad files are rendered in that many worker processes at once.  The render cache has to stay
+    # in this one, so it takes precedence.
+    parallel = jobs is not None and jobs > 1 and board.scad_options['cache'] is None
+    if parallel:
+        board.deferred_writes = []
+
+    try:
+        board.render_top_plate(output_dir)
+        board.render_bottom_plate(output_dir)
+        board.render_mid_layers(output_dir)
+    finally:
+        writes, board.deferred_writes = board.deferred_writes, None
+
+    if parallel:
+        options = { name : board.scad_options[name] for name in ('compact', 'precision', 'dedupe', 'optimize') }
+        start   = time.perf_counter()
+        paths   = scad_render_to_files(writes, jobs, **options)
+        board.notify('scad_render_to_files', time.perf_counter() - start, files=len(paths),
+                     bytes=sum(os.path.getsize(path) for path in paths))
+
+    if dxf:
+        board.render_top_plate_dxf(output_dir)
+        board.render_bottom_plate_dxf(output_dir)
+        board.render_mid_layers_dxf(output_dir)
+
+    if svg:
+        board.render_top_plate_svg(output_dir)
+        board.render_bottom_plate_svg(output_dir)
+        board.render_mid_layers_svg(output_dir)
+
+def build_board(kle_json, output_dir, options, dxf=False, svg=False, profile=False):
+
+    # Build and render one board variant into output_dir, returning its manifest entry.  Errors are recorded rather
+    # than raised so that one bad variant doesn't sink the rest of the batch.
+    entry    = { 'json' : kle_json, 'output_dir' : output_dir, 'options' : options }
+    observer = BuildProfile() if profile else None
+    start    = time.perf_counter()
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+
+        board = BoardBuilder(kle_json, observers=[ observer ] if observer else None, **options)
+        built = time.perf_counter()
+
+        render_board(board, output_dir, dxf, svg)
+
+        entry['build_seconds']  = built - start
+        entry['render_seconds'] = time.perf_counter() - built
+        entry['outputs']        = sorted(os.listdir(output_dir))
+
+    except Exception as e:
+        entry['error'] = "{0}: {1}".format(type(e).__name__, e)
+
+    entry['seconds'] = time.perf_counter() - start
+
+    if observer:
+        entry['profile'] = observer.as_dict()
+
+    return entry
+
+def batch_variants(kle_jsons, output_dir, options, matrix):
+
+    # Expand every layout against every combination of the matrix's values, e.g.
+    #   { "stabs" : ["cherry", "costar"], "corner_radius" : [0, 3] }
+    # Each variant gets its own directory, output_dir/<layout>/<parameter-value_...>, returned as a list of
+    # (kle_json, variant_output_dir, options) tuples.  Raises ValueError if two variants would still share a
+    # directory.
+    names       = list(matrix)
+    variants    = []
+    layout_dirs = layout_names(kle_jsons)
+    built_from  = {}
+
+    for kle_json in kle_jsons:
+        layout_dir = os.path.join(output_dir, layout_dirs[kle_json])
+
+        for values in itertools.product(*[ matrix[name] for name in names ]):
+            variant_options = dict(options)
+            variant_options.update(zip(names, values))
+
+            variant_name = "_".join("{0}-{1}".format(name, value) for name, value in zip(names, values))
+            variant_name = re.sub(r'[^\w.,=+-]+', '_', variant_name)
+
+            variant_dir  = os.path.join(layout_dir, variant_name) if variant_name else layout_dir
+            description  = " ".join([ kle_json ] + [ "{0}={1}".format(name, value) for name, value in zip(names, values) ])
+
+            if variant_dir in built_from:
+                raise ValueError("{0} and {1} would both be built into {2}.".format(built_from[variant_dir], description, variant_dir))
+            built_from[variant_dir] = description
+
+            variants.append((kle_json, variant_dir, variant_options))
+
+    return variants
+
+def layout_names(kle_jsons):
+
+    # { kle_json : directory name } for each layout.  That's the file's name without its extension, unless another
+    # layout has the same one, in which case the directories they're in tell them apart, e.g. a_keys and b_keys for
+    # a/keys.json and b/keys.json.  The same file given twice gets the same name.
+    paths   = { kle_json : os.path.abspath(kle_json) for kle_json in kle_jsons }
+    by_stem = {}
+
+    for kle_json, path in paths.items():
+        by_stem.setdefault(os.path.splitext(os.path.basename(path))[0], set()).add(path)
+
+    names = {}
+
+    for kle_json, path in paths.items():
+        stem   = os.path.splitext(os.path.basename(path))[0]
+        others = by_stem[stem]
+
+        if len(others) > 1:
+            relative = os.path.relpath(os.path.splitext(path)[0], os.path.commonpath(list(others)))
+            stem     = re.sub(r'[^\w.,=+-]+', '_', relative)
+
+        names[kle_json] = stem
+
+    return names
+
+def build_batch(variants, output_dir, jobs=None, dxf=False, svg=False, profile=False):
+
+    # Build all the variants in a process pool and write output_dir/manifest.json describing what went where and how
+    # long it took.
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [ executor.submit(build_board, kle_json, variant_dir, options, dxf, svg, profile)
+                    for kle_json, variant_dir, options in variants ]
+        boards  = [ future.result() for future in futures ]
+
+    manifest = {
+        'jobs'    : jobs or os.cpu_count(),
+        'seconds' : time.perf_counter() - start,
+        'boards'  : boards,
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest
+
+def load_matrix(matrix, parser):
+
+    # --matrix takes either a JSON file or inline JSON.  Single values are promoted to one-element lists, and each
+    # value is converted just as parser would convert it on the command line, so e.g. "num_holes" : "6" and
+    # --num_holes 6 build the same board.
+    if os.path.isfile(matrix):
+        with open(matrix, encoding='utf-8') as f:
+            matrix = json.load(f)
+    else:
+        matrix = json.loads(matrix)
+
+    if not isinstance(matrix, dict):
+        raise ValueError("The parameter matrix must be a JSON object of parameter name to list of values.")
+
+    actions = { action.dest : action for action in parser._actions }
+
+    for name, values in matrix.items():
+        if name not in board_options:
+            raise ValueError("Unknown matrix parameter: {0}.  Expected one of: {1}".format(name, ", ".join(board_options)))
+        if not isinstance(values, list):
+            values = [ values ]
+
+        matrix[name] = [ convert_option(actions[name], value) for value in values ]
+
+    return matrix
+
+def convert_option(action, value):
+
+    # value, from a matrix, as the argparse action for its option would take it from the command line.  Flags take
+    # true or false, and options whose default is None also take null.
+    if value is None and action.default is None:
+        return None
+
+    if action.nargs == 0:
+        if not isinstance(value, bool):
+            raise ValueError("{0} takes true or false, not {1!r}.".format(action.dest, value))
+        return value
+
+    if isinstance(value, (bool, list, dict)) or value is None:
+        raise ValueError("Invalid value for {0}: {1!r}".format(action.dest, value))
+
+    try:
+        value = action.type(str(value)) if action.type else str(value)
+    except (TypeError, ValueError, argparse.ArgumentTypeError):
+        raise ValueError("Invalid value for {0}: {1!r}".format(action.dest, value))
+
+    if action.choices is not None and value not in action.choices:
+        raise ValueError("Invalid value for {0}: {1!r}.  Expected one of: {2}".format(
+                action.dest, value, ", ".join(map(str, action.choices))))
+
+    return value
 
 
 #------------------------------------------------------------------------------
@@ -707,7 +1100,7 @@ if __name__ == "__main__":
             formatter_class = argparse.ArgumentDefaultsHelpFormatter
     )
 
-    parser.add_argument('-j',   '--json',            type=str,   default='',     required=True, help="JSON file to load.  Raw data download from keyboard-layout-editor.com.")
+    parser.add_argument('-j',   '--json',            type=str,   nargs='+',      required=True, help="JSON file(s) to load.  Raw data download from keyboard-layout-editor.com.")
     parser.add_argument('-o',   '--output_dir',      type=str,   default='.',    help="Directory into which the resulting .scad files will be generated.")
     parser.add_argument('-s',   '--stabs',           choices=['both', 'cherry', 'costar'], default='cherry', help="Specify the style of stabilizers to generate.")
     parser.add_argument('-hp',  '--horizontal_pad',  type=str,   default='0.0',  help="Horizontal padding per side. Can also define left,right padding.")
@@ -721,22 +1114,56 @@ if __name__ == "__main__":
 
     parser.add_argument('-sva','--stab_vertical_adjustment', type=float, default=0.0, help="Adjust the vertical positioning of Costar stabs.")
     parser.add_argument('-sha','--stab_height_adjustment',   type=float, default=0.0, help="Adjust the vertical size of Costar stabs.")
+    parser.add_argument('-dd', '--data_driven_holes', action="store_true",        help="Emit each distinct switch cutout once as a module, plus a table of key placements.")
+    parser.add_argument('-co', '--compact',           action="store_true",        help="Write the .scad files without indentation or extra whitespace, and with each number in as few digits as it takes.")
+    parser.add_argument('-pr', '--precision',         type=int,   default=None,   help="Round the .scad files' numbers to this many decimal places.  Defaults to 10, or to exact with --compact.")
+    parser.add_argument('-dp', '--dedupe',            action="store_true",        help="Write each repeated subtree of the .scad files only once, as a module.")
+    parser.add_argument('-op', '--optimize',          action="store_true",        help="Write the .scad files with nested unions, intersections and differences flattened, each chain of transforms folded into one, and those that do nothing left out.")
+    parser.add_argument('-rc', '--render_cache',      type=str,   default=None,   help="Reuse the .scad code of anything unchanged since the last build, keeping it in this file.  Single builds only.")
+    parser.add_argument('-dxf', '--dxf',             action="store_true",        help="Also write cut-ready .dxf files, evaluated directly without OpenSCAD.")
+    parser.add_argument('-svg', '--svg',             action="store_true",        help="Also write cut-ready .svg files, evaluated directly without OpenSCAD.")
+
+    parser.add_argument('-p',  '--profile',  nargs='?', const='table', choices=['table', 'json'], default=None, help="Report time, tree nodes and bytes written per build step, as a table or JSON.")
+    parser.add_argument('-m',  '--matrix',   type=str, default=None, help="Batch mode: JSON file or inline JSON mapping parameter names (e.g. stabs, corner_radius) to lists of values.  Every combination is built for every --json file, each into its own directory.")
+    parser.add_argument('-J',  '--jobs',     type=int, default=None, help="Number of worker processes:  one per board in batch mode, defaulting to the CPU count, or one per .scad file for a single build.")
 
     args = parser.parse_args()
 
-    board = BoardBuilder(args.json,
-                         args.horizontal_pad,
-                         args.vertical_pad,
-                         args.corner_radius,
-                         args.num_holes,
-                         args.hole_diameter,
-                         args.show_points,
-                         args.stabs,
-                         args.max_wall,
-                         args.hole_side_count,
-                         args.stab_vertical_adjustment,
-                         args.stab_height_adjustment)
-
-    board.render_top_plate(args.output_dir)
-    board.render_bottom_plate(args.output_dir)
-    board.render_mid_layers(args.output_dir)
+    options = { name : getattr(args, name) for name in board_options }
+
+    if len(args.json) > 1 or args.matrix:
+
+        if args.render_cache:
+            parser.error("--render_cache only applies to single builds.")
+
+        try:
+            matrix   = load_matrix(args.matrix, parser) if args.matrix else {}
+            variants = batch_variants(args.json, args.output_dir, options, matrix)
+        except ValueError as e:
+            parser.error(str(e))
+        manifest = build_batch(variants, args.output_dir, args.jobs, args.dxf, args.svg, args.profile is not None)
+
+        failures = 0
+        for board in manifest['boards']:
+            if 'error' in board:
+                failures += 1
+                print("FAILED {0} -> {1}: {2}".format(board['json'], board['output_dir'], board['error']))
+            else:
+                print("{0} -> {1}: {2:.2f}s".format(board['json'], board['output_dir'], board['seconds']))
+
+        print("Built {0} of {1} boards in {2:.2f}s".format(len(manifest['boards']) - failures, len(manifest['boards']), manifest['seconds']))
+        sys.exit(1 if failures else 0)
+
+    profile = BuildProfile() if args.profile else None
+    cache   = RenderCache(args.render_cache) if args.render_cache else None
+    board   = BoardBuilder(args.json[0], observers=[ profile ] if profile else None, render_cache=cache, **options)
+
+    render_board(board, args.output_dir, args.dxf, args.svg, args.jobs)
+
+    if cache:
+        cache.save()
+
+    if args.profile == 'json':
+        print(profile.json())
+    elif args.profile == 'table':
+        print(profile.table())
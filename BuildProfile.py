@@ -0,0 +1,108 @@
+import functools
+import json
+import time
+
+
+class BuildObserver:
+    '''
+    Receives BoardBuilder's instrumentation.  Pass instances in BoardBuilder's `observers` list and override phase().
+
+    phase() is called after each instrumented step finishes, with the step's name, its wall time in seconds, and
+    whatever counters apply to it:  'keys' for parsing, 'nodes' for the size of the tree a step built or rendered,
+    'bytes' for files written, and 'file' for their names.  Steps can nest (switch_hole runs inside build_holes, for
+    instance), and their times are inclusive.
+    '''
+    def phase(self, name, seconds, **counters):
+        pass
+
+
+class BuildProfile(BuildObserver):
+    '''
+    Observer that totals up calls, time and counters per phase, for --profile.
+    '''
+    def __init__(self):
+        self.phases = {}
+
+    def phase(self, name, seconds, **counters):
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = { 'calls' : 0, 'seconds' : 0.0, 'nodes' : 0, 'bytes' : 0 }
+
+        totals['calls']   += 1
+        totals['seconds'] += seconds
+        totals['nodes']   += counters.get('nodes', 0)
+        totals['bytes']   += counters.get('bytes', 0)
+
+        if 'keys' in counters:
+            totals['keys'] = counters['keys']
+
+    def as_dict(self):
+        return self.phases
+
+    def json(self):
+        return json.dumps(self.phases, indent=4)
+
+    def table(self):
+        rows = [ "{0:<28} {1:>6} {2:>10} {3:>9} {4:>11}".format('phase', 'calls', 'ms', 'nodes', 'bytes') ]
+
+        for name, totals in sorted(self.phases.items(), key=lambda item: -item[1]['seconds']):
+            rows.append("{0:<28} {1:>6} {2:>10.2f} {3:>9} {4:>11}".format(
+                    name, totals['calls'], totals['seconds'] * 1000, totals['nodes'] or '', totals['bytes'] or ''))
+
+        return "\n".join(rows)
+
+
+def count_nodes(root):
+
+    # Nodes as rendered, i.e. shared subtrees count every time they appear.
+    count = 0
+    stack = [ root ]
+
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+
+    return count
+
+
+def count_unique_nodes(root):
+
+    # Distinct nodes, i.e. shared subtrees count only once.
+    unique = set()
+    stack  = [ root ]
+
+    while stack:
+        node = stack.pop()
+        if id(node) not in unique:
+            unique.add(id(node))
+            stack.extend(node.children)
+
+    return len(unique)
+
+
+def profiled(name):
+
+    # Method decorator for BoardBuilder steps.  When the builder has observers, time the step and report it along with
+    # the size of the tree it returned.  Otherwise, the only cost is checking for observers.
+    def decorator(method):
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.observers:
+                return method(self, *args, **kwargs)
+
+            start   = time.perf_counter()
+            result  = method(self, *args, **kwargs)
+            seconds = time.perf_counter() - start
+
+            if hasattr(result, 'children'):
+                self.notify(name, seconds, nodes=count_nodes(result))
+            else:
+                self.notify(name, seconds)
+
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,225 @@
+import json
+import math
+
+from array import array
+
+standard_key_spacing = 19.05    # From an older Cherry spec.
+
+
+class KeyPlacement:
+    '''
+    One key from a keyboard-layout-editor.com layout.  x and y are the center of the key space, and rx and ry the
+    rotation origin, all in millimeters in KLE's coordinate system (origin at upper-left, y pointing down).  r is the
+    rotation angle in degrees.  stab is the key's BoardBuilder-specific 'bb_stab' style, or None for the default.
+    '''
+    __slots__ = ('x', 'y', 'width_factor', 'height_factor', 'r', 'rx', 'ry', 'stab')
+
+    def __init__(self, x, y, width_factor, height_factor, r, rx, ry, stab=None):
+        self.x             = x
+        self.y             = y
+        self.width_factor  = width_factor
+        self.height_factor = height_factor
+        self.r             = r
+        self.rx            = rx
+        self.ry            = ry
+        self.stab          = stab
+
+    @property
+    def width(self):
+        return standard_key_spacing * self.width_factor
+
+    @property
+    def height(self):
+        return standard_key_spacing * self.height_factor
+
+    def __repr__(self):
+        return "KeyPlacement(x={0}, y={1}, w={2}, h={3}, r={4}, rx={5}, ry={6}, stab={7})".format(
+                self.x, self.y, self.width_factor, self.height_factor, self.r, self.rx, self.ry, self.stab)
+
+
+class KeyLayout:
+    '''
+    Compact table of key placements parsed from a keyboard-layout-editor.com JSON layout.  Each field is stored as
+    its own column in a flat array, so a parsed layout can be kept around and handed to any number of geometry
+    builders, exporters, and analyzers without walking the JSON again.  Indexing or iterating yields KeyPlacement
+    records.
+    '''
+    columns = ('x', 'y', 'width_factor', 'height_factor', 'r', 'rx', 'ry')
+
+    def __init__(self):
+        for column in self.columns:
+            setattr(self, column, array('d'))
+
+        # Stab overrides are rare, so most keys share a None here.
+        self.stabs = []
+
+    def __len__(self):
+        return len(self.stabs)
+
+    def __getitem__(self, index):
+        return KeyPlacement(self.x[index], self.y[index], self.width_factor[index], self.height_factor[index],
+                            self.r[index], self.rx[index], self.ry[index], self.stabs[index])
+
+    def __iter__(self):
+        return map(KeyPlacement, self.x, self.y, self.width_factor, self.height_factor, self.r, self.rx, self.ry,
+                   self.stabs)
+
+    def append(self, x, y, width_factor, height_factor, r, rx, ry, stab=None):
+        self.x.append(x)
+        self.y.append(y)
+        self.width_factor.append(width_factor)
+        self.height_factor.append(height_factor)
+        self.r.append(r)
+        self.rx.append(rx)
+        self.ry.append(ry)
+        self.stabs.append(stab)
+
+    def key_space_corners(self):
+
+        # Transform every key's whole key space rectangle in one pass, returning flat arrays of corner x and y
+        # coordinates, four corners per key in key order.
+        #
+        # A rotation about (rx, ry) is the affine map p' = R p + (o - R o), and keys come in clusters sharing the same
+        # (r, rx, ry), so each cluster's map is only worked out once.  Each key's corners are then its rotated center
+        # plus or minus its rotated half-width and half-height vectors.
+        corner_xs = array('d')
+        corner_ys = array('d')
+
+        rotations = {}
+
+        for x, y, width_factor, height_factor, r, rx, ry in zip(self.x, self.y, self.width_factor,
+                                                                self.height_factor, self.r, self.rx, self.ry):
+            half_width  = standard_key_spacing * width_factor  / 2
+            half_height = standard_key_spacing * height_factor / 2
+
+            if r != 0.0:
+                cluster  = (r, rx, ry)
+                rotation = rotations.get(cluster)
+
+                if rotation is None:
+                    rads = math.radians(r)
+                    cos  = math.cos(rads)
+                    sin  = math.sin(rads)
+                    rotation = rotations[cluster] = (cos, sin, rx - (rx * cos - ry * sin), ry - (rx * sin + ry * cos))
+
+                cos, sin, offset_x, offset_y = rotation
+
+                center_x = x * cos - y * sin + offset_x
+                center_y = x * sin + y * cos + offset_y
+
+                width_x  =  half_width  * cos
+                width_y  =  half_width  * sin
+                height_x = -half_height * sin
+                height_y =  half_height * cos
+
+            else:
+                center_x = x
+                center_y = y
+
+                width_x  = half_width
+                width_y  = 0.0
+                height_x = 0.0
+                height_y = half_height
+
+            corner_xs.extend( ( center_x - width_x - height_x,
+                                center_x + width_x - height_x,
+                                center_x + width_x + height_x,
+                                center_x - width_x + height_x ) )
+            corner_ys.extend( ( center_y - width_y - height_y,
+                                center_y + width_y - height_y,
+                                center_y + width_y + height_y,
+                                center_y - width_y + height_y ) )
+
+        return corner_xs, corner_ys
+
+    def bounds(self, corners=None):
+
+        # (min_x, min_y, max_x, max_y) over all key spaces, or None for a layout without any keys.  Pass in the result
+        # of key_space_corners() to avoid transforming everything again.
+        corner_xs, corner_ys = corners if corners is not None else self.key_space_corners()
+
+        if not corner_xs:
+            return None
+
+        return min(corner_xs), min(corner_ys), max(corner_xs), max(corner_ys)
+
+    @classmethod
+    def load(cls, kle_json):
+        with open(kle_json, encoding='utf-8') as f:
+            return cls.parse(json.loads(f.read()))
+
+    @classmethod
+    def parse(cls, kle_layout):
+        layout = cls()
+
+        rx = 0
+        ry = 0
+        r = 0
+
+        cursor_x = 0
+        cursor_y = 0
+
+        for row in kle_layout:
+
+            cursor_x = rx
+
+            height_increment = standard_key_spacing
+            next_key_width_factor  = 1.0
+            next_key_height_factor = 1.0
+            skip_next = False
+            next_stab = None
+
+            if type(row) == list:
+                for e in row:
+
+                    # All this handling is from keyboard-layout-editor.com's generated JSON.
+                    #
+                    if type(e) == dict:
+                        if 'r' in e:    # Rotation angle
+                            r = e['r']
+                        if 'w' in e:                        # Forcing next key's unit width
+                            next_key_width_factor = e['w']
+                        if 'h' in e:                        # Forcing next key's unit height
+                            next_key_height_factor = e['h']
+                        if 'rx' in e:                               # Redefining the cursor's "reset" x coordinate.
+                            rx = e['rx'] * standard_key_spacing
+                            cursor_x = rx
+                            cursor_y = ry
+                        if 'ry' in e:                               # Redefining the cursor's "reset" y coordinate.
+                            ry = e['ry'] * standard_key_spacing
+                            cursor_x = rx
+                            cursor_y = ry
+                        if 'x' in e:                                            # Forcing the cursor's x positioning relative to "here."
+                            cursor_x = cursor_x + (standard_key_spacing * e['x' ] )
+                        if 'y' in e:                                            # Forcing the cursor's y positioning relative to "here."
+                            cursor_y = cursor_y + (standard_key_spacing * e['y' ] )
+                        if 'd' in e:                # Next "key" is really a decal.  Skip it.
+                            skip_next = True
+                        if 'bb_stab' in e:                                        # BoardBuilder-specific wrinkle: force stabilizer style.
+                            next_stab = e['bb_stab']
+
+                    elif skip_next:
+                        skip_next = False
+
+                    else:
+
+                        space_width =  standard_key_spacing * next_key_width_factor
+                        space_height = standard_key_spacing * next_key_height_factor
+
+                        layout.append(cursor_x + space_width  / 2,
+                                      cursor_y + space_height / 2,
+                                      next_key_width_factor,
+                                      next_key_height_factor,
+                                      r, rx, ry,
+                                      next_stab)
+
+                        cursor_x = cursor_x + space_width
+
+                        next_key_width_factor  = 1.0
+                        next_key_height_factor = 1.0
+                        next_stab              = None
+
+                # In KLE, the per-row Y increment seems to be a constant 1u, unlike the X increment, which is the key's entire width
+                cursor_y = cursor_y + height_increment
+
+        return layout
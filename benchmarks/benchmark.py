@@ -0,0 +1,263 @@
+#! /usr/bin/python
+
+# Benchmarks the whole BoardBuilder pipeline, phase by phase, over the bundled layouts and over generated layouts of
+# 1k, 10k and 100k keys.
+#
+#   python benchmarks/benchmark.py -o results.json
+#   python benchmarks/benchmark.py -o new.json -b results.json     # Fails on regressions against an earlier run.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from solid import scad_render
+
+from BoardBuilder import BoardBuilder, switch_holes
+from BuildProfile import count_nodes, count_unique_nodes
+from KeyLayout import KeyLayout
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+bundled_layouts = [ 'keyboard-layout-104.json',
+                    'keyboard-layout-ergodox.json',
+                    'keyboard-layout-atreus.json',
+                    'keyboard-layout-prog.json',
+                    'keyboard-layout-symbolics.json',
+                    'keyboard-layout.json' ]
+
+# A typical set of build options:  padded, rounded, with screw holes, so that every layer has work to do.
+board_options = { 'horizontal_pad' : '5,6',
+                  'vertical_pad'   : '7,8',
+                  'corner_radius'  : 3.0,
+                  'num_holes'      : 6,
+                  'hole_diameter'  : 3.0 }
+
+phases = ( 'parse', 'holes', 'plates', 'render', 'write' )
+
+
+def synthetic_layout(key_count):
+
+    # Rows of a conventional board repeated down the page until there are key_count keys.  Mostly 1u keys, but with
+    # stabilized 2u+ keys, a spacebar, a stab override, and a rotated row every few rows, so that every geometry path
+    # gets exercised.
+    row_templates = [
+        [ {} ] * 15,
+        [ { 'w' : 1.5 } ] + [ {} ] * 12 + [ { 'w' : 1.5 } ],
+        [ { 'w' : 1.75 } ] + [ {} ] * 11 + [ { 'w' : 2.25 } ],
+        [ { 'w' : 2.25, 'bb_stab' : { 'type' : 'costar' } } ] + [ {} ] * 10 + [ { 'w' : 2.75 } ],
+        [ {} ] * 6,
+        [ { 'w' : 1.25 } ] * 3 + [ { 'w' : 6.25 } ] + [ { 'w' : 1.25 } ] * 3,
+    ]
+
+    rows = []
+    keys = 0
+    row_index = 0
+
+    while keys < key_count:
+        template = row_templates[row_index % len(row_templates)]
+        rotated  = template is row_templates[4]
+
+        # Position every row absolutely, so that rotated rows don't disturb the ones after them.
+        row = [ { 'r' : 10 if rotated else 0, 'rx' : 1 if rotated else 0, 'ry' : row_index } ]
+
+        for properties in template[:key_count - keys]:
+            if properties:
+                row.append(dict(properties))
+            row.append("")
+            keys += 1
+
+        rows.append(row)
+        row_index += 1
+
+    return rows
+
+
+def run_pipeline(kle_json, output_dir):
+
+    # One pass through the pipeline, writing the files just as BoardBuilder.py does.  Returns ({ phase : seconds },
+    # { file name : (visited, unique) nodes }, output bytes).
+    #
+    # The real render methods stream the code straight into the files, so rendering and writing can't be timed
+    # apart there.  Instead, each file's code is first rendered to a string on its own, for the render phase, and
+    # the write phase is whatever more the real render methods take.
+    timings = {}
+    lap     = time.perf_counter()
+
+    def end_phase(phase):
+        nonlocal lap
+        now = time.perf_counter()
+        timings[phase] = now - lap
+        lap = now
+
+    layout = KeyLayout.load(kle_json)
+    end_phase('parse')
+
+    board = BoardBuilder(layout, **board_options)
+    holes = board.holes
+    end_phase('holes')
+
+    # holes.scad's tree is the holes themselves, rendered into its header.
+    layers = { 'holes.scad'                : holes,
+               'top.scad'                  : board.base_top_plate,
+               'bottom.scad'               : board.base_bottom_plate,
+               'mid_closed.scad'           : board.mid_layer_closed,
+               'mid_closed_sectioned.scad' : board.mid_layer_closed_sectioned }
+    end_phase('plates')
+
+    for name, layer in layers.items():
+        if name == 'holes.scad':
+            scad_render(switch_holes(holes_file=None), board.holes_library(), **board.scad_options)
+        else:
+            scad_render(layer, **board.scad_options)
+    end_phase('render')
+
+    board.render_top_plate(output_dir)
+    board.render_bottom_plate(output_dir)
+    board.render_mid_layers(output_dir)
+    end_phase('write')
+    timings['write'] = max(timings['write'] - timings['render'], 0.0)
+
+    output_bytes = sum(os.path.getsize(os.path.join(output_dir, name)) for name in layers)
+    nodes        = { name : (count_nodes(layer), count_unique_nodes(layer)) for name, layer in layers.items() }
+
+    return timings, nodes, output_bytes
+
+
+def run_case(kle_json, repeat):
+
+    # Best-of-repeat timing for each phase, plus a separate traced run for peak memory, since tracing skews timing.
+    with tempfile.TemporaryDirectory() as output_dir:
+        best = None
+
+        for _ in range(repeat):
+            timings, nodes, output_bytes = run_pipeline(kle_json, output_dir)
+            best = timings if best is None else { phase : min(best[phase], timings[phase]) for phase in phases }
+
+        tracemalloc.start()
+        run_pipeline(kle_json, output_dir)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'keys'              : len(KeyLayout.load(kle_json)),
+        'phases'            : best,
+        'total'             : sum(best.values()),
+        'nodes'             : { name : { 'visited' : visited, 'unique' : unique }
+                                for name, (visited, unique) in nodes.items() },
+        'output_bytes'      : output_bytes,
+        'peak_memory_bytes' : peak_memory,
+    }
+
+
+def run_benchmarks(layouts, sizes, repeat, log=print):
+    results = {
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat'    : repeat,
+        'options'   : board_options,
+        'cases'     : {},
+    }
+
+    cases = [ (os.path.splitext(os.path.basename(path))[0], path) for path in layouts ]
+
+    with tempfile.TemporaryDirectory() as layout_dir:
+        for size in sizes:
+            path = os.path.join(layout_dir, 'synthetic-{0}.json'.format(size))
+            with open(path, 'w') as f:
+                json.dump(synthetic_layout(size), f)
+            cases.append(('synthetic-{0}'.format(size), path))
+
+        for name, path in cases:
+            result = results['cases'][name] = run_case(path, repeat)
+            log("{0:<28} {1:>7} keys  {2:>9.3f}s  {3}".format(
+                    name, result['keys'], result['total'],
+                    "  ".join("{0} {1:.3f}".format(phase, result['phases'][phase]) for phase in phases)))
+
+    return results
+
+
+def compare(results, baseline, threshold, noise_floor, log=print):
+
+    # Report every case's change against the baseline, returning the list of timing regressions:  phases that got
+    # more than threshold (a fraction) slower, ignoring anything under noise_floor seconds in both runs.
+    regressions = []
+
+    for name, result in results['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            log("{0:<28} (not in baseline)".format(name))
+            continue
+
+        changes = []
+        for phase in phases + ('total',):
+            if phase != 'total' and phase not in old['phases']:
+                continue
+
+            new_time = result['total']  if phase == 'total' else result['phases'][phase]
+            old_time = old['total']     if phase == 'total' else old['phases'][phase]
+
+            if max(new_time, old_time) < noise_floor:
+                continue
+
+            change = (new_time - old_time) / old_time if old_time else float('inf')
+            changes.append("{0} {1:+.0%}".format(phase, change))
+
+            if phase != 'total' and change > threshold:
+                regressions.append((name, phase, old_time, new_time))
+
+        # Output size is deterministic, so any change is worth a mention.  Traced memory jitters a little.
+        if old['output_bytes'] and result['output_bytes'] != old['output_bytes']:
+            changes.append("output_bytes {0:+.1%}".format((result['output_bytes'] - old['output_bytes']) / old['output_bytes']))
+
+        memory_change = (result['peak_memory_bytes'] - old['peak_memory_bytes']) / max(old['peak_memory_bytes'], 1)
+        if abs(memory_change) > threshold:
+            changes.append("peak_memory_bytes {0:+.0%}".format(memory_change))
+
+        log("{0:<28} {1}".format(name, "  ".join(changes) or "no significant change"))
+
+    for name, phase, old_time, new_time in regressions:
+        log("REGRESSION {0} {1}: {2:.3f}s -> {3:.3f}s".format(name, phase, old_time, new_time))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description     = 'Benchmark the BoardBuilder pipeline over the bundled and synthetic layouts.',
+            formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument('-o', '--output',      type=str,   default=None,                 help="Write the results to this JSON file.")
+    parser.add_argument('-b', '--baseline',    type=str,   default=None,                 help="Compare against the results JSON of an earlier run, and exit non-zero on regressions.")
+    parser.add_argument('-t', '--threshold',   type=float, default=0.10,                 help="Fractional slowdown of any phase that counts as a regression.")
+    parser.add_argument('-f', '--noise_floor', type=float, default=0.005,                help="Ignore phases faster than this many seconds in both runs.")
+    parser.add_argument('-s', '--sizes',       type=str,   default='1000,10000,100000', help="Comma-separated key counts of the synthetic layouts.  Empty for none.")
+    parser.add_argument('-r', '--repeat',      type=int,   default=3,                    help="Timed runs per case.  The fastest of each phase is reported.")
+    parser.add_argument('-l', '--layouts',     type=str,   nargs='*', default=None,      help="Layout JSON files.  Defaults to the bundled layouts.")
+
+    args = parser.parse_args()
+
+    layouts = args.layouts if args.layouts is not None else [ os.path.join(repo_dir, name) for name in bundled_layouts ]
+    sizes   = [ int(size) for size in args.sizes.split(',') if size.strip() ]
+
+    results = run_benchmarks(layouts, sizes, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if compare(results, baseline, args.threshold, args.noise_floor):
+            sys.exit(1)
@@ -0,0 +1,119 @@
+#! /usr/bin/python
+
+# Stress test for SolidPython's tree traversals:  builds trees nested 100k levels deep and renders, copies and scans
+# them, all of which must get through without hitting Python's recursion limit.
+#
+#   python benchmarks/deep_trees.py
+#   python benchmarks/deep_trees.py -d 10000 -o deep.json
+#
+# Each level of nesting indents the OpenSCAD code below it by another tab, so rendered output grows with the square of
+# the depth (some 15GB for 100k levels).  It's counted as it streams by rather than kept.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from solid import cube, cylinder, hole, part, scad_render_to_stream, sphere, translate
+from solid.utils import obj_tree_str
+
+
+def operator_chain(depth):
+
+    # a + b - c + ... nests one union or difference per operation.
+    tree = cube(1)
+    for level in range(depth):
+        tree = tree + sphere(1) if level % 2 else tree - cylinder(r=1, h=2)
+    return tree
+
+
+def nested_hole(depth):
+
+    # A hole at the bottom of a long chain of transforms, so the hole section repeats every one of them.
+    tree = hole()(cube(1))
+    for level in range(depth):
+        tree = translate([1, 0, 0])(tree, sphere(1))
+    return tree
+
+
+def nested_parts(depth):
+
+    # Parts within parts, each with a hole of its own.
+    tree = cube(1)
+    for level in range(depth):
+        tree = part()(translate([1, 0, 0])(tree, hole()(cylinder(r=1, h=2))))
+    return tree
+
+
+shapes = { 'operator_chain' : operator_chain,
+           'nested_hole'    : nested_hole,
+           'nested_parts'   : nested_parts }
+
+
+class CountingStream:
+
+    # Stands in for a file, counting what's written to it.
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, s):
+        self.bytes += len(s)
+
+
+def timed(function, *args):
+    start  = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_shape(shape, depth, tree_str_depth):
+    tree, build_seconds = timed(shapes[shape], depth)
+
+    stream = CountingStream()
+    _, render_seconds = timed(scad_render_to_stream, tree, stream)
+
+    copied, copy_seconds = timed(tree.copy)
+    copied_stream = CountingStream()
+    scad_render_to_stream(copied, copied_stream)
+    if copied_stream.bytes != stream.bytes:
+        raise AssertionError("{0}: copy renders {1} bytes, original {2}".format(shape, copied_stream.bytes, stream.bytes))
+
+    # obj_tree_str builds its whole (quadratically indented) string in memory, so use a shallower tree.
+    _, tree_str_seconds = timed(obj_tree_str, shapes[shape](tree_str_depth))
+
+    return { 'depth'                : depth,
+             'build_seconds'        : build_seconds,
+             'render_seconds'       : render_seconds,
+             'output_bytes'         : stream.bytes,
+             'copy_seconds'         : copy_seconds,
+             'obj_tree_str_depth'   : tree_str_depth,
+             'obj_tree_str_seconds' : tree_str_seconds }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description     = 'Render, copy and scan very deeply nested SolidPython trees.',
+            formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument('-d', '--depth',          type=int, default=100000, help="Levels of nesting.")
+    parser.add_argument('-t', '--tree_str_depth', type=int, default=10000,  help="Levels of nesting for obj_tree_str.")
+    parser.add_argument('-s', '--shapes',         type=str, nargs='*', default=sorted(shapes), choices=sorted(shapes), help="Trees to test.")
+    parser.add_argument('-o', '--output',         type=str, default=None,   help="Write the results to this JSON file.")
+
+    args = parser.parse_args()
+
+    results = {}
+    for shape in args.shapes:
+        result = results[shape] = run_shape(shape, args.depth, args.tree_str_depth)
+        print("{0:<16} depth {1}  build {2:.2f}s  render {3:.2f}s ({4} bytes)  copy {5:.2f}s  obj_tree_str {6:.2f}s".format(
+                shape, result['depth'], result['build_seconds'], result['render_seconds'], result['output_bytes'],
+                result['copy_seconds'], result['obj_tree_str_seconds']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -1,6 +1,6 @@
 # Some __init__ magic so we can include all solidpython code with:
 #   from solid import *
 #   from solid.utils import *
-from .solidpython import scad_render, scad_render_to_file
+from .solidpython import scad_render, scad_render_to_file, scad_render_to_stream, scad_render_to_files, RenderCache
 from .solidpython import scad_render_animated, scad_render_animated_file
 from .objects import *
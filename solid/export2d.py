@@ -0,0 +1,162 @@
+"""
+DXF and SVG writers for Regions from solid.geometry2d.
+
+Runs of outline edges cut from the same circle are written as true arcs
+(or whole circles) instead of the polygon OpenSCAD would have made of them.
+Circles made of fewer than min_arc_segments sides, like hexagonal screw
+holes, are taken to be deliberate polygons and written as lines.
+"""
+import math
+
+MIN_ARC_SEGMENTS = 12
+
+
+def outline_segments(outline, min_arc_segments=MIN_ARC_SEGMENTS):
+    '''
+    Break an Outline into drawing primitives, in order:
+        ('line', (x0, y0), (x1, y1))
+        ('arc', (cx, cy), r, (x0, y0), (x1, y1), sweep_degrees)
+        ('circle', (cx, cy), r)
+    sweep_degrees is positive for counter-clockwise arcs.
+    '''
+    points, arcs = outline.points, outline.arcs
+    n = len(points)
+
+    # Start at the beginning of a run so that no run wraps past the end
+    start = 0
+    for i in range(n):
+        if arcs[i - 1] != arcs[i]:
+            start = i
+            break
+
+    i = 0
+    while i < n:
+        first = (start + i) % n
+        arc = arcs[first]
+        run = 1
+        while run < n - i and arcs[(first + run) % n] == arc:
+            run += 1
+
+        indices = [(first + k) % n for k in range(run + 1)]
+        sweeps = _sweeps(arc, [points[k] for k in indices]) if arc is not None else None
+
+        if sweeps is None or max(abs(s) for s in sweeps) > 360.0 / min_arc_segments + 1e-6:
+            for k in range(run):
+                yield ('line', points[indices[k]], points[indices[k + 1]])
+        elif run == n and abs(abs(sum(sweeps)) - 360) < 1e-6:
+            yield ('circle', (arc[0], arc[1]), arc[2])
+        else:
+            yield ('arc', (arc[0], arc[1]), arc[2], points[indices[0]], points[indices[-1]], sum(sweeps))
+        i += run
+
+
+def _sweeps(arc, points):
+    # Signed angle, in degrees, that each edge subtends at the arc's center
+    cx, cy = arc[0], arc[1]
+    sweeps = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        ax, ay = x0 - cx, y0 - cy
+        bx, by = x1 - cx, y1 - cy
+        sweeps.append(math.degrees(math.atan2(ax * by - ay * bx, ax * bx + ay * by)))
+    return sweeps
+
+
+def _angle(center, point):
+    return math.degrees(math.atan2(point[1] - center[1], point[0] - center[0])) % 360
+
+
+def _number(value):
+    return repr(round(value, 6) + 0.0)     # + 0.0 folds -0.0 into 0.0
+
+
+# =======
+# = DXF =
+# =======
+def dxf_string(region, min_arc_segments=MIN_ARC_SEGMENTS, layer='0'):
+    # AutoCAD R12 ASCII DXF: LINE, ARC and CIRCLE entities only, which every
+    # laser and CAM package reads
+    codes = [(0, 'SECTION'), (2, 'HEADER'), (9, '$ACADVER'), (1, 'AC1009'), (0, 'ENDSEC'),
+             (0, 'SECTION'), (2, 'ENTITIES')]
+
+    for outline in region.outlines:
+        for segment in outline_segments(outline, min_arc_segments):
+            kind = segment[0]
+            codes.append((0, kind.upper()))
+            codes.append((8, layer))
+            if kind == 'line':
+                _, (x0, y0), (x1, y1) = segment
+                codes.extend([(10, _number(x0)), (20, _number(y0)), (11, _number(x1)), (21, _number(y1))])
+            elif kind == 'circle':
+                _, (cx, cy), r = segment
+                codes.extend([(10, _number(cx)), (20, _number(cy)), (40, _number(r))])
+            else:
+                _, center, r, p0, p1, sweep = segment
+                # DXF arcs always run counter-clockwise
+                if sweep < 0:
+                    p0, p1 = p1, p0
+                codes.extend([(10, _number(center[0])), (20, _number(center[1])), (40, _number(r)),
+                              (50, _number(_angle(center, p0))), (51, _number(_angle(center, p1)))])
+
+    codes.extend([(0, 'ENDSEC'), (0, 'EOF')])
+    return ''.join('%3d\n%s\n' % (code, value) for code, value in codes)
+
+
+def write_dxf(region, filepath, min_arc_segments=MIN_ARC_SEGMENTS, layer='0'):
+    with open(filepath, 'w') as f:
+        f.write(dxf_string(region, min_arc_segments, layer))
+    return True
+
+
+# =======
+# = SVG =
+# =======
+def svg_string(region, min_arc_segments=MIN_ARC_SEGMENTS, stroke_width=0.1):
+    # One path for the whole region, in millimeters.  SVG's y axis points
+    # down, so everything is flipped about the region's bounding box.
+    bounds = region.bounds() or (0.0, 0.0, 0.0, 0.0)
+    min_x, min_y, max_x, max_y = bounds
+
+    def point(p):
+        return '%s %s' % (_number(p[0] - min_x), _number(max_y - p[1]))
+
+    commands = []
+    for outline in region.outlines:
+        started = False
+        for segment in outline_segments(outline, min_arc_segments):
+            kind = segment[0]
+            if kind == 'circle':
+                _, (cx, cy), r = segment
+                radius = _number(r)
+                # A single SVG arc can't close on itself; draw two halves
+                commands.append('M %s A %s %s 0 1 0 %s A %s %s 0 1 0 %s Z' % (
+                        point((cx + r, cy)), radius, radius, point((cx - r, cy)),
+                        radius, radius, point((cx + r, cy))))
+                continue
+
+            if not started:
+                commands.append('M ' + point(segment[-2] if kind == 'line' else segment[3]))
+                started = True
+
+            if kind == 'line':
+                commands.append('L ' + point(segment[2]))
+            else:
+                _, center, r, p0, p1, sweep = segment
+                radius = _number(r)
+                # Counter-clockwise in drawing coordinates is clockwise once
+                # y is flipped, which is SVG's positive sweep direction
+                commands.append('A %s %s 0 %d %d %s' % (radius, radius, abs(sweep) > 180, sweep > 0, point(p1)))
+        if started:
+            commands.append('Z')
+
+    width = _number(max_x - min_x)
+    height = _number(max_y - min_y)
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{0}mm" height="{1}mm" viewBox="0 0 {0} {1}">\n'
+            '<path fill="none" stroke="black" stroke-width="{2}" d="{3}"/>\n'
+            '</svg>\n').format(width, height, _number(stroke_width), ' '.join(commands))
+
+
+def write_svg(region, filepath, min_arc_segments=MIN_ARC_SEGMENTS, stroke_width=0.1):
+    with open(filepath, 'w') as f:
+        f.write(svg_string(region, min_arc_segments, stroke_width))
+    return True
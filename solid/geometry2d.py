@@ -0,0 +1,874 @@
+"""
+In-process evaluation of the 2D subset of SolidPython trees.
+
+evaluate_2d() walks a tree of square/circle/polygon primitives, affine
+transforms, booleans and offsets and returns a Region of flattened outline
+polygons, without a round trip through OpenSCAD and CGAL.  Outer outlines
+run counter-clockwise and holes clockwise.
+
+Every outline edge remembers the circle it was cut from, if any, so that
+exporters can write true arcs instead of polylines.
+"""
+import math
+
+from .solidpython import _scan_tree, hole_union_classes, non_rendered_classes
+
+# OpenSCAD's defaults for $fa and $fs, used when a circle has no $fn
+DEFAULT_FA = 12.0
+DEFAULT_FS = 2.0
+GRID_FINE = 0.00000095367431640625
+
+# Vertices closer together than SNAP are merged.  Boolean results are
+# classified by sampling SAMPLE_DISTANCE to either side of each edge, so
+# features smaller than that are lost.
+SNAP = 1e-7
+SAMPLE_DISTANCE = 1e-5
+
+# Fill rules: how a winding number maps to inside/outside
+NONZERO = 'nonzero'
+EVENODD = 'evenodd'
+POSITIVE = 'positive'
+
+
+class Outline(object):
+    '''
+    A closed polygon.  points is a list of (x, y) tuples; arcs[i] is the
+    (center_x, center_y, radius) of the circle that the edge from points[i]
+    to points[i + 1] was cut from, or None for straight edges.
+    '''
+    __slots__ = ('points', 'arcs')
+
+    def __init__(self, points, arcs=None):
+        self.points = points
+        self.arcs = arcs if arcs is not None else [None] * len(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def area(self):
+        # Signed: positive for counter-clockwise outlines, negative for holes
+        s = 0.0
+        x0, y0 = self.points[-1]
+        for x1, y1 in self.points:
+            s += x0 * y1 - x1 * y0
+            x0, y0 = x1, y1
+        return s / 2
+
+    def is_hole(self):
+        return self.area() < 0
+
+    def bounds(self):
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def reversed(self):
+        n = len(self.points)
+        arcs = [self.arcs[(n - 2 - i) % n] for i in range(n)]
+        return Outline(self.points[::-1], arcs)
+
+
+class Region(object):
+    '''
+    A set of outlines and the fill rule that decides which points they
+    enclose.  Regions returned by evaluate_2d() are always clean: outlines
+    don't cross each other, outer outlines run counter-clockwise and holes
+    clockwise.
+    '''
+
+    def __init__(self, outlines=None, fill_rule=NONZERO, clean=True):
+        self.outlines = outlines if outlines is not None else []
+        self.fill_rule = fill_rule
+        self.clean = clean
+
+    def __iter__(self):
+        return iter(self.outlines)
+
+    def __len__(self):
+        return len(self.outlines)
+
+    def is_empty(self):
+        return not self.outlines
+
+    def bounds(self):
+        if not self.outlines:
+            return None
+        all_bounds = [o.bounds() for o in self.outlines]
+        return (min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+                max(b[2] for b in all_bounds), max(b[3] for b in all_bounds))
+
+    def area(self):
+        return sum(o.area() for o in self.outlines)
+
+    def polygons(self):
+        # Plain point lists, one per outline
+        return [list(o.points) for o in self.outlines]
+
+    def transformed(self, matrix):
+        a, b, c, d, e, f = matrix
+        det = a * d - b * c
+
+        # Circles stay circles under rotations, reflections and uniform
+        # scaling; anything else turns them into ellipses, so forget them
+        similar = (abs(a - d) < 1e-12 and abs(b + c) < 1e-12) or \
+                  (abs(a + d) < 1e-12 and abs(b - c) < 1e-12)
+        radius_scale = math.sqrt(abs(det))
+
+        outlines = []
+        for outline in self.outlines:
+            points = [(a * x + b * y + e, c * x + d * y + f) for x, y in outline.points]
+            if similar:
+                arcs = [None if arc is None else
+                        (a * arc[0] + b * arc[1] + e, c * arc[0] + d * arc[1] + f, arc[2] * radius_scale)
+                        for arc in outline.arcs]
+            else:
+                arcs = None
+            transformed = Outline(points, arcs)
+            # Reflections flip orientation; flip it back
+            if det < 0:
+                transformed = transformed.reversed()
+            outlines.append(transformed)
+        return Region(outlines, self.fill_rule, self.clean)
+
+
+# =================
+# = Tree Walking  =
+# =================
+def evaluate_2d(scad_object):
+    '''
+    Evaluate a SolidPython tree of 2D geometry and return a Region.
+
+    Supported: square, circle, polygon, translate, rotate, mirror, scale,
+    multmatrix, union, difference, intersection, offset, plus color and
+    render, which don't change geometry.  Anything else raises ValueError.
+    Holes and parts are resolved the same way scad_render() writes them.
+    '''
+    return _evaluate(scad_object)
+
+
+# What a node is evaluated as, following scad_render():  the root, positive
+# geometry with its holes left for the root or part above, the inside of a
+# hole, where holes are in place, or the node's share of a hole section
+_ROOT, _POSITIVE, _IN_HOLE, _HOLE_PATH = range(4)
+
+
+def _evaluate(scad_object):
+    # Post-order, keeping its own stack, so that no depth of nesting runs
+    # into Python's recursion limit.  Each node is evaluated once per way
+    # it's evaluated, however many places it's used in.  Evaluating a node
+    # gives the regions it renders as, one after another:  one for most,
+    # but any number for a part or hole, which are rendered as their
+    # children.
+    hole_counts = _scan_tree(scad_object)[0]
+    done = {}
+    root = (scad_object, _ROOT)
+    stack = [(root, _operands(root, hole_counts), 0)]
+    while stack:
+        task, operands, i = stack.pop()
+        while i < len(operands) and (id(operands[i][0]), operands[i][1]) in done:
+            i += 1
+        if i < len(operands):
+            stack.append((task, operands, i + 1))
+            stack.append((operands[i], _operands(operands[i], hole_counts), 0))
+        else:
+            node, how = task
+            done[(id(node), how)] = _evaluate_node(node, how, [done[(id(n), h)] for n, h in operands], hole_counts)
+    return _boolean('union', done[(id(scad_object), _ROOT)])
+
+
+def _operands(task, hole_counts):
+    # The (node, how) evaluations that task's is made from
+    obj, how = task
+    rendered = obj.name not in non_rendered_classes
+
+    if how == _HOLE_PATH:
+        if rendered and obj.modifier in ('*', '%'):
+            return []
+        return [(child, _IN_HOLE if child.is_hole else _HOLE_PATH) for child in obj.children
+                if child.is_hole or (hole_counts[id(child)] and not child.is_part_root)]
+
+    if rendered and obj.modifier in ('*', '%') or obj.name in _primitives:
+        operands = []
+    elif getattr(obj, 'body', None) is not None:
+        # Nodes that stand in for a call to generated OpenSCAD code can
+        # carry the equivalent tree as 'body', which the code renders
+        hole_counts.update(_scan_tree(obj.body)[0])
+        operands = [(obj.body, _ROOT)]
+    elif how == _IN_HOLE:
+        operands = [(child, _IN_HOLE) for child in obj.children]
+    else:
+        operands = [(child, _POSITIVE) for child in obj.children if not child.is_hole]
+
+    # The root and parts subtract their holes from everything else in them
+    if (how == _ROOT or obj.is_part_root) and hole_counts[id(obj)]:
+        operands.append((obj, _HOLE_PATH))
+    return operands
+
+
+def _evaluate_node(obj, how, evaluated, hole_counts):
+    # The regions obj renders as, from those of its operands
+    name = obj.name
+    if how == _HOLE_PATH:
+        regions = [region for regions in evaluated for region in regions]
+        if name in non_rendered_classes:
+            return regions
+        # As in scad_render(), booleans above more than one hole are unions
+        if name in hole_union_classes and hole_counts[id(obj)] > 1:
+            name = 'union'
+        return [_region(obj, name, regions)]
+
+    holes = evaluated.pop() if (how == _ROOT or obj.is_part_root) and hole_counts[id(obj)] else None
+    regions = [region for regions in evaluated for region in regions]
+    if name not in non_rendered_classes:
+        regions = [_region(obj, name, regions)]
+    if holes is not None:
+        regions = [_boolean('difference', regions + holes)]
+    return regions
+
+
+def _region(obj, name, regions):
+    # obj's region, rendered as name, from its operands' regions
+    modifier = obj.modifier
+    # Disabled and background geometry isn't part of the result
+    if modifier in ('*', '%'):
+        return Region()
+
+    params = dict(obj._param_items())
+
+    if name in _primitives:
+        return _primitives[name](params)
+
+    if name in ('union', 'color', 'render'):
+        return _boolean('union', regions)
+
+    if name in ('difference', 'intersection'):
+        return _boolean(name, regions)
+
+    matrix = _affine_matrix(name, params)
+    if matrix is not None:
+        return _boolean('union', regions).transformed(matrix)
+
+    if name == 'offset':
+        region = _boolean('union', regions)
+        segments = params.get('segments', params.get('$fn'))
+        if params.get('r') is not None:
+            return _offset(region, params['r'], 'round', segments)
+        return _offset(region, params['delta'], 'chamfer' if params.get('chamfer') else 'miter', segments)
+
+    if getattr(obj, 'body', None) is not None:
+        return _boolean('union', regions)
+
+    raise ValueError("evaluate_2d() can't evaluate '%s' nodes" % name)
+
+
+# ==============
+# = Primitives =
+# ==============
+def _fragments(r, fn=None):
+    # Same as OpenSCAD's get_fragments_from_r()
+    if r < GRID_FINE:
+        return 3
+    if fn:
+        return max(int(fn), 3)
+    return int(math.ceil(max(min(360.0 / DEFAULT_FA, r * 2 * math.pi / DEFAULT_FS), 5)))
+
+
+def _sin_degrees(degrees):
+    # Exact at multiples of 90 degrees, like OpenSCAD's sin_degrees()
+    degrees = degrees % 360
+    if degrees % 90 == 0:
+        return (0.0, 1.0, 0.0, -1.0)[int(degrees // 90)]
+    return math.sin(math.radians(degrees))
+
+
+def _cos_degrees(degrees):
+    return _sin_degrees(degrees + 90)
+
+
+def _square(params):
+    size = params.get('size')
+    if size is None:
+        size = 1
+    if isinstance(size, (int, float)):
+        width = height = size
+    else:
+        width, height = size[0], size[1]
+
+    x0, y0 = (-width / 2.0, -height / 2.0) if params.get('center') else (0.0, 0.0)
+    x1, y1 = x0 + width, y0 + height
+    if width <= 0 or height <= 0:
+        return Region()
+    return Region([Outline([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])])
+
+
+def _circle(params):
+    # As in OpenSCAD, d wins over r
+    r = params['d'] / 2.0 if params.get('d') is not None else params.get('r')
+    if r is None:
+        r = 1
+    if r <= 0:
+        return Region()
+
+    n = _fragments(r, params.get('segments', params.get('$fn')))
+    points = []
+    for i in range(n):
+        phi = 360.0 * i / n
+        points.append((r * _cos_degrees(phi), r * _sin_degrees(phi)))
+    return Region([Outline(points, [(0.0, 0.0, float(r))] * n)])
+
+
+def _polygon(params):
+    points = params['points']
+    paths = params.get('paths')
+    if paths is None or len(paths) == 0:
+        paths = [list(range(len(points)))]
+    outlines = [Outline([(points[i][0], points[i][1]) for i in path]) for path in paths if len(path) >= 3]
+    # Clean up self-intersections and nested paths
+    return _boolean('union', [Region(outlines, EVENODD, clean=False)])
+
+
+_primitives = {
+    'square': _square,
+    'circle': _circle,
+    'polygon': _polygon,
+}
+
+
+# ==============
+# = Transforms =
+# ==============
+def _rotation_3d(a):
+    # OpenSCAD's rotate([x, y, z]): about x, then y, then z
+    ax, ay, az = (list(a) + [0, 0, 0])[:3]
+    cx, sx = _cos_degrees(ax), _sin_degrees(ax)
+    cy, sy = _cos_degrees(ay), _sin_degrees(ay)
+    cz, sz = _cos_degrees(az), _sin_degrees(az)
+    return [[cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz],
+            [cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz],
+            [-sy, sx * cy, cx * cy]]
+
+
+def _axis_rotation_3d(angle, v):
+    length = math.sqrt(sum(c * c for c in v))
+    x, y, z = [c / length for c in v]
+    c, s = _cos_degrees(angle), _sin_degrees(angle)
+    t = 1 - c
+    return [[t * x * x + c, t * x * y - s * z, t * x * z + s * y],
+            [t * x * y + s * z, t * y * y + c, t * y * z - s * x],
+            [t * x * z - s * y, t * y * z + s * x, t * z * z + c]]
+
+
+def _affine_matrix(name, params):
+    # 2D affine matrix (a, b, c, d, e, f), mapping (x, y) to
+    # (a*x + b*y + e, c*x + d*y + f), or None if name isn't a transform
+    if name == 'translate':
+        v = params.get('v')
+        if v is None:
+            v = [0, 0]
+        return (1.0, 0.0, 0.0, 1.0, v[0], v[1] if len(v) > 1 else 0.0)
+
+    if name == 'rotate':
+        a = params.get('a')
+        v = params.get('v')
+        if a is None:
+            a = 0
+        if isinstance(a, (list, tuple)):
+            m = _rotation_3d(a)
+        elif v is not None and any(v):
+            m = _axis_rotation_3d(a, v)
+        else:
+            m = _rotation_3d([0, 0, a])
+        return (m[0][0], m[0][1], m[1][0], m[1][1], 0.0, 0.0)
+
+    if name == 'mirror':
+        v = params.get('v')
+        v = list(v if v is not None else [1, 0, 0]) + [0, 0]
+        length = math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+        if not length:
+            return (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+        nx, ny = v[0] / length, v[1] / length
+        return (1 - 2 * nx * nx, -2 * nx * ny, -2 * nx * ny, 1 - 2 * ny * ny, 0.0, 0.0)
+
+    if name == 'scale':
+        v = params.get('v')
+        if v is None:
+            v = 1
+        if isinstance(v, (int, float)):
+            return (v, 0.0, 0.0, v, 0.0, 0.0)
+        return (v[0], 0.0, 0.0, v[1] if len(v) > 1 else 1.0, 0.0, 0.0)
+
+    if name == 'multmatrix':
+        m = params['m']
+        return (m[0][0], m[0][1], m[1][0], m[1][1], m[0][3], m[1][3])
+
+    return None
+
+
+# ============
+# = Booleans =
+# ============
+def _boolean(op, regions):
+    if op == 'union':
+        regions = [r for r in regions if not r.is_empty()]
+        if not regions:
+            return Region()
+        if len(regions) == 1 and regions[0].clean:
+            return regions[0]
+        return _union_groups(regions)
+
+    if op == 'intersection':
+        if not regions:
+            return Region()
+        if any(r.is_empty() for r in regions):
+            return Region()
+        if len(regions) == 1:
+            return _boolean('union', regions)
+        bounds = [r.bounds() for r in regions]
+        if not _all_overlap(bounds):
+            return Region()
+        return _clip(op, regions)
+
+    # difference
+    if not regions or regions[0].is_empty():
+        return Region()
+    first_bounds = regions[0].bounds()
+    subtracted = [r for r in regions[1:] if not r.is_empty() and _overlaps(first_bounds, r.bounds())]
+    if not subtracted:
+        return _boolean('union', regions[:1])
+    return _clip(op, [regions[0]] + subtracted)
+
+
+def _overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _all_overlap(bounds):
+    return max(b[0] for b in bounds) <= min(b[2] for b in bounds) and \
+           max(b[1] for b in bounds) <= min(b[3] for b in bounds)
+
+
+def _union_groups(regions):
+    # Most unions (e.g. a plate's worth of key cutouts) are of shapes that
+    # don't touch each other at all.  Only clip together the groups whose
+    # bounding boxes overlap; pass everything else straight through.
+    bounds = [r.bounds() for r in regions]
+    order = sorted(range(len(regions)), key=lambda i: bounds[i][0])
+    parent = list(range(len(regions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    active = []
+    for i in order:
+        active = [j for j in active if bounds[j][2] >= bounds[i][0]]
+        for j in active:
+            if _overlaps(bounds[i], bounds[j]):
+                parent[find(i)] = find(j)
+        active.append(i)
+
+    groups = {}
+    for i in range(len(regions)):
+        groups.setdefault(find(i), []).append(regions[i])
+
+    outlines = []
+    for group in groups.values():
+        if len(group) == 1 and group[0].clean:
+            outlines.extend(group[0].outlines)
+        else:
+            outlines.extend(_clip('union', group).outlines)
+    return Region(outlines)
+
+
+class _Grid(object):
+    # Uniform grid of buckets for finding things near a point or box
+
+    def __init__(self, bounds, count):
+        self.x0, self.y0 = bounds[0], bounds[1]
+        width = max(bounds[2] - bounds[0], SNAP)
+        height = max(bounds[3] - bounds[1], SNAP)
+        self.size = max(math.sqrt(width * height / max(count, 1)) * 2, width / 1024, height / 1024, SNAP)
+        self.cells = {}
+
+    def cell(self, x, y):
+        return int((x - self.x0) // self.size), int((y - self.y0) // self.size)
+
+    def insert(self, item, box):
+        cx0, cy0 = self.cell(box[0], box[1])
+        cx1, cy1 = self.cell(box[2], box[3])
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def query(self, x, y):
+        return self.cells.get(self.cell(x, y), ())
+
+
+def _clip(op, regions):
+    # General boolean:
+    #   1. Split every edge wherever it meets another edge.
+    #   2. Merge coincident pieces.
+    #   3. Keep each piece that has the result inside on exactly one side of
+    #      it, pointing so that the inside is on its left.
+    #   4. Chain the kept pieces back together into outlines.
+    x1s, y1s, x2s, y2s, owners, arcs = [], [], [], [], [], []
+    for index, region in enumerate(regions):
+        for outline in region.outlines:
+            points = outline.points
+            n = len(points)
+            for i in range(n):
+                ax, ay = points[i]
+                bx, by = points[(i + 1) % n]
+                if ax == bx and ay == by:
+                    continue
+                x1s.append(ax)
+                y1s.append(ay)
+                x2s.append(bx)
+                y2s.append(by)
+                owners.append(index)
+                arcs.append(outline.arcs[i])
+
+    if not x1s:
+        return Region()
+
+    splits = _find_splits(x1s, y1s, x2s, y2s, owners, [not r.clean for r in regions])
+
+    # Cut edges into pieces, merging vertices within SNAP of each other
+    coordinates = {}
+    pieces = {}
+    for i in range(len(x1s)):
+        points = [(0.0, x1s[i], y1s[i])]
+        if splits[i]:
+            points.extend(sorted(splits[i]))
+        points.append((1.0, x2s[i], y2s[i]))
+
+        previous = None
+        for _, x, y in points:
+            key = (int(round(x / SNAP)), int(round(y / SNAP)))
+            if key not in coordinates:
+                coordinates[key] = (x, y)
+            if previous is not None and key != previous:
+                undirected = (previous, key) if previous < key else (key, previous)
+                if undirected not in pieces or (pieces[undirected] is None and arcs[i] is not None):
+                    pieces[undirected] = arcs[i]
+            previous = key
+
+    inside = _membership(op, regions)
+
+    # Classify
+    outgoing = {}
+    boundary = []
+    for (ka, kb), arc in pieces.items():
+        ax, ay = coordinates[ka]
+        bx, by = coordinates[kb]
+        dx, dy = bx - ax, by - ay
+        length = math.sqrt(dx * dx + dy * dy)
+        nx, ny = -dy / length * SAMPLE_DISTANCE, dx / length * SAMPLE_DISTANCE
+        mx, my = (ax + bx) / 2, (ay + by) / 2
+
+        left = inside(mx + nx, my + ny)
+        if left == inside(mx - nx, my - ny):
+            continue
+        edge = (ka, kb, arc) if left else (kb, ka, arc)
+        outgoing.setdefault(edge[0], []).append(len(boundary))
+        boundary.append(edge)
+
+    outlines = _link(boundary, outgoing, coordinates)
+    return Region(outlines)
+
+
+def _find_splits(x1s, y1s, x2s, y2s, owners, self_intersecting):
+    # For every edge, the (parameter, x, y) points where other edges touch or
+    # cross its interior
+    n = len(x1s)
+    splits = [[] for _ in range(n)]
+
+    boxes = [(min(x1s[i], x2s[i]), min(y1s[i], y2s[i]), max(x1s[i], x2s[i]), max(y1s[i], y2s[i]))
+             for i in range(n)]
+    grid = _Grid((min(b[0] for b in boxes), min(b[1] for b in boxes),
+                  max(b[2] for b in boxes), max(b[3] for b in boxes)), n)
+    for i in range(n):
+        box = boxes[i]
+        grid.insert(i, (box[0] - SNAP, box[1] - SNAP, box[2] + SNAP, box[3] + SNAP))
+
+    for cell, members in grid.cells.items():
+        count = len(members)
+        for a in range(count):
+            i = members[a]
+            box_i = boxes[i]
+            for b in range(a + 1, count):
+                j = members[b]
+                # Edges of a clean region never cross each other
+                if owners[i] == owners[j] and not self_intersecting[owners[i]]:
+                    continue
+                box_j = boxes[j]
+                if box_i[0] > box_j[2] + SNAP or box_j[0] > box_i[2] + SNAP or \
+                   box_i[1] > box_j[3] + SNAP or box_j[1] > box_i[3] + SNAP:
+                    continue
+                # Only handle each pair in one cell: the one holding the
+                # lower-left corner of the overlap of their boxes
+                if grid.cell(max(box_i[0], box_j[0]) - SNAP, max(box_i[1], box_j[1]) - SNAP) != cell:
+                    continue
+                _intersect(i, j, x1s, y1s, x2s, y2s, splits)
+    return splits
+
+
+def _intersect(i, j, x1s, y1s, x2s, y2s, splits):
+    px, py = x1s[i], y1s[i]
+    rx, ry = x2s[i] - px, y2s[i] - py
+    qx, qy = x1s[j], y1s[j]
+    sx, sy = x2s[j] - qx, y2s[j] - qy
+
+    rr = rx * rx + ry * ry
+    ss = sx * sx + sy * sy
+    denominator = rx * sy - ry * sx
+    qpx, qpy = qx - px, qy - py
+
+    tolerance_i = SNAP / math.sqrt(rr)
+    tolerance_j = SNAP / math.sqrt(ss)
+
+    if abs(denominator) > 1e-12 * math.sqrt(rr * ss):
+        t = (qpx * sy - qpy * sx) / denominator
+        u = (qpx * ry - qpy * rx) / denominator
+        if -tolerance_i <= t <= 1 + tolerance_i and -tolerance_j <= u <= 1 + tolerance_j:
+            # Snap T-junctions onto the existing endpoint
+            if u <= tolerance_j:
+                x, y = qx, qy
+            elif u >= 1 - tolerance_j:
+                x, y = x2s[j], y2s[j]
+            else:
+                x, y = px + t * rx, py + t * ry
+            if tolerance_i < t < 1 - tolerance_i:
+                splits[i].append((t, x, y))
+            if tolerance_j < u < 1 - tolerance_j:
+                if tolerance_i < t < 1 - tolerance_i:
+                    splits[j].append((u, x, y))
+                else:
+                    splits[j].append((u, px if t < 0.5 else x2s[i], py if t < 0.5 else y2s[i]))
+        return
+
+    # Parallel.  Only collinear overlaps matter.
+    if abs(qpx * ry - qpy * rx) / math.sqrt(rr) > SNAP:
+        return
+    for x, y in ((qx, qy), (x2s[j], y2s[j])):
+        t = ((x - px) * rx + (y - py) * ry) / rr
+        if tolerance_i < t < 1 - tolerance_i:
+            splits[i].append((t, x, y))
+    for x, y in ((px, py), (x2s[i], y2s[i])):
+        u = ((x - qx) * sx + (y - qy) * sy) / ss
+        if tolerance_j < u < 1 - tolerance_j:
+            splits[j].append((u, x, y))
+
+
+def _winding(points, x, y):
+    w = 0
+    x0, y0 = points[-1]
+    for x1, y1 in points:
+        if y0 <= y:
+            if y1 > y and (x1 - x0) * (y - y0) - (x - x0) * (y1 - y0) > 0:
+                w += 1
+        elif y1 <= y and (x1 - x0) * (y - y0) - (x - x0) * (y1 - y0) < 0:
+            w -= 1
+        x0, y0 = x1, y1
+    return w
+
+
+def _membership(op, regions):
+    # Returns inside(x, y) for the result of op on regions
+    entries = []
+    for index, region in enumerate(regions):
+        for outline in region.outlines:
+            entries.append((index, outline.points, outline.bounds()))
+
+    grid = _Grid((min(e[2][0] for e in entries), min(e[2][1] for e in entries),
+                  max(e[2][2] for e in entries), max(e[2][3] for e in entries)), len(entries))
+    for entry in entries:
+        grid.insert(entry, entry[2])
+
+    rules = [r.fill_rule for r in regions]
+    count = len(regions)
+
+    def inside(x, y):
+        windings = [0] * count
+        for index, points, box in grid.query(x, y):
+            if box[0] <= x <= box[2] and box[1] <= y <= box[3]:
+                windings[index] += _winding(points, x, y)
+
+        inside_each = []
+        for w, rule in zip(windings, rules):
+            if rule == EVENODD:
+                inside_each.append(w % 2 == 1)
+            elif rule == POSITIVE:
+                inside_each.append(w > 0)
+            else:
+                inside_each.append(w != 0)
+
+        if op == 'union':
+            return any(inside_each)
+        if op == 'intersection':
+            return all(inside_each)
+        return inside_each[0] and not any(inside_each[1:])
+
+    return inside
+
+
+def _link(boundary, outgoing, coordinates):
+    # Chain directed boundary edges into outlines.  Where several outlines
+    # touch at one vertex, always take the sharpest left turn, which keeps
+    # them apart.
+    used = [False] * len(boundary)
+    outlines = []
+
+    for start in range(len(boundary)):
+        if used[start]:
+            continue
+        keys, arcs = [], []
+        current = start
+        closed = False
+        while True:
+            used[current] = True
+            ka, kb, arc = boundary[current]
+            keys.append(ka)
+            arcs.append(arc)
+            if kb == boundary[start][0]:
+                closed = True
+                break
+
+            candidates = [e for e in outgoing.get(kb, ()) if not used[e]]
+            if not candidates:
+                break
+            if len(candidates) == 1:
+                current = candidates[0]
+                continue
+
+            ax, ay = coordinates[ka]
+            bx, by = coordinates[kb]
+            dx, dy = bx - ax, by - ay
+
+            def turn(e):
+                cx, cy = coordinates[boundary[e][1]]
+                ex, ey = cx - bx, cy - by
+                return math.atan2(dx * ey - dy * ex, dx * ex + dy * ey)
+            current = max(candidates, key=turn)
+
+        if closed and len(keys) >= 3:
+            outline = _simplify(Outline([coordinates[k] for k in keys], arcs))
+            if outline is not None:
+                outlines.append(outline)
+    return outlines
+
+
+def _simplify(outline):
+    # Drop vertices in the middle of straight runs
+    points, arcs = outline.points, outline.arcs
+    changed = True
+    while changed and len(points) >= 3:
+        changed = False
+        n = len(points)
+        keep_points, keep_arcs = [], []
+        for i in range(n):
+            x0, y0 = points[i - 1]
+            x1, y1 = points[i]
+            x2, y2 = points[(i + 1) % n]
+            cross = (x1 - x0) * (y2 - y1) - (y1 - y0) * (x2 - x1)
+            dot = (x1 - x0) * (x2 - x1) + (y1 - y0) * (y2 - y1)
+            scale = math.hypot(x1 - x0, y1 - y0) * math.hypot(x2 - x1, y2 - y1)
+            if arcs[i - 1] == arcs[i] and abs(cross) <= 1e-12 * scale and dot > 0:
+                changed = True
+                # Merge this vertex's edge into the previous one
+                continue
+            keep_points.append(points[i])
+            keep_arcs.append(arcs[i])
+        if changed:
+            # A merged vertex's outgoing edge is covered by its incoming edge,
+            # whose arc is the same
+            points, arcs = keep_points, keep_arcs
+
+    if len(points) < 3:
+        return None
+    outline = Outline(points, arcs)
+    if abs(outline.area()) < SNAP * SNAP:
+        return None
+    return outline
+
+
+# ===========
+# = Offsets =
+# ===========
+def _offset(region, delta, join, segments=None):
+    # Offset every outline outward (to the right of its direction of travel)
+    # by delta, then resolve overlaps with the positive fill rule, the same
+    # way Clipper does it for OpenSCAD.
+    if not delta:
+        return region
+
+    raw = []
+    for outline in region.outlines:
+        points, arcs = outline.points, outline.arcs
+        n = len(points)
+        out_points, out_arcs = [], []
+
+        for i in range(n):
+            px, py = points[i - 1]
+            cx, cy = points[i]
+            nx_, ny_ = points[(i + 1) % n]
+
+            d1x, d1y = _unit(cx - px, cy - py)
+            d2x, d2y = _unit(nx_ - cx, ny_ - cy)
+            n1x, n1y = d1y, -d1x
+            n2x, n2y = d2y, -d2x
+
+            p1 = (cx + delta * n1x, cy + delta * n1y)
+            p2 = (cx + delta * n2x, cy + delta * n2y)
+            cross = d1x * d2y - d1y * d2x
+            dot = d1x * d2x + d1y * d2y
+
+            if abs(cross) < 1e-12 and dot > 0:
+                vertex_points, vertex_arcs = [p1], []
+            elif cross * delta < 0:
+                # Offset edges overlap here; run them through the original
+                # vertex and let the fill rule sort it out
+                vertex_points, vertex_arcs = [p1, (cx, cy), p2], [None, None]
+            elif join == 'round':
+                vertex_points, vertex_arcs = _round_join(cx, cy, p1, p2, abs(delta), math.atan2(cross, dot), segments)
+            elif join == 'miter' and dot > -1 + 1e-9:
+                scale = delta / (1 + n1x * n2x + n1y * n2y)
+                vertex_points, vertex_arcs = [(cx + (n1x + n2x) * scale, cy + (n1y + n2y) * scale)], []
+            else:
+                vertex_points, vertex_arcs = [p1, p2], [None]
+
+            out_points.extend(vertex_points)
+            out_arcs.extend(vertex_arcs)
+            out_arcs.append(_offset_arc(arcs[i], cx, cy, d2x, d2y, delta))
+
+        raw.append(Outline(out_points, out_arcs))
+
+    return _clip('union', [Region(raw, POSITIVE, clean=False)])
+
+
+def _unit(x, y):
+    length = math.sqrt(x * x + y * y)
+    return x / length, y / length
+
+
+def _round_join(cx, cy, p1, p2, radius, sweep, segments):
+    steps = max(1, int(math.ceil(abs(sweep) / (2 * math.pi / _fragments(radius, segments)))))
+    start = math.atan2(p1[1] - cy, p1[0] - cx)
+    points = [p1]
+    for k in range(1, steps):
+        angle = start + sweep * k / steps
+        points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+    points.append(p2)
+    return points, [(cx, cy, radius)] * steps
+
+
+def _offset_arc(arc, x, y, dx, dy, delta):
+    # An arc offset by delta is a concentric arc, bigger if its center is on
+    # the left (inside) of the edge, smaller otherwise
+    if arc is None:
+        return None
+    center_on_left = dx * (arc[1] - y) - dy * (arc[0] - x) > 0
+    radius = arc[2] + delta if center_on_left else arc[2] - delta
+    return (arc[0], arc[1], radius) if radius > 0 else None
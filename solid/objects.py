@@ -13,8 +13,10 @@ class polygon(OpenSCADObject):
 
     :param paths: Either a single vector, enumerating the point list, ie. the order to traverse the points, or, a vector of vectors, ie a list of point lists for each separate curve of the polygon. The latter is required if the polygon has holes. The parameter is optional and if omitted the points are assumed in order. (The 'pN' components of the *paths* vector are 0-indexed references to the elements of the *points* vector.)
     '''
+    __slots__ = ()
+
     def __init__(self, points, paths=None):
-        if not paths:
+        if paths is None or len(paths) == 0:
             paths = [list(range(len(points)))]
         OpenSCADObject.__init__(self, 'polygon',
                                 {'points': points, 'paths': paths})
@@ -34,6 +36,8 @@ class circle(OpenSCADObject):
     :param segments: Number of fragments in 360 degrees.
     :type segments: int
     '''
+    __slots__ = ()
+
     def __init__(self, r=None, d=None, segments=None):
         OpenSCADObject.__init__(self, 'circle',
                                 {'r': r, 'd': d, 'segments': segments})
@@ -52,6 +56,8 @@ class square(OpenSCADObject):
     :param center: This determines the positioning of the object. If True, object is centered at (0,0). Otherwise, the square is placed in the positive quadrant with one corner at (0,0). Defaults to False.
     :type center: boolean
     '''
+    __slots__ = ()
+
     def __init__(self, size=None, center=None):
         OpenSCADObject.__init__(self, 'square',
                                 {'size': size, 'center': center})
@@ -71,6 +77,8 @@ class sphere(OpenSCADObject):
     :param segments: Resolution of the sphere
     :type segments: int
     '''
+    __slots__ = ()
+
     def __init__(self, r=None, d=None, segments=None):
         OpenSCADObject.__init__(self, 'sphere',
                                 {'r': r, 'd': d, 'segments': segments})
@@ -89,6 +97,8 @@ class cube(OpenSCADObject):
     :param center: This determines the positioning of the object. If True, object is centered at (0,0,0). Otherwise, the cube is placed in the positive quadrant with one corner at (0,0,0). Defaults to False
     :type center: boolean
     '''
+    __slots__ = ()
+
     def __init__(self, size=None, center=None):
         OpenSCADObject.__init__(self, 'cube',
                                 {'size': size, 'center': center})
@@ -127,6 +137,8 @@ class cylinder(OpenSCADObject):
     :param segments: The fixed number of fragments to use.
     :type segments: int
     '''
+    __slots__ = ()
+
     def __init__(self, r=None, h=None, r1=None, r2=None, d=None, d1=None,
                  d2=None, center=None, segments=None):
         OpenSCADObject.__init__(self, 'cylinder',
@@ -153,6 +165,8 @@ class polyhedron(OpenSCADObject):
     :param convexity: The convexity parameter specifies the maximum number of front sides (back sides) a ray intersecting the object might penetrate. This parameter is only needed for correctly displaying the object in OpenCSG preview mode and has no effect on the polyhedron rendering.
     :type convexity: int
     '''
+    __slots__ = ()
+
     def __init__(self, points, faces, convexity=None, triangles=None):
         OpenSCADObject.__init__(self, 'polyhedron',
                                 {'points': points, 'faces': faces,
@@ -165,6 +179,8 @@ class union(OpenSCADObject):
     Creates a union of all its child nodes. This is the **sum** of all
     children.
     '''
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'union', {})
 
@@ -174,6 +190,8 @@ class intersection(OpenSCADObject):
     Creates the intersection of all child nodes. This keeps the
     **overlapping** portion
     '''
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'intersection', {})
 
@@ -182,17 +200,23 @@ class difference(OpenSCADObject):
     '''
     Subtracts the 2nd (and all further) child nodes from the first one.
     '''
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'difference', {})
 
 
 class hole(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'hole', {})
         self.set_hole(True)
 
 
 class part(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'part', {})
         self.set_part_root(True)
@@ -205,6 +229,8 @@ class translate(OpenSCADObject):
     :param v: X, Y and Z translation
     :type v: 3 value sequence
     '''
+    __slots__ = ()
+
     def __init__(self, v=None):
         OpenSCADObject.__init__(self, 'translate', {'v': v})
 
@@ -216,6 +242,8 @@ class scale(OpenSCADObject):
     :param v: X, Y and Z scale factor
     :type v: 3 value sequence
     '''
+    __slots__ = ()
+
     def __init__(self, v=None):
         OpenSCADObject.__init__(self, 'scale', {'v': v})
 
@@ -231,6 +259,8 @@ class rotate(OpenSCADObject):
     :param v: sequence specifying 0 or 1 to indicate which axis to rotate by 'a' degrees. Ignored if 'a' is a sequence.
     :type v: 3 value sequence
     '''
+    __slots__ = ()
+
     def __init__(self, a=None, v=None):
         OpenSCADObject.__init__(self, 'rotate', {'a': a, 'v': v})
 
@@ -243,6 +273,8 @@ class mirror(OpenSCADObject):
     :type v: 3 number sequence
 
     '''
+    __slots__ = ()
+
     def __init__(self, v):
         OpenSCADObject.__init__(self, 'mirror', {'v': v})
 
@@ -254,6 +286,8 @@ class resize(OpenSCADObject):
     :param newsize: X, Y and Z values
     :type newsize: 3 value sequence
     '''
+    __slots__ = ()
+
     def __init__(self, newsize):
         OpenSCADObject.__init__(self, 'resize', {'newsize': newsize})
 
@@ -266,6 +300,8 @@ class multmatrix(OpenSCADObject):
     :param m: transformation matrix
     :type m: sequence of 4 sequences, each containing 4 numbers.
     '''
+    __slots__ = ()
+
     def __init__(self, m):
         OpenSCADObject.__init__(self, 'multmatrix', {'m': m})
 
@@ -280,6 +316,8 @@ class color(OpenSCADObject):
     :param c: RGB color + alpha value.
     :type c: sequence of 3 or 4 numbers between 0 and 1
     '''
+    __slots__ = ()
+
     def __init__(self, c):
         OpenSCADObject.__init__(self, 'color', {'c': c})
 
@@ -290,6 +328,8 @@ class minkowski(OpenSCADObject):
     sum <http://www.cgal.org/Manual/latest/doc_html/cgal_manual/Minkowski_sum_3/Chapter_main.html>`__
     of child nodes.
     '''
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'minkowski', {})
 
@@ -311,6 +351,8 @@ class offset(OpenSCADObject):
         their intersection).
     :type chamfer: bool
     '''
+    __slots__ = ()
+
     def __init__(self, r=None, delta=None, chamfer=False):
         if r:
             kwargs = {'r':r}
@@ -326,6 +368,8 @@ class hull(OpenSCADObject):
     hull <http://www.cgal.org/Manual/latest/doc_html/cgal_manual/Convex_hull_2/Chapter_main.html>`__
     of child nodes.
     '''
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'hull', {})
 
@@ -338,6 +382,8 @@ class render(OpenSCADObject):
     :param convexity: The convexity parameter specifies the maximum number of front sides (back sides) a ray intersecting the object might penetrate. This parameter is only needed for correctly displaying the object in OpenCSG preview mode and has no effect on the polyhedron rendering.
     :type convexity: int
     '''
+    __slots__ = ()
+
     def __init__(self, convexity=None):
         OpenSCADObject.__init__(self, 'render', {'convexity': convexity})
 
@@ -367,6 +413,8 @@ class linear_extrude(OpenSCADObject):
     :type scale: number
 
     '''
+    __slots__ = ()
+
     def __init__(self, height=None, center=None, convexity=None, twist=None,
                  slices=None, scale=None):
         OpenSCADObject.__init__(self, 'linear_extrude',
@@ -396,12 +444,16 @@ class rotate_extrude(OpenSCADObject):
     :type segments: int
 
     '''
+    __slots__ = ()
+
     def __init__(self, convexity=None, segments=None):
         OpenSCADObject.__init__(self, 'rotate_extrude',
                                 {'convexity': convexity, 'segments': segments})
 
 
 class dxf_linear_extrude(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self, file, layer=None, height=None, center=None,
                  convexity=None, twist=None, slices=None):
         OpenSCADObject.__init__(self, 'dxf_linear_extrude',
@@ -419,6 +471,8 @@ class projection(OpenSCADObject):
     :param cut: when True only points with z=0 will be considered (effectively cutting the object) When False points above and below the plane will be considered as well (creating a proper projection).
     :type cut: boolean
     '''
+    __slots__ = ()
+
     def __init__(self, cut=None):
         OpenSCADObject.__init__(self, 'projection', {'cut': cut})
 
@@ -439,6 +493,8 @@ class surface(OpenSCADObject):
     :param convexity: The convexity parameter specifies the maximum number of front sides (back sides) a ray intersecting the object might penetrate. This parameter is only needed for correctly displaying the object in OpenCSG preview mode and has no effect on the polyhedron rendering.
     :type convexity: int
     '''
+    __slots__ = ()
+
     def __init__(self, file, center=None, convexity=None, invert=None):
         OpenSCADObject.__init__(self, 'surface',
                                 {'file': file, 'center': center,
@@ -479,6 +535,8 @@ class text(OpenSCADObject):
     :param segments: used for subdividing the curved path segments provided by freetype
     :type segments: int
     '''
+    __slots__ = ()
+
     def __init__(self, text, size=None, font=None, halign=None, valign=None,
                  spacing=None, direction=None, language=None, script=None,
                  segments=None):
@@ -491,6 +549,8 @@ class text(OpenSCADObject):
 
 
 class child(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self, index=None, vector=None, range=None):
         OpenSCADObject.__init__(self, 'child',
                                 {'index': index, 'vector': vector,
@@ -511,6 +571,8 @@ class children(OpenSCADObject):
 
     :param range: [:] or [::]. select children between to , incremented by (default 1).
     '''
+    __slots__ = ()
+
     def __init__(self, index=None, vector=None, range=None):
         OpenSCADObject.__init__(self, 'children',
                                 {'index': index, 'vector': vector,
@@ -518,6 +580,8 @@ class children(OpenSCADObject):
 
 
 class import_stl(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self, file, origin=(0, 0), layer=None):
         OpenSCADObject.__init__(self, 'import',
                                 {'file': file, 'origin': origin,
@@ -525,6 +589,8 @@ class import_stl(OpenSCADObject):
 
 
 class import_dxf(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self, file, origin=(0, 0), layer=None):
         OpenSCADObject.__init__(self, 'import',
                                 {'file': file, 'origin': origin,
@@ -542,6 +608,8 @@ class import_(OpenSCADObject):
     :param convexity: The convexity parameter specifies the maximum number of front sides (back sides) a ray intersecting the object might penetrate. This parameter is only needed for correctly displaying the object in OpenCSG preview mode and has no effect on the polyhedron rendering.
     :type convexity: int
     '''
+    __slots__ = ()
+
     def __init__(self, file, origin=(0, 0), layer=None):
         OpenSCADObject.__init__(self, 'import',
                                 {'file': file, 'origin': origin,
@@ -553,11 +621,15 @@ class intersection_for(OpenSCADObject):
     Iterate over the values in a vector or range and take an
     intersection of the contents.
     '''
+    __slots__ = ()
+
     def __init__(self, n):
         OpenSCADObject.__init__(self, 'intersection_for', {'n': n})
 
 
 class assign(OpenSCADObject):
+    __slots__ = ()
+
     def __init__(self):
         OpenSCADObject.__init__(self, 'assign', {})
 
@@ -0,0 +1,419 @@
+"""
+Rewrites of SolidPython trees into smaller ones with the same geometry.
+
+optimize() runs all of them, fold_transforms() and simplify_booleans(), and
+is what scad_render(..., optimize=True) renders.  Each rewrite returns a new
+tree and leaves the one it's given as it is:  the nodes it changes are
+rebuilt, and everything else is shared with the original.  The new tree is
+meant for rendering.  Its nodes aren't added to their new parents the usual
+way, so changes to the original made afterwards don't invalidate anything in
+it; rewrite again instead.
+"""
+import math
+
+from .solidpython import IncludedOpenSCADObject, non_rendered_classes, _scan_tree
+from . import objects
+from .geometry2d import _axis_rotation_3d, _rotation_3d
+
+# Folded values this close to a whole number are taken to be it, so that,
+# e.g., a translate and its inverse cancel out exactly
+EPSILON = 1e-12
+
+AFFINE_TRANSFORMS = frozenset(['translate', 'rotate', 'mirror', 'scale', 'multmatrix'])
+
+BOOLEANS = frozenset(['union', 'intersection', 'difference'])
+
+# Nodes whose children are simply unioned, in any order, so an identity
+# transform's children can take its place among them
+_IMPLICIT_UNION = AFFINE_TRANSFORMS | frozenset(['union'])
+
+_IDENTITY = ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0))
+
+
+def optimize(scad_object, push_translations=False):
+    '''
+    scad_object with every rewrite here applied, in a single walk.
+    push_translations is as for simplify_booleans().
+    '''
+    simplify = _BooleanSimplifier(scad_object, push_translations)
+    return _rewrite(scad_object, lambda node, children: _folded(simplify(node, children)))
+
+
+def fold_transforms(scad_object):
+    '''
+    scad_object with every chain of affine transforms (translate, rotate,
+    mirror, scale and multmatrix), each the only child of the one above it,
+    folded into one translate, rotate or multmatrix, and transforms that
+    don't move anything dropped.  Transforms that are holes or part roots,
+    or have a modifier or params that aren't plain numbers, are left be.
+
+    Folded matrices are exact up to float rounding, well below the ten
+    decimal places that rendering keeps.
+    '''
+    return _rewrite(scad_object, _fold)
+
+
+def simplify_booleans(scad_object, push_translations=False):
+    '''
+    scad_object with its booleans flattened, as if a + b + c had been
+    written union()(a, b, c):
+        - unions, and transforms that don't move anything, are spliced
+          into the unions and transforms they're under, and into the
+          subtracted children of differences
+        - intersections are spliced into intersections, and a difference
+          into the difference it's the first child of
+        - unions and transforms with no children, which are empty, are
+          dropped from the unions and transforms they're in, and from
+          what differences subtract
+        - a union, intersection or difference with a single child is
+          replaced by that child
+    Booleans that are holes or part roots, or have a modifier, are left be,
+    as is anything whose holes would be rendered differently for it.
+
+    With push_translations, a translate whose children are all translates
+    is pushed down into them, so that it's one node less once it's been
+    spliced into a union above it.
+    '''
+    return _rewrite(scad_object, _BooleanSimplifier(scad_object, push_translations))
+
+
+# ================
+# = Tree Walking =
+# ================
+def _rewrite(scad_object, rewrite_node):
+    # Rebuild scad_object bottom-up, calling rewrite_node(node, children)
+    # once each node's children are done, with the rewritten children.  It
+    # returns what to use in node's place.  Each node is rewritten only once
+    # however many places it's used in, so shared nodes stay shared, and
+    # the walk keeps its own stack, so no depth of nesting runs into
+    # Python's recursion limit.
+    done = {}
+    stack = [(scad_object, iter(scad_object.children))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if id(child) not in done:
+                stack.append((child, iter(child.children)))
+                break
+        else:
+            stack.pop()
+            done[id(node)] = rewrite_node(node, [done[id(child)] for child in node.children])
+    return done[id(scad_object)]
+
+
+def _shared_nodes(scad_object):
+    # ids of the nodes that are used in more than one place under scad_object
+    seen = set()
+    shared = set()
+    stack = [scad_object]
+    while stack:
+        for child in stack.pop().children:
+            if id(child) in seen:
+                shared.add(id(child))
+            else:
+                seen.add(id(child))
+                stack.append(child)
+    return shared
+
+
+def _rebuilt(node, children):
+    # node with children, a new list that's the caller's to give away:
+    # node itself if they're the ones it has, otherwise a copy of it.  The
+    # children don't get a new parent, which would change the original tree.
+    if len(children) == len(node.children) and all(a is b for a, b in zip(children, node.children)):
+        return node
+    other = node._copy_node()
+    other.children = children
+    return other
+
+
+def _is_plain(node):
+    # Whether node is rendered as just what it is
+    return not (node.modifier or node.is_hole or node.is_part_root or isinstance(node, IncludedOpenSCADObject))
+
+
+def _stands_alone(node):
+    # Whether node is rendered where it is, as one node.  Holes are
+    # rendered elsewhere, and parts as their children, one after another.
+    return not node.is_hole and node.name not in non_rendered_classes
+
+
+# ============
+# = Booleans =
+# ============
+class _BooleanSimplifier(object):
+    # simplify_booleans()'s rewrite_node, for one tree
+
+    def __init__(self, scad_object, push_translations):
+        self.push_translations = push_translations
+        self.shared = _shared_nodes(scad_object)
+        self.hole_counts = _scan_tree(scad_object)[0]
+        # id of each node rewritten so far: the new node made for it, if one was
+        self.made = {}
+
+    def __call__(self, node, children):
+        if isinstance(node, IncludedOpenSCADObject):
+            return _rebuilt(node, children)
+
+        name = node.name
+        if name in _IMPLICIT_UNION:
+            children = self._flattened(node.children, children, _unions, True)
+        elif name == 'intersection':
+            children = self._flattened(node.children, children, _intersections, False)
+        elif name == 'difference' and children and _stands_alone(children[0]):
+            # Only if it's clear what's subtracted from:  it's the first child
+            # that's rendered in place, and holes are only rendered in place
+            # within other holes
+            first = self._flattened(node.children[:1], children[:1], _differences, False)
+            first.extend(self._flattened(node.children[1:], children[1:], _unions, False))
+            children = first
+
+        if self.push_translations and name == 'translate' and len(children) > 1:
+            pushed = _pushed_translation(node, children)
+            if pushed is not None:
+                self.made[id(node)] = pushed
+                return pushed
+
+        if name in BOOLEANS and len(children) == 1 and _stands_alone(children[0]) and _is_plain(node):
+            return children[0]
+        other = _rebuilt(node, children)
+        if other is not node:
+            self.made[id(node)] = other
+        return other
+
+    def _flattened(self, originals, children, splices, unioned):
+        # children, the rewritten originals, with each that splices(child)
+        # says to either dropped (None) or replaced by the children it
+        # returns.  The first one spliced has its list taken over rather than
+        # copied, if it's a new node that's used nowhere else, so that
+        # flattening a long chain, as a + b + c ... makes, takes time in
+        # proportion to its length.
+        #
+        # Unless unioned, holes aren't spliced into place:  in the hole
+        # section, a hole's children are rendered one after another, and
+        # they'd no longer be unioned.
+        flattened = []
+        for original, child in zip(originals, children):
+            spliced = splices(child)
+            if spliced is None:
+                continue
+            if spliced is not child and not unioned and self.hole_counts[id(original)] and \
+                    any(c.is_hole for c in spliced):
+                spliced = child
+            if spliced is child:
+                flattened.append(child)
+            elif not flattened and self.made.get(id(original)) is child and id(original) not in self.shared:
+                flattened = spliced
+            else:
+                flattened.extend(spliced)
+        return flattened
+
+
+def _unions(child):
+    if not _is_plain(child) or child.name not in _IMPLICIT_UNION:
+        return child
+    if not child.children:
+        return None
+    if child.name == 'union':
+        return child.children
+    matrix = _matrix(child)
+    return child.children if matrix is not None and _is_identity(matrix) else child
+
+
+def _intersections(child):
+    return _merged(child, 'intersection')
+
+
+def _differences(child):
+    return _merged(child, 'difference')
+
+
+def _merged(child, name):
+    # child's children, if it's a plain name to merge into the one it's
+    # under.  One with nothing rendered in place is empty, rather than the
+    # identity it'd be merged into.
+    if child.name == name and _is_plain(child) and any(_stands_alone(c) for c in child.children):
+        return child.children
+    return child
+
+
+def _pushed_translation(node, children):
+    # A union of node's children with node's translation folded into each,
+    # if they're all translates
+    matrix = _matrix(node)
+    if matrix is None:
+        return None
+    inner = [_matrix(child) if child.name == 'translate' else None for child in children]
+    if None in inner:
+        return None
+    union = objects.union()
+    union.children = [_transform(_multiply(matrix, m), child.children) for m, child in zip(inner, children)]
+    return union
+
+
+# ==============
+# = Transforms =
+# ==============
+def _fold(node, children):
+    if node.name in _IMPLICIT_UNION and not isinstance(node, IncludedOpenSCADObject):
+        children = _splice_identities(children)
+    return _folded(_rebuilt(node, children))
+
+
+def _folded(node):
+    # node, whose children are done, with the chain of transforms it starts
+    # folded into one
+    matrix = _matrix(node)
+    if matrix is None:
+        return node
+
+    children = node.children
+    folded = False
+    while len(children) == 1:
+        inner = _matrix(children[0])
+        if inner is None:
+            break
+        matrix = _multiply(matrix, inner)
+        children = children[0].children
+        folded = True
+
+    # A hole or part can't take the place of its transform, which might be
+    # the root or the first child of a difference
+    if _is_identity(matrix) and len(children) == 1 and _stands_alone(children[0]):
+        return children[0]
+    if not folded:
+        return node
+    return _transform(matrix, children)
+
+
+def _splice_identities(children):
+    spliced = []
+    for child in children:
+        matrix = _matrix(child)
+        if matrix is not None and _is_identity(matrix):
+            spliced.extend(child.children)
+        else:
+            spliced.append(child)
+    return spliced
+
+
+def _matrix(node):
+    # node's transform as the top three rows of a 4x4 affine matrix, or
+    # None if it isn't one that can be folded
+    if node.name not in AFFINE_TRANSFORMS or not _is_plain(node):
+        return None
+
+    params = dict(node._param_items())
+    try:
+        return _affine_matrix(node.name, params)
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        return None
+
+
+def _affine_matrix(name, params):
+    # As in geometry2d, but in 3D
+    if name == 'translate':
+        v = _vector(params.get('v', [0, 0, 0]), 0)
+        return ((1, 0, 0, v[0]), (0, 1, 0, v[1]), (0, 0, 1, v[2]))
+
+    if name == 'rotate':
+        a = params.get('a', 0)
+        v = params.get('v')
+        if isinstance(_plain(a), list):
+            m = _rotation_3d(_vector(a, 0))
+        elif v is not None and any(_vector(v, 0)):
+            m = _axis_rotation_3d(_number(a), _vector(v, 0))
+        else:
+            m = _rotation_3d([0, 0, _number(a)])
+        return _linear(m)
+
+    if name == 'mirror':
+        x, y, z = _vector(params.get('v', [1, 0, 0]), 0)
+        length_squared = x * x + y * y + z * z
+        if not length_squared:
+            return _IDENTITY
+        n = (x, y, z)
+        return _linear([[(i == j) - 2.0 * n[i] * n[j] / length_squared for j in range(3)] for i in range(3)])
+
+    if name == 'scale':
+        v = _plain(params.get('v', 1))
+        x, y, z = (v, v, v) if not isinstance(v, list) else _vector(v, 1)
+        return ((_number(x), 0, 0, 0), (0, _number(y), 0, 0), (0, 0, _number(z), 0))
+
+    if name == 'multmatrix':
+        m = _plain(params['m'])
+        rows = []
+        for i in range(4):
+            row = m[i] if i < len(m) else []
+            rows.append(tuple(_number(row[j]) if j < len(row) else float(i == j) for j in range(4)))
+        # Only affine matrices fold
+        if rows[3] != (0, 0, 0, 1):
+            return None
+        return tuple(rows[:3])
+
+    return None
+
+
+def _plain(value):
+    # Arrays and tuples as lists, as py2openscad() writes them
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if isinstance(value, tuple):
+        value = list(value)
+    return value
+
+
+def _number(value):
+    value = _plain(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError("Not a number: %r" % (value,))
+    return value
+
+
+def _vector(value, fill):
+    # A 3 element vector from an OpenSCAD one of up to 3 numbers
+    value = _plain(value)
+    if not isinstance(value, list) or len(value) > 3:
+        raise TypeError("Not a vector: %r" % (value,))
+    return [_number(c) for c in value] + [fill] * (3 - len(value))
+
+
+def _linear(m):
+    return tuple(tuple(m[i]) + (0,) for i in range(3))
+
+
+def _multiply(a, b):
+    # a after b
+    return tuple(tuple(sum(a[i][k] * b[k][j] for k in range(3)) + (a[i][3] if j == 3 else 0) for j in range(4))
+                 for i in range(3))
+
+
+def _is_identity(matrix):
+    return all(abs(matrix[i][j] - _IDENTITY[i][j]) < EPSILON for i in range(3) for j in range(4))
+
+
+def _snapped(value):
+    # value, as the whole number it's within EPSILON of, if it is
+    rounded = round(value)
+    return int(rounded) if abs(value - rounded) < EPSILON else value
+
+
+def _transform(matrix, children):
+    # The simplest transform node for matrix:  a translate if it doesn't
+    # rotate, reflect or scale, a rotate if all it does is turn about z,
+    # and a multmatrix otherwise
+    m = [[_snapped(x) for x in row] for row in matrix]
+    linear = [row[:3] for row in m]
+    offset = [row[3] for row in m]
+
+    if linear == [[1, 0, 0], [0, 1, 0], [0, 0, 1]]:
+        node = objects.translate(offset)
+    elif offset == [0, 0, 0] and m[2][:3] == [0, 0, 1] and m[0][2] == m[1][2] == 0 and \
+            abs(m[0][0] - m[1][1]) < EPSILON and abs(m[0][1] + m[1][0]) < EPSILON and \
+            abs(m[0][0] ** 2 + m[1][0] ** 2 - 1) < EPSILON:
+        node = objects.rotate(a=_snapped(math.degrees(math.atan2(m[1][0], m[0][0]))))
+    else:
+        node = objects.multmatrix(m=m + [[0, 0, 0, 1]])
+
+    node.children = list(children)
+    return node
@@ -10,38 +10,767 @@
 
 
 import os, sys, re
+import hashlib
 import inspect
+import itertools
+import json
+import multiprocessing
+import pickle
+import shutil
 import subprocess
 import tempfile
+import threading
+import types
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 
 # These are features added to SolidPython but NOT in OpenSCAD.
 # Mark them for special treatment
 non_rendered_classes = ['hole', 'part']
+# Operations that become unions above holes
+hole_union_classes = ['intersection', 'difference']
 
 # =========================================
 # = Rendering Python code to OpenSCAD code=
 # =========================================
-def _find_include_strings(obj):
+def _scan_tree(obj):
+    # Everything rendering needs to know about the tree beforehand, from a
+    # single walk that visits each node once however many places it's
+    # reused in, and that leaves the tree itself untouched.  The walk keeps
+    # its own stack, so no depth of nesting runs into Python's recursion
+    # limit.  Returns:
+    #   hole_counts:        {id(node): count} for every node in the tree:
+    #                       how many of its children are holes or have
+    #                       holes under them that aren't separated from it
+    #                       by another part root
+    #   include_strings:    the set of IncludedOpenSCADObjects' strings
+    hole_counts = {id(obj): 0}
     include_strings = set()
     if isinstance(obj, IncludedOpenSCADObject):
         include_strings.add(obj.include_string)
-    for child in obj.children:
-        include_strings.update(_find_include_strings(child))
-    return include_strings
 
+    stack = [(obj, iter(obj.children))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            key = id(child)
+            if key not in hole_counts:
+                hole_counts[key] = 0
+                if isinstance(child, IncludedOpenSCADObject):
+                    include_strings.add(child.include_string)
+                # Come back to the rest of node's children after child's.
+                # Leaves, the bulk of most trees, are done already.
+                if child.children:
+                    stack.append((child, iter(child.children)))
+                    break
+            if child.is_hole or (hole_counts[key] and not child.is_part_root):
+                hole_counts[id(node)] += 1
+        else:
+            stack.pop()
+            if stack and (node.is_hole or (hole_counts[id(node)] and not node.is_part_root)):
+                hole_counts[id(stack[-1][0])] += 1
+
+    return hole_counts, include_strings
+
+
+def _find_include_strings(obj):
+    return _scan_tree(obj)[1]
+
+
+def _shared_subtrees(obj, style, min_nodes):
+    # Subtrees that appear more than once under obj, and are worth writing
+    # out only once, as OpenSCAD modules.  Returns:
+    #   modules:        {id(node): module name} for every node to render as
+    #                   a call to its module instead
+    #   definitions:    [(module name, node)], a node to render as each
+    #                   module's body
+    #
+    # The tree is hash-consed:  every node gets the number of its class,
+    # which it shares with every other node that renders exactly the same,
+    # children and all, whether that's the same node reused in several
+    # places or an identical copy.  Holes and parts, and anything with them
+    # under it, render differently depending on where they are, so they're
+    # never shared.
+    classes = {}        # (node's own code, children's classes): class
+    class_of = {}       # id(node): class
+    sizes = []          # class: nodes in its subtree
+    children_of = []    # class: its children's classes, in order
+    shareable = []      # class: whether it can be a module
+    examples = []       # class: a node of that class
+
+    stack = [(obj, iter(obj.children))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if id(child) not in class_of and child.children:
+                stack.append((child, iter(child.children)))
+                break
+            if id(child) not in class_of:
+                _hash_cons(child, classes, class_of, sizes, children_of, shareable, examples, style)
+        else:
+            stack.pop()
+            _hash_cons(node, classes, class_of, sizes, children_of, shareable, examples, style)
+
+    # How many times each class is written out, with modules' bodies only
+    # written once, however often they're called.  Every class is bigger
+    # than any of its children's, so biggest first has each class's count
+    # settled before it's passed on to its children.
+    uses = [0] * len(sizes)
+    uses[class_of[id(obj)]] = 1
+    shared = set()
+    for number in sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True):
+        times = uses[number]
+        if shareable[number] and times > 1 and sizes[number] >= min_nodes:
+            shared.add(number)
+            times = 1
+        for child in children_of[number]:
+            uses[child] += times
+
+    names = dict((number, "solid_subtree_%d" % index) for index, number in enumerate(sorted(shared)))
+    modules = dict((key, names[number]) for key, number in class_of.items() if number in names)
+    definitions = [(names[number], examples[number]) for number in sorted(shared)]
+    return modules, definitions
+
+
+def _hash_cons(node, classes, class_of, sizes, children_of, shareable, examples, style):
+    # Find node's class, once all its children's are known
+    kids = tuple(class_of[id(child)] for child in node.children)
+    plain = _plain_node(node) and all(shareable[kid] for kid in kids)
+    key = (node._render_str_no_children(style=style), kids) if plain else id(node)
+    number = classes.get(key)
+    if number is None:
+        number = classes[key] = len(sizes)
+        sizes.append(1 + sum(sizes[kid] for kid in kids))
+        children_of.append(kids)
+        shareable.append(plain)
+        examples.append(node)
+    class_of[id(node)] = number
+
+
+class _ScadStyle(object):
+    # How rendered code is laid out and its numbers written.
+    #
+    # The default is SolidPython's usual indented code, with every float
+    # written to ten decimal places, or to precision places if that's given.
+    #
+    # compact leaves out all the newlines, indentation, spaces and comments
+    # OpenSCAD doesn't need, and writes each number in as few digits as
+    # possible:  exactly as Python's repr() would (minus any trailing '.0'),
+    # or, with precision, rounded to that many places with trailing zeros
+    # dropped.  Either way every number comes out the same as the default's,
+    # to within the chosen precision, so the geometry does too.
+    def __init__(self, compact=False, precision=None):
+        if precision is not None and (type(precision) != int or precision < 0):
+            raise ValueError("precision must be a whole number of decimal places, not %r" % (precision,))
+        if precision is not None:
+            float_format = "%%.%df" % precision
+        elif compact:
+            float_format = "%r"
+        else:
+            float_format = "%.10f"
+        self.compact = compact
+        self.key = (compact, precision)
+        self.number_formats = {float: float_format, int: "%d"}
+
+        if compact:
+            self.newline        = ""
+            self.separator      = ","
+            self.assign         = "="
+            self.block_open     = "{"
+            self.block_close    = "}"
+            self.difference     = "difference(){"
+            self.holes_below    = ""
+            self.holes_end      = "}"
+            self.module_open    = "module %s(){"
+            self.module_close   = "}"
+            self.call           = "%s();"
+        else:
+            self.newline        = "\n"
+            self.separator      = ", "
+            self.assign         = " = "
+            self.block_open     = " {"
+            self.block_close    = "\n}"
+            self.difference     = "\ndifference(){"
+            self.holes_below    = "\n/* Holes Below*/"
+            self.holes_end      = " /* End Holes */ \n}"
+            self.module_open    = "\nmodule %s() {"
+            self.module_close   = "\n}\n"
+            self.call           = "\n%s();"
+
+    def number(self, o):
+        # A single float
+        return self.numbers(self.number_formats[float] % o)
+
+    def numbers(self, s):
+        # s, just formatted from numbers alone
+        if self.compact:
+            return _trailing_zeros.sub(_drop_zeros, s)
+        return s
+
+
+# A float's trailing zeros, along with its decimal point if that's all that's
+# left, and the sign of a zero.  Only for numbers alone, without any strings
+# or names around them.
+_trailing_zeros = re.compile(r"(-?)(\d*)\.(\d*?)0*(?=[,\]]|$)")
+
+
+def _drop_zeros(match):
+    sign, whole, digits = match.groups()
+    if digits:
+        return sign + whole + "." + digits
+    if whole == "0":
+        return whole
+    return sign + whole
+
+
+_default_style = _ScadStyle()
 
-def scad_render(scad_object, file_header=''):
+
+class RenderCache(object):
+    '''
+    Rendered code for subtrees, by their fingerprint(), for scad_render()
+    and the like to reuse rather than render again.  Pass the same cache to
+    each render, and any subtree that's the same as one already rendered,
+    whether it's the same object unchanged or an identical one built since,
+    is written straight from the cache.
+
+    Only subtrees without holes or parts in them are cached, since those
+    render differently depending on where they are in the tree.  Renders
+    using dedupe don't use the cache.
+
+    With a path, the cache is loaded from that file, if it exists, and
+    save() writes it back, so it carries over from one run to the next.
+    Once it holds max_bytes of code, nothing more is added to it.  Renders
+    in several threads can share one cache.
+    '''
+    # Bump whenever rendered code changes, so that old caches are dropped
+    version = 1
+
+    def __init__(self, path=None, max_bytes=64 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('version') == self.version:
+                for key, text in saved['entries'].items():
+                    self._put(key, text)
+
+    @property
+    def full(self):
+        return self.size >= self.max_bytes
+
+    def get(self, fingerprint, style):
+        key = self._key(fingerprint, style)
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, fingerprint, style, text):
+        key = self._key(fingerprint, style)
+        with self.lock:
+            self._put(key, text)
+
+    def save(self, path=None):
+        with self.lock:
+            entries = dict(self.entries)
+        with open(path or self.path, 'w') as f:
+            json.dump({'version': self.version, 'entries': entries}, f)
+
+    def _put(self, key, text):
+        if key not in self.entries and not self.full:
+            self.entries[key] = text
+            self.size += len(text)
+
+    def _key(self, fingerprint, style):
+        compact, precision = style.key
+        return "%s %d %s" % (fingerprint, compact, precision)
+
+
+# Smallest subtree, in nodes, that dedupe=True writes out as a module
+dedupe_min_nodes = 4
+
+
+def scad_render(scad_object, file_header='', compact=False, precision=None, dedupe=False, cache=None, jobs=None,
+                optimize=False):
+    '''
+    scad_object's OpenSCAD code, as a string.  With compact, the code is
+    written with no more whitespace than OpenSCAD needs, and each number in
+    as few digits as it takes;  precision rounds floats to that many decimal
+    places.  (See _ScadStyle.)
+
+    With dedupe, any subtree that would be written more than once, whether
+    it's one node used in several places or identical copies, is written
+    only once, as a module, and called everywhere it's used.  OpenSCAD
+    builds each module's geometry once, too.  Subtrees smaller than
+    dedupe_min_nodes are left be, or smaller than dedupe nodes if that's a
+    number.  Subtrees with holes or parts in them are never shared.
+
+    cache, a RenderCache, is where to look for subtrees already rendered,
+    and where to keep those that aren't.
+
+    With jobs, subtrees without holes or parts in them are rendered by
+    that many worker processes at once, and put in their places as they
+    come back.  The code is the same either way.  Anything that can't be
+    pickled, or whose worker fails, is rendered here instead.  jobs doesn't
+    apply along with dedupe or cache.
+
+    With optimize, what's rendered is solid.optimize.optimize(scad_object):
+    the same geometry in fewer nodes, e.g. with chains of transforms folded
+    into one, and a + b + c as one union rather than two.  scad_object
+    itself is left as it is.
+    '''
+    fragments = []
+    _render_code(scad_object, fragments.append, file_header, _ScadStyle(compact, precision), dedupe, cache, jobs,
+                 optimize)
+    return ''.join(fragments)
+
+
+def scad_render_to_stream(scad_object, stream, file_header='', compact=False, precision=None, dedupe=False,
+                          cache=None, jobs=None, optimize=False):
+    '''
+    Write scad_object's OpenSCAD code to stream, any object with a write()
+    method, a piece at a time as the tree is walked.  The result is the same
+    as stream.write(scad_render(scad_object, file_header, ...)), but the whole
+    file is never held in memory at once; only the current path down the
+    tree is.  (Each node's own code, like a polyhedron's point list, is
+    still built whole before being written.)
+    '''
+    _render_code(scad_object, stream.write, file_header, _ScadStyle(compact, precision), dedupe, cache, jobs,
+                 optimize)
+
+
+def scad_render_to_files(renders, jobs=None, compact=False, precision=None, dedupe=False, optimize=False):
+    '''
+    Write several files at once, each rendered in a worker process.  renders
+    is a list of (scad_object, filepath) or (scad_object, filepath,
+    file_header); jobs is the number of workers, by default one per CPU.
+    Each file is the same as scad_render_to_file(..., include_orig_code=False)
+    would write.  Any object that can't be sent to a worker, or whose worker
+    fails, is rendered here instead.  Returns the file paths, in order.
+    '''
+    renders = [(tuple(render) + ('',))[:3] for render in renders]
+    options = {'compact': compact, 'precision': precision, 'dedupe': dedupe, 'optimize': optimize}
+    objects = [scad_object for scad_object, filepath, file_header in renders]
+
+    with _WorkerPool(jobs, objects) as pool:
+        futures = [pool.submit(index, _render_file, filepath, file_header, options)
+                   for index, (scad_object, filepath, file_header) in enumerate(renders)]
+
+        for (scad_object, filepath, file_header), future in zip(renders, futures):
+            if _failed(future):
+                _render_file(scad_object, filepath, file_header, options)
+
+    return [filepath for scad_object, filepath, file_header in renders]
+
+
+def _render_file(scad_object, filepath, file_header, options):
+    _replace_file(filepath, lambda f: scad_render_to_stream(scad_object, f, file_header, **options))
+
+
+class _WorkerPool(object):
+    # A process pool for rendering objects, which are sent to the workers
+    # by their index.  Where workers can be forked, they find the objects
+    # where they were left, already built, rather than having them pickled
+    # and rebuilt;  elsewhere they're pickled.
+    #
+    #   with _WorkerPool(jobs, objects) as pool:
+    #       future = pool.submit(index, function, *args)
+    #
+    # runs function(objects[index], *args) in a worker, returning a Future,
+    # or None if objects[index] can't be sent.
+    def __init__(self, jobs, objects):
+        self.objects = objects
+        self.token = None
+        self.executor = ProcessPoolExecutor(max_workers=jobs, mp_context=_fork_context)
+
+    def __enter__(self):
+        if _fork_context is not None:
+            self.token = next(_worker_tokens)
+            _worker_objects[self.token] = self.objects
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.executor.shutdown()
+        finally:
+            _worker_objects.pop(self.token, None)
+
+    def submit(self, index, function, *args):
+        if self.token is not None:
+            return self.executor.submit(_call_forked, self.token, index, function, args)
+        data = _pickled(self.objects[index])
+        if data is None:
+            return None
+        return self.executor.submit(_call_pickled, data, function, args)
+
+
+try:
+    _fork_context = multiprocessing.get_context('fork')
+except ValueError:
+    _fork_context = None
+
+# Objects forked workers can find, by _WorkerPool
+_worker_objects = {}
+_worker_tokens = itertools.count()
+
+
+def _call_forked(token, index, function, args):
+    return function(_worker_objects[token][index], *args)
+
+
+def _call_pickled(data, function, args):
+    return function(pickle.loads(data), *args)
+
+
+def _pickled(obj):
+    # obj, pickled to send to a worker, or None if it can't be:  it's too
+    # deeply nested, say, or a class from use() that workers don't have.
+    try:
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
+
+def _failed(future):
+    # Whether a worker's job wasn't sent or didn't work, so that it needs
+    # doing here instead
+    try:
+        return future is None or future.exception() is not None
+    except Exception:
+        return True
+
+
+def _render_code(scad_object, write, file_header, style, dedupe=False, cache=None, jobs=None, optimize=False):
     # Make this object the root of the tree
-    root = scad_object
+    root = _optimized(scad_object) if optimize else scad_object
 
     # Scan the tree for all instances of
-    # IncludedOpenSCADObject, storing their strings
-    include_strings = _find_include_strings(root)
+    # IncludedOpenSCADObject, storing their strings.  They have to
+    # come first, so find them all before writing any geometry
+    hole_counts, include_strings = _scan_tree(root)
 
     # and render the string
     includes = ''.join(include_strings) + "\n"
-    scad_body = root._render()
-    return file_header + includes + scad_body
+    write(file_header)
+    write(includes)
+
+    # Dedupe's modules are called from subtrees that could otherwise be
+    # cached, so the two don't mix.  The cache needs every fingerprint.
+    modules = None
+    if dedupe:
+        cache = None
+        min_nodes = dedupe_min_nodes if dedupe is True else dedupe
+        modules, definitions = _shared_subtrees(root, style, min_nodes)
+        for name, node in definitions:
+            write(style.module_open % name)
+            _drain([(_EMIT_MODULE, node, 1, False)], write, hole_counts, style, modules)
+            write(style.module_close)
+    elif cache is not None:
+        root.fingerprint()
+    elif jobs and jobs > 1:
+        runs = _parallel_chunks(root, jobs)
+        with _WorkerPool(jobs, runs) as pool:
+            # Each run is written in place of its first node, and the rest
+            # skipped
+            chunks = {}
+            for index, run in enumerate(runs):
+                chunks.update((id(node), None) for node in run[1:])
+                chunks[id(run[0])] = (run, pool.submit(index, _render_chunk, style.key))
+            _emit(root, write, hole_counts=hole_counts, style=style, chunks=chunks)
+        return
+
+    _emit(root, write, hole_counts=hole_counts, style=style, modules=modules, cache=cache)
+
+
+# Smallest subtree, in nodes, worth sending to a worker to render
+parallel_min_nodes = 32
+
+
+def _parallel_chunks(obj, jobs):
+    # The subtrees of obj to have workers render, as runs of siblings
+    # written one after another.  They're cut a few to a worker, so no one
+    # worker is left with most of the work, from subtrees without holes or
+    # parts, which render the same wherever they are.  Anything too big is
+    # split among its children, and its own code rendered here.  A run is
+    # written in place of its first node, so a node used in more than one
+    # place is only ever a run of its own.
+    sizes, plain, shared = _subtree_sizes(obj)
+    target = max(sizes[id(obj)] // (jobs * 4), parallel_min_nodes)
+    chunks = []
+    seen = set()
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+
+        run, run_size = [], 0
+        below = []
+        for child in node.children:
+            key = id(child)
+            if plain[key] and sizes[key] <= target and not shared[key]:
+                run.append(child)
+                run_size += sizes[key]
+                if run_size < target:
+                    continue
+            elif plain[key] and sizes[key] <= target:
+                if sizes[key] >= parallel_min_nodes:
+                    chunks.append((child,))
+            else:
+                below.append(child)
+            # Anything too small to be worth it is left to render here
+            if run_size >= parallel_min_nodes:
+                chunks.append(tuple(run))
+            run, run_size = [], 0
+        if run_size >= parallel_min_nodes:
+            chunks.append(tuple(run))
+        stack.extend(reversed(below))
+    return chunks
+
+
+def _render_chunk(nodes, style_key):
+    # A worker's part of rendering a tree:  a run of subtrees' code, at
+    # depth 0
+    fragments = []
+    style = _ScadStyle(*style_key)
+    for node in nodes:
+        _emit(node, fragments.append, style=style)
+    return ''.join(fragments)
+
+
+def _chunk_code(chunk, style):
+    nodes, future = chunk
+    if _failed(future):
+        return _render_chunk(nodes, style.key)
+    return future.result()
+
+
+def _subtree_sizes(obj):
+    # For every node under obj, from one walk in the manner of _scan_tree():
+    #   sizes:      {id(node): nodes in its subtree}
+    #   plain:      {id(node): whether its subtree has no holes or parts}
+    #   shared:     {id(node): whether it's a child in more than one place}
+    sizes = {id(obj): 1}
+    plain = {id(obj): _plain_node(obj)}
+    shared = {id(obj): False}
+    stack = [(obj, iter(obj.children))]
+    while stack:
+        node, children = stack[-1]
+        key = id(node)
+        for child in children:
+            child_key = id(child)
+            if child_key in sizes:
+                shared[child_key] = True
+            else:
+                sizes[child_key] = 1
+                plain[child_key] = _plain_node(child)
+                shared[child_key] = False
+                if child.children:
+                    stack.append((child, iter(child.children)))
+                    break
+            sizes[key] += sizes[child_key]
+            plain[key] = plain[key] and plain[child_key]
+        else:
+            stack.pop()
+            if stack:
+                parent_key = id(stack[-1][0])
+                sizes[parent_key] += sizes[key]
+                plain[parent_key] = plain[parent_key] and plain[key]
+    return sizes, plain, shared
+
+
+def _plain_node(node):
+    return not node.is_hole and not node.is_part_root and node.name not in non_rendered_classes
+
+
+def _emit(obj, write, depth=0, render_holes=False, hole_counts=None, style=_default_style, modules=None,
+          cache=None, chunks=None):
+    # Write obj's OpenSCAD code, in order, through write(), as it would appear
+    # nested depth levels deep.  This produces exactly what indenting
+    # obj._render() depth times would, but in a single pass: each fragment is
+    # indented once as it's written, rather than every level re-indenting
+    # (and re-copying) everything below it.  hole_counts is _scan_tree()'s
+    # for a tree including obj, if it's already at hand, style a _ScadStyle,
+    # modules _shared_subtrees()'s, if any, cache a RenderCache, if obj's
+    # fingerprint() is up to date, and chunks {id(node): (run, future)} for
+    # runs of subtrees workers are rendering, or None for the rest of a run.
+    # obj is rendered as the root, whatever else it's been added to.
+    if hole_counts is None:
+        hole_counts = _scan_tree(obj)[0]
+    _drain([(_EMIT_ROOT, obj, depth, render_holes)], write, hole_counts, style, modules, cache, chunks)
+
+
+def _drain(stack, write, hole_counts, style=_default_style, modules=None, cache=None, chunks=None):
+    # The tree is walked with an explicit stack of pending work, so that no
+    # depth of nesting can run into Python's recursion limit.  Each entry is
+    # (kind, item, depth, render_holes):  a node to expand, the root node
+    # to expand, a string to write at depth, a node to expand as part of a
+    # hole section, a node to expand as the body of its module, or (node,
+    # start) once a node being cached is done.  Other nodes in modules are
+    # written as calls to them, and those in chunks as their workers
+    # rendered them.  Compact code isn't indented at all.
+    #
+    # Nothing here changes the tree, or anything else shared between
+    # renders, other than cache, so any number of threads can render the
+    # same nodes at once.
+    indent_by = _no_indent if style.compact else _indent_by
+
+    # While a subtree is being cached, its code is held back here as
+    # (string, depth), from start on, until it's done.  Each cached subtree
+    # inside it is put back as its whole code, so no more than the
+    # outermost one's is held at once.
+    pending = []
+    caching = 0
+
+    while stack:
+        kind, item, depth, render_holes = stack.pop()
+        if kind is _EMIT_TEXT:
+            if caching:
+                pending.append((item, depth))
+            else:
+                write(indent_by(item, depth))
+        elif kind is _EMIT_HOLE_PATH:
+            stack.extend(reversed(_expand_hole_path(item, depth, hole_counts, style)))
+        elif kind is _EMIT_NODE and modules and id(item) in modules:
+            write(indent_by(style.call % modules[id(item)], depth))
+        elif kind is _EMIT_NODE and chunks and id(item) in chunks:
+            if chunks[id(item)] is not None:
+                write(indent_by(_chunk_code(chunks[id(item)], style), depth))
+        elif kind is _EMIT_CACHED:
+            node, start = item
+            code = ''.join([indent_by(s, d - depth) for s, d in pending[start:]])
+            cache.put(node._fingerprint, style, code)
+            caching -= 1
+            if caching:
+                pending[start:] = [(code, depth)]
+            else:
+                del pending[:]
+                write(indent_by(code, depth))
+        else:
+            if cache is not None and kind is not _EMIT_MODULE and item._plain:
+                code = cache.get(item._fingerprint, style)
+                if code is not None:
+                    stack.append((_EMIT_TEXT, code, depth, False))
+                    continue
+                if not cache.full:
+                    stack.append((_EMIT_CACHED, (item, len(pending)), depth, False))
+                    caching += 1
+            stack.extend(reversed(_expand(item, depth, render_holes, hole_counts, style, kind is _EMIT_ROOT)))
+
+
+_EMIT_NODE, _EMIT_ROOT, _EMIT_TEXT, _EMIT_HOLE_PATH, _EMIT_MODULE, _EMIT_CACHED = (
+    'node', 'root', 'text', 'hole path', 'module', 'cached')
+
+
+def _text(s, depth):
+    # Indented when it's written, so that text waiting on the stack, like
+    # the closing braces of every level above, takes no room for tabs
+    return (_EMIT_TEXT, s, depth, False)
+
+
+def _expand(obj, depth, render_holes, hole_counts, style, root=False):
+    # The work for one node, in order: its own code, with its children's
+    # left as entries to expand in turn.
+    work = []
+    # If this is the root object or the top of a separate part,
+    # subtract all its holes after all positive geometry
+    # is rendered.  Which node is the root is up to the render, not
+    # obj.parent, which any other tree obj is added to would change.
+    hole_children = (root or obj.is_part_root) and hole_counts[id(obj)]
+
+    if hole_children:
+        work.append(_text(style.difference, depth))
+        depth += 1
+
+    # I've added designated parts and explicit holes to SolidPython.
+    # OpenSCAD has neither, so don't render anything from these objects
+    if obj.name in non_rendered_classes:
+        work.extend(_child_work(obj, depth, render_holes))
+    elif not obj.children:
+        work.append(_text(obj._render_str_no_children(style=style) + ";", depth))
+    else:
+        work.append(_text(obj._render_str_no_children(style=style) + style.block_open, depth))
+        work.extend(_child_work(obj, depth + 1, render_holes))
+        work.append(_text(style.block_close, depth))
+
+    if hole_children:
+        work.append(_text(style.holes_below, depth))
+        work.append((_EMIT_HOLE_PATH, obj, depth, False))
+        # wrap everything in the difference
+        work.append(_text(style.holes_end, depth - 1))
+
+    return work
+
+
+def _child_work(obj, depth, render_holes):
+    # Don't immediately render hole children.
+    # Add them to the parent's hole list,
+    # And render after everything else
+    return [(_EMIT_NODE, child, depth, render_holes) for child in obj.children
+            if render_holes or not child.is_hole]
+
+
+def _expand_hole_path(obj, depth, hole_counts, style):
+    # The work for obj's part of a hole section: obj itself, rendered only
+    # for its holes and the nodes leading to them, in the same way.
+    #
+    # Holes exist in the compiled tree in two pieces:
+    # The shapes of the holes themselves, (an object for which
+    # obj.is_hole is True, and all its children) and the
+    # transforms necessary to put that hole in place, which
+    # are inherited from non-hole geometry.
+
+    # Non-hole Intersections & differences can change (shrink)
+    # the size of holes, and that shouldn't happen: an
+    # intersection/difference with an empty space should be the
+    # entirety of the empty space.
+    #  In fact, the intersection of two empty spaces should be
+    # everything contained in both of them:  their union.
+    # So... replace all super-hole intersection/diff transforms
+    # with union in the hole segment of the compiled tree.
+    # And if you figure out a better way to explain this,
+    # please, please do... because I think this works, but I
+    # also think my rationale is shaky and imprecise. 
+    # -ETJ 19 Feb 2013
+    #
+    # Only the transforms themselves are replaced, and only those leading
+    # to more than one hole; one with a single child here is that child
+    # either way.  The holes' own shapes are rendered as they are.
+    work = []
+    child_depth = depth
+    rendered = obj.name not in non_rendered_classes
+
+    if rendered:
+        name = obj.name
+        if name in hole_union_classes and hole_counts[id(obj)] > 1:
+            name = 'union'
+        work.append(_text(obj._render_str_no_children(name, style) + "{", depth))
+        child_depth += 1
+
+    for child in obj.children:
+        if child.is_hole:
+            work.append((_EMIT_NODE, child, child_depth, True))
+        # Holes under separate parts are subtracted from those parts
+        # alone, in their own hole sections
+        elif hole_counts[id(child)] and not child.is_part_root:
+            work.append((_EMIT_HOLE_PATH, child, child_depth, False))
+
+    if rendered:
+        work.append(_text(style.block_close, depth))
+
+    return work
 
 
 def scad_render_animated(func_to_animate, steps=20, back_and_forth=True, filepath=None, file_header=''):
@@ -97,7 +826,9 @@ def scad_render_animated(func_to_animate, steps=20, back_and_forth=True, filepat
                 eval_time = 2 - 2 * time
         scad_obj = func_to_animate(_time=eval_time)
 
-        scad_str = indent(scad_obj._render())
+        fragments = []
+        _emit(scad_obj, fragments.append, depth=1)
+        scad_str = ''.join(fragments)
         rendered_string += ("if ($t >= %(time)s && $t < %(end_time)s){"
                             "   %(scad_str)s\n"
                             "}\n" % vars())
@@ -108,23 +839,28 @@ def scad_render_animated_file(func_to_animate, steps=20, back_and_forth=True,
                               filepath=None, file_header='', include_orig_code=True):
     rendered_string = scad_render_animated(func_to_animate, steps, 
                                             back_and_forth, file_header)
-    return _write_code_to_file(rendered_string, filepath, include_orig_code)
+    return _write_code_to_file(lambda f: f.write(rendered_string), filepath, include_orig_code)
 
 
-def scad_render_to_file(scad_object, filepath=None, file_header='', include_orig_code=True):
-    rendered_string = scad_render(scad_object, file_header)
-    return _write_code_to_file(rendered_string, filepath, include_orig_code)
+def scad_render_to_file(scad_object, filepath=None, file_header='', include_orig_code=True,
+                        compact=False, precision=None, dedupe=False, cache=None, jobs=None, optimize=False):
+    # Stream the code straight into the file rather than rendering it to
+    # one (possibly enormous) string first.  compact, precision, dedupe,
+    # cache, jobs and optimize are as for scad_render()
+    return _write_code_to_file(lambda f: scad_render_to_stream(scad_object, f, file_header, compact, precision, dedupe,
+                                                               cache, jobs, optimize),
+                               filepath, include_orig_code)
 
 
-def _write_code_to_file(rendered_string, filepath=None, include_orig_code=True):
+def _write_code_to_file(write_code, filepath=None, include_orig_code=True):
+    # write_code(f) writes the rendered code to the open file f
+    orig_code = ''
     try:
         calling_file = os.path.abspath(calling_module(stack_depth=3).__file__)
 
         if include_orig_code:
-            rendered_string += sp_code_in_scad_comment(calling_file)
+            orig_code = sp_code_in_scad_comment(calling_file)
 
-        # This write is destructive, and ought to do some checks that the write
-        # was successful.
         # If filepath isn't supplied, place a .scad file with the same name
         # as the calling module next to it
         if not filepath:
@@ -137,12 +873,34 @@ def _write_code_to_file(rendered_string, filepath=None, include_orig_code=True):
         if not filepath:
             filepath = os.path.abspath('.') + "/solid.scad"
 
-    f = open(filepath, "w")
-    f.write(rendered_string)
-    f.close()
+    def write(f):
+        write_code(f)
+        f.write(orig_code)
+
+    _replace_file(filepath, write)
     return True
 
 
+def _replace_file(filepath, write):
+    # write(f) writes the whole of the file's new contents to f.  It's
+    # written to a temporary file alongside filepath first, which only
+    # replaces it once it's all there, so a render that fails part way
+    # leaves the file as it was.  An existing file keeps its permissions;
+    # a new one gets the usual ones.
+    directory, name = os.path.split(os.path.abspath(filepath))
+    temp_path = os.path.join(directory, '.%s.%s.tmp' % (name, uuid.uuid4().hex))
+    try:
+        with open(temp_path, 'x') as f:
+            write(f)
+        if os.path.exists(filepath):
+            shutil.copymode(filepath, temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 def sp_code_in_scad_comment(calling_file):
     # Once a SCAD file has been created, it's difficult to reconstruct
     # how it got there, since it has no variables, modules, etc.  So, include
@@ -267,12 +1025,14 @@ def new_openscad_class_str(class_name, args=[], kwargs=[], include_file_path=Non
         # https://github.com/SolidCode/SolidPython/issues/20 -ETJ 16 Jan 2014
         result = ("import solid\n"
                   "class %(class_name)s(solid.IncludedOpenSCADObject):\n"
+                  "   __slots__ = ()\n"
                   "   def __init__(self%(args_str)s, **kwargs):\n"
                   "       solid.IncludedOpenSCADObject.__init__(self, '%(class_name)s', {%(args_pairs)s }, include_file_path='%(include_file_path)s', use_not_include=%(use_not_include)s, **kwargs )\n"
                   "   \n"
                   "\n" % vars())
     else:
         result = ("class %(class_name)s(OpenSCADObject):\n"
+                  "   __slots__ = ()\n"
                   "   def __init__(self%(args_str)s):\n"
                   "       OpenSCADObject.__init__(self, '%(class_name)s', {%(args_pairs)s })\n"
                   "   \n"
@@ -283,48 +1043,333 @@ def new_openscad_class_str(class_name, args=[], kwargs=[], include_file_path=Non
 # =========================
 # = Internal Utilities    =
 # =========================
+# Guards every node's _parents, which fingerprinting in any thread can add to
+_parents_lock = threading.Lock()
+
+_unpickled_slots = frozenset(('parent', '_parents', '_fingerprint', '_plain', '__weakref__'))
+_slots_by_class = {}
+
+
+def _pickled_slots(cls):
+    # The slots of cls and its bases that __getstate__() keeps
+    names = _slots_by_class.get(cls)
+    if names is None:
+        names = [name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())
+                 if name not in _unpickled_slots]
+        names = _slots_by_class[cls] = tuple(names)
+    return names
+
+
+class _Params(dict):
+    # A node's params, once they've been asked for as a dict.  Changing them
+    # lets go of the node's fingerprint, as add_param() does.
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner, items):
+        dict.__init__(self, items)
+        self._owner = owner
+
+    def _changed(self, result=None):
+        self._owner.invalidate()
+        return result
+
+    def __setitem__(self, k, v):
+        dict.__setitem__(self, k, v)
+        self._changed()
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        self._changed()
+
+    def __ior__(self, other):
+        dict.update(self, other)
+        return self._changed(self)
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+
+    def pop(self, *args):
+        return self._changed(dict.pop(self, *args))
+
+    def popitem(self):
+        return self._changed(dict.popitem(self))
+
+    def setdefault(self, k, default=None):
+        return self._changed(dict.setdefault(self, k, default))
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._changed()
+
+    def __reduce__(self):
+        # Copied or pickled on its own, it's a plain dict
+        return dict, (dict(self),)
+
+
 class OpenSCADObject(object):
+    # Trees can run to hundreds of thousands of nodes, so nodes keep their
+    # attributes in slots rather than a __dict__.  Subclasses should declare
+    # __slots__ too, if only an empty one, or they'll get a __dict__ back.
+    __slots__ = ('name', '_params', 'children', 'modifier', 'parent', 'is_hole',
+                 'has_hole_children', 'is_part_root', '_parents', '_fingerprint',
+                 '_plain', '_frozen', '__weakref__')
 
     def __init__(self, name, params):
         self.name = name
-        self.params = params
+        # Params left as None aren't written, so they aren't kept either.
+        # The rest are kept as a flat (key, value, key, value...) tuple,
+        # which is a fraction of the size of a dict, until params is asked
+        # for.
+        items = []
+        for k, v in params.items():
+            if v is not None:
+                items += (k, v)
+        self._params = tuple(items)
         self.children = []
         self.modifier = ""
         self.parent = None
         self.is_hole = False
         self.has_hole_children = False
         self.is_part_root = False
+        # Weak references to the other nodes this has been added to that
+        # have been fingerprinted, for invalidate(); parent is only the last
+        self._parents = ()
+        self._frozen = False
+        # fingerprint(), while it's still good, and whether this subtree
+        # has no holes or parts in it
+        self._fingerprint = None
+        self._plain = False
+
+    @property
+    def params(self):
+        # The params as a dict, from here on, so it can be changed in place.
+        # A frozen node's can only be read.
+        if self._frozen:
+            return types.MappingProxyType(dict(self._param_items()))
+        if type(self._params) is not _Params:
+            self._params = _Params(self, zip(self._params[::2], self._params[1::2]))
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        self._check_not_frozen()
+        self._params = _Params(self, params)
+        self.invalidate()
+
+    def freeze(self):
+        '''
+        Make this subtree immutable, and return it.  Frozen nodes can be
+        added to any number of other nodes, but anything that would change
+        them raises a TypeError.  copy() shares frozen subtrees rather than
+        copying them, so copying one costs only as much as its top node.
+        To change something inside one, copy() it and thaw_child() your way
+        down to what's to be changed, which copies just the nodes along
+        that path.
+        '''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._frozen:
+                continue
+            node._frozen = True
+            node.children = tuple(node.children)
+            node._params = tuple(itertools.chain.from_iterable(node._param_items()))
+            # Nothing frozen is ever invalidated, so its parents needn't be
+            # kept
+            node._parents = ()
+            stack.extend(node.children)
+        return self
+
+    @property
+    def frozen(self):
+        return self._frozen
+
+    def thaw_child(self, index):
+        '''
+        Replace the child at index with a copy() of it, which can be changed
+        even if the child was frozen, and return the copy.
+        '''
+        self._check_not_frozen()
+        child = self.children[index].copy()
+        self.children[index]._drop_parent(self)
+        self.children[index] = child
+        child.set_parent(self)
+        self.invalidate()
+        return child
+
+    def _check_not_frozen(self):
+        if self._frozen:
+            raise TypeError("This %s is frozen; change a copy() of it instead" % self.name)
+
+    def _param_items(self):
+        # (key, value) for each param, without making the dict
+        if type(self._params) is _Params:
+            return self._params.items()
+        return zip(self._params[::2], self._params[1::2])
+
+    def _node_parents(self):
+        # Every node this has been added to that's still around, in order
+        parents = []
+        with _parents_lock:
+            for ref in self._parents:
+                parent = ref()
+                if parent is not None:
+                    parents.append(parent)
+        if self.parent is not None:
+            parents.append(self.parent)
+        return parents
+
+    def _add_parent(self, parent):
+        # Keep a weak reference to a node this is in besides parent, so
+        # that invalidate() can find it without keeping it alive.  Each
+        # time the list doubles, references to nodes that are gone, or
+        # that are there twice, are dropped.  Renders in other threads may
+        # be fingerprinting other parents of this node at the same time,
+        # so none can be lost.
+        with _parents_lock:
+            parents = self._parents
+            if parents and parents[-1]() is parent:
+                return
+            if not parents:
+                parents = self._parents = []
+            parents.append(weakref.ref(parent))
+            if len(parents) >= 8 and not len(parents) & (len(parents) - 1):
+                seen = set()
+                for ref in parents:
+                    node = ref()
+                    if node is not None and id(node) not in seen:
+                        seen.add(id(node))
+                        parents[len(seen) - 1] = ref
+                del parents[len(seen):]
+
+    def _drop_parent(self, parent):
+        # parent no longer holds this, so forget it, and any that are gone
+        with _parents_lock:
+            parents = [ref() for ref in self._parents]
+            parents = [node for node in parents + [self.parent] if node is not None and node is not parent]
+            self.parent = parents.pop() if parents else None
+            self._parents = [weakref.ref(node) for node in parents] if parents else ()
 
     def set_hole(self, is_hole=True):
+        self._check_not_frozen()
         self.is_hole = is_hole
+        self.invalidate()
         return self
 
     def set_part_root(self, is_root=True):
+        self._check_not_frozen()
         self.is_part_root = is_root
+        self.invalidate()
         return self
 
+    def fingerprint(self):
+        '''
+        A hash of everything about this subtree that goes into its
+        OpenSCAD code:  each node's name, params, modifier, hole and part
+        flags, and children.  Identical subtrees have the same fingerprint,
+        in this run or any other, and it's kept until something changes.
+
+        The methods that change nodes (add(), add_param(), set_hole() and
+        so on), and changes to params, let go of their nodes' fingerprints
+        and those of everything above them.  After changing children
+        directly, call invalidate().
+        '''
+        if self._fingerprint is None:
+            # Children first, with an explicit stack, skipping any that
+            # are still good
+            stack = [(self, iter(self.children))]
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    if child._fingerprint is None:
+                        stack.append((child, iter(child.children)))
+                        break
+                else:
+                    stack.pop()
+                    node._fingerprint_node()
+        return self._fingerprint
+
+    def _fingerprint_node(self):
+        # Set this node's fingerprint, once its children's are.  'segments'
+        # is written as '$fn', and None params not at all, so they're
+        # hashed that way.  Arrays are taken as lists, as py2openscad() does.
+        params = []
+        for k, v in self._param_items():
+            if v is None:
+                continue
+            if type(v) not in _literal_types and hasattr(v, 'tolist'):
+                v = v.tolist()
+            params.append(('$fn' if k == 'segments' else k, v))
+        try:
+            params.sort()
+        except TypeError:
+            # Positional (int) and named params together
+            params.sort(key=repr)
+        children = [child._fingerprint for child in self.children]
+        key = repr((self.name, self.modifier, self.is_hole, self.is_part_root, params, children))
+        # Another thread may be finding the same fingerprint, so _plain has
+        # to be right before _fingerprint is there to be seen
+        self._plain = _plain_node(self) and all(child._plain for child in self.children)
+        # Only nodes with fingerprints need to be found by invalidate(), so
+        # children added elsewhere since only learn of this one now
+        for child in self.children:
+            if child.parent is not self and not child._frozen:
+                child._add_parent(self)
+        self._fingerprint = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    def invalidate(self):
+        '''
+        Let go of the fingerprints of this node and everything above it.
+        '''
+        # A node's fingerprint is only ever found along with everything
+        # below it, so once one above us is gone, so is everything above it
+        if self._fingerprint is None:
+            return
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._fingerprint is not None:
+                node._fingerprint = None
+                stack.extend(node._node_parents())
+
     def find_hole_children(self, path=None):
         # Because we don't force a copy every time we re-use a node
         # (e.g a = cylinder(2, 6);  b = right(10) (a)
         #  the identical 'a' object appears in the tree twice),
         # we can't count on an object's 'parent' field to trace its
         # path to the root.  Instead, keep track explicitly
+        #
+        # path holds the nodes from the root down to the current child,
+        # and iterators holds where we are in each of their child lists,
+        # so that the walk needs no recursion.
         path = path if path else [self]
         hole_kids = []
+        iterators = [iter(self.children)]
+
+        while iterators:
+            child = next(iterators[-1], None)
+            if child is None:
+                iterators.pop()
+                if iterators:
+                    path.pop()
+                continue
 
-        for child in self.children:
             path.append(child)
             if child.is_hole:
                 hole_kids.append(child)
                 # Mark all parents as having a hole child
                 for p in path:
                     p.has_hole_children = True
-            # Don't append holes from separate parts below us
+            # Don't append holes from separate parts below us.
+            # (Note that this leaves the part in path, so holes found
+            # later on mark it too; rendered output depends on that.)
             elif child.is_part_root:
                 continue
             # Otherwise, look below us for children
             else:
-                hole_kids += child.find_hole_children(path)
+                iterators.append(iter(child.children))
+                continue
             path.pop()
 
         return hole_kids
@@ -341,7 +1386,9 @@ class OpenSCADObject(object):
                        '%': '%',
                        '!': '!'}
 
+        self._check_not_frozen()
         self.modifier = string_vals.get(m.lower(), '')
+        self.invalidate()
         return self
 
     def _render(self, render_holes=False):
@@ -350,114 +1397,79 @@ class OpenSCADObject(object):
         you really want scad_render(), 
         Calling obj._render won't include necessary 'use' or 'include' statements
         '''
-        # First, render all children
-        s = ""
-        for child in self.children:
-            # Don't immediately render hole children.
-            # Add them to the parent's hole list,
-            # And render after everything else
-            if not render_holes and child.is_hole:
-                continue
-            s += child._render(render_holes)
-
-        # Then render self and prepend/wrap it around the children
-        # I've added designated parts and explicit holes to SolidPython.
-        # OpenSCAD has neither, so don't render anything from these objects
-        if self.name in non_rendered_classes:
-            pass
-        elif not self.children:
-            s = self._render_str_no_children() + ";"
-        else:
-            s = self._render_str_no_children() + " {" + indent(s) + "\n}"
-
-        # If this is the root object or the top of a separate part,
-        # find all holes and subtract them after all positive geometry
-        # is rendered
-        if (not self.parent) or self.is_part_root:
-            hole_children = self.find_hole_children()
-
-            if len(hole_children) > 0:
-                s += "\n/* Holes Below*/"
-                s += self._render_hole_children()
-
-                # wrap everything in the difference
-                s = "\ndifference(){" + indent(s) + " /* End Holes */ \n}"
-        return s
-
-    def _render_str_no_children(self):
-        s = "\n" + self.modifier + self.name + "("
+        fragments = []
+        _emit(self, fragments.append, render_holes=render_holes)
+        return ''.join(fragments)
+
+    def _render_str_no_children(self, name=None, style=None):
+        # name, if given, is rendered in place of self.name, and style is
+        # the _ScadStyle to write it in
+        style = style or _default_style
+        s = style.newline + self.modifier + (name or self.name) + "("
         first = True
 
         # OpenSCAD doesn't have a 'segments' argument, but it does
-        # have '$fn'.  Swap one for the other
-        if 'segments' in self.params:
-            self.params['$fn'] = self.params.pop('segments')
-
-        valid_keys = self.params.keys()
-
-        # intkeys are the positional parameters
-        intkeys = list(filter(lambda x: type(x) == int, valid_keys))
-        intkeys.sort()
-
-        # named parameters
-        nonintkeys = list(filter(lambda x: not type(x) == int, valid_keys))
-        all_params_sorted = intkeys + nonintkeys
-        if all_params_sorted:
-            all_params_sorted = sorted(all_params_sorted)
+        # have '$fn'.  Swap one for the other, and let 'segments' win
+        # if there are both
+        params = {}
+        for k, v in self._param_items():
+            if k == 'segments':
+                k = '$fn'
+            elif k == '$fn' and '$fn' in params:
+                continue
+            params[k] = v
 
-        for k in all_params_sorted:
-            v = self.params[k]
-            if v == None:
+        for k in sorted(params):
+            v = params[k]
+            if v is None:
                 continue
 
             if not first:
-                s += ", "
+                s += style.separator
             first = False
 
             if type(k) == int:
-                s += py2openscad(v)
+                s += py2openscad(v, style)
             else:
-                s += k + " = " + py2openscad(v)
+                s += k + style.assign + py2openscad(v, style)
 
         s += ")"
         return s
 
-    def _render_hole_children(self):
+    def __getstate__(self):
+        # Pickle a subtree without the nodes it's been added to, which would
+        # otherwise take the whole tree along, or anything else that's only
+        # bookkeeping.  Subclasses may have slots of their own, or a
+        # __dict__.
+        state = dict(getattr(self, '__dict__', {}))
+        for name in _pickled_slots(type(self)):
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        if type(self._params) is _Params:
+            state['_params'] = tuple(itertools.chain.from_iterable(self._params.items()))
+        return state
+
+    def __setstate__(self, state):
+        # Children are unpickled first, so they can be given their parent
+        # back here
+        self.parent = None
+        self._parents = ()
+        self._fingerprint = None
+        self._plain = False
+        for name, value in state.items():
+            setattr(self, name, value)
+        for child in self.children:
+            child.set_parent(self)
+
+    def _render_hole_children(self, depth=0):
         # Run down the tree, rendering only those nodes
         # that are holes or have holes beneath them
-        if not self.has_hole_children:
+        hole_counts = _scan_tree(self)[0]
+        if not hole_counts[id(self)]:
             return ""
-        s = ""
-        for child in self.children:
-            if child.is_hole:
-                s += child._render(render_holes=True)
-            elif child.has_hole_children:
-                # Holes exist in the compiled tree in two pieces:
-                # The shapes of the holes themselves, (an object for which
-                # obj.is_hole is True, and all its children) and the
-                # transforms necessary to put that hole in place, which
-                # are inherited from non-hole geometry.
-
-                # Non-hole Intersections & differences can change (shrink)
-                # the size of holes, and that shouldn't happen: an
-                # intersection/difference with an empty space should be the
-                # entirety of the empty space.
-                #  In fact, the intersection of two empty spaces should be
-                # everything contained in both of them:  their union.
-                # So... replace all super-hole intersection/diff transforms
-                # with union in the hole segment of the compiled tree.
-                # And if you figure out a better way to explain this,
-                # please, please do... because I think this works, but I
-                # also think my rationale is shaky and imprecise. 
-                # -ETJ 19 Feb 2013
-                s = s.replace("intersection", "union")
-                s = s.replace("difference", "union")
-                s += child._render_hole_children()
-        if self.name in non_rendered_classes:
-            pass
-        else:
-            s = self._render_str_no_children() + "{" + indent(s) + "\n}"
-        return s
+        fragments = []
+        _drain([(_EMIT_HOLE_PATH, self, depth, False)], fragments.append, hole_counts)
+        return ''.join(fragments)
 
     def add(self, child):
         '''
@@ -474,17 +1486,30 @@ class OpenSCADObject(object):
                 child = child[0]
             [self.add(c) for c in child]
         else:
+            if self._frozen:
+                self._check_not_frozen()
             self.children.append(child)
             child.set_parent(self)
+            if self._fingerprint is not None:
+                self.invalidate()
         return self
 
     def set_parent(self, parent):
+        # The parent being replaced is only kept if it has a fingerprint
+        # that invalidate() would need to let go of
+        old = self.parent
+        if old is not None and old is not parent and old._fingerprint is not None and not self._frozen:
+            self._add_parent(old)
         self.parent = parent
 
     def add_param(self, k, v):
+        self._check_not_frozen()
         if k == '$fn':
             k = 'segments'
-        self.params[k] = v
+        if v is None:
+            self.params.pop(k, None)
+        else:
+            self.params[k] = v
         return self
 
     def copy(self):
@@ -494,21 +1519,38 @@ class OpenSCADObject(object):
         to a different tree
         Initialize an instance of this class with the same params
         that created self, the object being copied.
+        Frozen subtrees below self are shared rather than copied, and the
+        copy itself is never frozen.
         '''
 
+        # Copy top-down with an explicit stack of (original, parent of
+        # its copy), so that no depth of nesting can run into Python's
+        # recursion limit.
+        root = self._copy_node()
+        stack = [(c, root) for c in reversed(self.children)]
+        while stack:
+            original, parent = stack.pop()
+            if original._frozen:
+                parent.add(original)
+                continue
+            other = original._copy_node()
+            parent.add(other)
+            stack.extend((c, other) for c in reversed(original.children))
+        return root
+
+    def _copy_node(self):
+        # A copy of this object alone, without its children
+
         # Python can't handle an '$fn' argument, while openSCAD only wants
         # '$fn'.  Swap back and forth as needed; the final renderer will
         # sort this out.
-        if '$fn' in self.params:
-            self.params['segments'] = self.params.pop('$fn')
+        params = dict(('segments' if k == '$fn' else k, v) for k, v in self._param_items())
 
-        other = type(self)(**self.params)
+        other = type(self)(**params)
         other.set_modifier(self.modifier)
         other.set_hole(self.is_hole)
         other.set_part_root(self.is_part_root)
         other.has_hole_children = self.has_hole_children
-        for c in self.children:
-            other.add(c.copy())
         return other
 
     def __call__(self, *args):
@@ -576,6 +1618,7 @@ class IncludedOpenSCADObject(OpenSCADObject):
     # Identical to OpenSCADObject, but each subclass of IncludedOpenSCADObject
     # represents imported scad code, so each instance needs to store the path
     # to the scad file it's included from.
+    __slots__ = ('include_file_path', 'include_string')
 
     def __init__(self, name, params, include_file_path, use_not_include=False, **kwargs):
         self.include_file_path = self._get_include_path(include_file_path)
@@ -609,26 +1652,76 @@ class IncludedOpenSCADObject(OpenSCADObject):
 
 # now that we have the base class defined, we can do a circular import
 from . import objects
+from .optimize import optimize as _optimized
 
-def py2openscad(o):
+def py2openscad(o, style=None):
+    # style, if given, is the _ScadStyle to write o in
+    style = style or _default_style
     if type(o) == bool:
         return str(o).lower()
     if type(o) == float:
-        return "%.10f" % o
+        return style.number(o)
     if type(o) == list or type(o) == tuple:
-        s = "["
-        first = True
-        for i in o:
-            if not first:
-                s += ", "
-            first = False
-            s += py2openscad(i)
-        s += "]"
+        s = _numeric_sequence(o, style)
+        if s is None:
+            s = "[" + style.separator.join([py2openscad(i, style) for i in o]) + "]"
         return s
     if type(o) == str:
         return '"' + o + '"'
+    # NumPy arrays and scalars, array.array, etc.  These are taken as
+    # they are rather than requiring NumPy here.
+    if hasattr(o, 'tolist'):
+        return py2openscad(o.tolist(), style)
     return str(o)
 
 
+def _numeric_sequence(o, style=None):
+    # py2openscad(o, style) for a list or tuple of numbers, or of lists or
+    # tuples of numbers, like polyhedron points and faces, in a single
+    # formatting operation rather than one per element.  None for anything
+    # else.
+    style = style or _default_style
+    number_formats = style.number_formats
+    separator = style.separator
+    types = set(map(type, o))
+    if types <= _numbers:
+        values = o
+        template = "[" + separator.join([number_formats[type(v)] for v in o]) + "]"
+    elif types <= _sequences:
+        values = list(itertools.chain.from_iterable(o))
+        value_types = set(map(type, values))
+        if not value_types <= _numbers:
+            return None
+        lengths = set(map(len, o))
+        if len(value_types) == 1 and len(lengths) == 1:
+            # Every row alike, the usual case
+            value_format = number_formats[value_types.pop()]
+            row = "[" + separator.join([value_format] * lengths.pop()) + "]"
+            template = "[" + separator.join([row] * len(o)) + "]"
+        else:
+            template = "[" + separator.join(["[" + separator.join([number_formats[type(v)] for v in row]) + "]"
+                                             for row in o]) + "]"
+    else:
+        return None
+    return style.numbers(template % tuple(values))
+
+
+_numbers = frozenset([float, int])
+_sequences = frozenset([list, tuple])
+# Param values that repr() in full, as they're written
+_literal_types = frozenset([bool, int, float, str, list, tuple])
+
+
 def indent(s):
     return s.replace("\n", "\n\t")
+
+
+def _indent_by(s, depth):
+    # Same as applying indent() depth times
+    if not depth:
+        return s
+    return s.replace("\n", "\n" + "\t" * depth)
+
+
+def _no_indent(s, depth):
+    return s
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+# -*- coding: UTF-8 -*-
+import os
+import tempfile
+import unittest
+
+from solid.test.ExpandedTestCase import DiffOutput
+from solid import *
+from solid.geometry2d import evaluate_2d
+from solid.export2d import outline_segments, dxf_string, svg_string, write_dxf
+
+
+def segment_kinds(region):
+    return [segment[0] for outline in region for segment in outline_segments(outline)]
+
+
+class TestExport2D(DiffOutput):
+
+    def test_square_lines(self):
+        self.assertEqual(['line'] * 4, segment_kinds(evaluate_2d(square(2))))
+
+    def test_circle(self):
+        region = evaluate_2d(translate([5, 5])(circle(r=1.5, segments=20)))
+        self.assertEqual([('circle', (5, 5), 1.5)], list(outline_segments(region.outlines[0])))
+
+    def test_hexagon_stays_polygon(self):
+        self.assertEqual(['line'] * 6, segment_kinds(evaluate_2d(circle(r=1.5, segments=6))))
+
+    def test_rounded_corners(self):
+        region = evaluate_2d(offset(r=3)(square(10)))
+        self.assertEqual(['arc'] * 4 + ['line'] * 4, sorted(segment_kinds(region)))
+        for segment in outline_segments(region.outlines[0]):
+            if segment[0] == 'arc':
+                self.assertAlmostEqual(90, segment[5])
+
+    def test_circular_hole_arcs(self):
+        # A circle cut through the edge of a square leaves an arc, running
+        # clockwise around its center
+        region = evaluate_2d(difference()(square(10), translate([10, 5])(circle(r=2, segments=40))))
+        arcs = [s for o in region for s in outline_segments(o) if s[0] == 'arc']
+        self.assertEqual(1, len(arcs))
+        self.assertAlmostEqual(-180, arcs[0][5])
+
+    def test_dxf(self):
+        actual = dxf_string(evaluate_2d(difference()(square(10), translate([5, 5])(circle(r=2, segments=40)))))
+        self.assertEqual(4, actual.count('\nLINE\n'))
+        self.assertEqual(1, actual.count('\nCIRCLE\n'))
+        self.assertTrue(actual.endswith('  0\nEOF\n'))
+
+    def test_dxf_arc_angles(self):
+        actual = dxf_string(evaluate_2d(intersection()(circle(r=2, segments=40), square(2))))
+        self.assertTrue(' 50\n0.0\n 51\n90.0\n' in actual)
+
+    def test_svg(self):
+        expected = '<path fill="none" stroke="black" stroke-width="0.1" d="M 0.0 2.0 L 2.0 2.0 L 2.0 0.0 L 0.0 0.0 L 0.0 2.0 Z"/>'
+        actual = svg_string(evaluate_2d(square(2)))
+        self.assertTrue('width="2.0mm" height="2.0mm"' in actual)
+        self.assertTrue(expected in actual, actual)
+
+    def test_write_dxf(self):
+        tmp = tempfile.NamedTemporaryFile(suffix='.dxf', delete=False)
+        tmp.close()
+        region = evaluate_2d(square(2))
+        write_dxf(region, tmp.name)
+        with open(tmp.name) as f:
+            actual = f.read()
+        os.unlink(tmp.name)
+        self.assertEqual(dxf_string(region), actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+# -*- coding: UTF-8 -*-
+import math
+import sys
+import unittest
+
+from solid.test.ExpandedTestCase import DiffOutput
+from solid import *
+from solid.geometry2d import evaluate_2d
+
+
+class TestGeometry2D(DiffOutput):
+
+    def assertBounds(self, region, expected):
+        for actual, wanted in zip(region.bounds(), expected):
+            self.assertAlmostEqual(actual, wanted, places=6)
+
+    def test_square(self):
+        region = evaluate_2d(square([4, 2], center=True))
+        self.assertEqual(1, len(region))
+        self.assertAlmostEqual(8, region.area())
+        self.assertBounds(region, (-2, -1, 2, 1))
+
+    def test_circle_fragments(self):
+        # $fn given, and OpenSCAD's $fa/$fs defaults without it
+        self.assertEqual(12, len(evaluate_2d(circle(r=5, segments=12)).outlines[0]))
+        self.assertEqual(16, len(evaluate_2d(circle(r=5)).outlines[0]))
+        self.assertEqual(5, len(evaluate_2d(circle(r=0.5)).outlines[0]))
+        self.assertEqual(30, len(evaluate_2d(circle(d=40)).outlines[0]))
+        # d wins over r, as in OpenSCAD
+        self.assertBounds(evaluate_2d(circle(r=5, d=4, segments=4)), (-2, -2, 2, 2))
+
+    def test_circle_arcs(self):
+        outline = evaluate_2d(translate([3, 4])(circle(r=2, segments=8))).outlines[0]
+        for arc in outline.arcs:
+            self.assertAlmostEqual(3, arc[0])
+            self.assertAlmostEqual(4, arc[1])
+            self.assertAlmostEqual(2, arc[2])
+
+    def test_union_overlapping(self):
+        region = evaluate_2d(union()(square(2), translate([1, 1])(square(2))))
+        self.assertEqual(1, len(region))
+        self.assertEqual(8, len(region.outlines[0]))
+        self.assertAlmostEqual(7, region.area())
+
+    def test_union_touching_edges(self):
+        region = evaluate_2d(union()(square(2), translate([2, 0])(square(2))))
+        self.assertEqual(1, len(region))
+        self.assertEqual(4, len(region.outlines[0]))
+        self.assertAlmostEqual(8, region.area())
+
+    def test_union_disjoint(self):
+        region = evaluate_2d(union()(square(1), translate([5, 0])(square(1))))
+        self.assertEqual(2, len(region))
+        self.assertAlmostEqual(2, region.area())
+
+    def test_difference_hole(self):
+        region = evaluate_2d(difference()(square(10), translate([2, 2])(square(2))))
+        self.assertEqual(2, len(region))
+        self.assertEqual([False, True], [o.is_hole() for o in region])
+        self.assertAlmostEqual(96, region.area())
+
+    def test_difference_through_edge(self):
+        region = evaluate_2d(difference()(square(10), translate([-1, 4])(square([12, 2]))))
+        self.assertEqual(2, len(region))
+        self.assertAlmostEqual(80, region.area())
+
+    def test_intersection(self):
+        region = evaluate_2d(intersection()(square(4), translate([2, 3])(square(4))))
+        self.assertAlmostEqual(2, region.area())
+        self.assertBounds(region, (2, 3, 4, 4))
+
+    def test_intersection_disjoint(self):
+        region = evaluate_2d(intersection()(square(1), translate([5, 5])(square(1))))
+        self.assertTrue(region.is_empty())
+
+    def test_rotate(self):
+        region = evaluate_2d(rotate(90)(square([4, 2])))
+        self.assertBounds(region, (-2, 0, 0, 4))
+        self.assertAlmostEqual(8, region.area())
+
+    def test_mirror_keeps_orientation(self):
+        region = evaluate_2d(mirror([1, 0, 0])(translate([1, 0])(square(2))))
+        self.assertBounds(region, (-3, 0, -1, 2))
+        self.assertAlmostEqual(4, region.area())
+
+    def test_polygon_paths(self):
+        points = [[0, 0], [10, 0], [10, 10], [0, 10], [2, 2], [8, 2], [8, 8], [2, 8]]
+        region = evaluate_2d(polygon(points, paths=[[0, 1, 2, 3], [4, 5, 6, 7]]))
+        self.assertEqual(2, len(region))
+        self.assertAlmostEqual(64, region.area())
+
+    def test_polygon_self_intersecting(self):
+        # A bow tie is two triangles
+        region = evaluate_2d(polygon([[0, 0], [2, 2], [2, 0], [0, 2]]))
+        self.assertEqual(2, len(region))
+        self.assertAlmostEqual(2, region.area())
+
+    def test_numeric_arrays(self):
+        class AmbiguousVector(list):
+            # Converts to bool ambiguously, like a NumPy array
+            def __bool__(self):
+                raise ValueError
+
+        region = evaluate_2d(translate(AmbiguousVector([3, 4]))(mirror(AmbiguousVector([1, 0, 0]))(square(1))))
+        self.assertBounds(region, (2, 4, 3, 5))
+
+    def test_offset_delta(self):
+        self.assertAlmostEqual(16, evaluate_2d(offset(delta=1)(square(2))).area())
+        self.assertAlmostEqual(14, evaluate_2d(offset(delta=1, chamfer=True)(square(2))).area())
+        self.assertAlmostEqual(4, evaluate_2d(offset(delta=-1)(square(4))).area())
+
+    def test_offset_round(self):
+        # Rounded corners are chords of a circle of radius 1
+        region = evaluate_2d(offset(r=1)(square(2)))
+        self.assertTrue(12 < region.area() < 12 + math.pi)
+        self.assertTrue(any(arc is not None for arc in region.outlines[0].arcs))
+
+    def test_offset_round_inward(self):
+        region = evaluate_2d(offset(r=-1)(square(4)))
+        self.assertAlmostEqual(4, region.area())
+
+    def test_modifiers(self):
+        region = evaluate_2d(union()(square(1), debug(translate([2, 0])(square(1))),
+                                     background(translate([4, 0])(square(1))), disable(translate([6, 0])(square(1)))))
+        self.assertAlmostEqual(2, region.area())
+
+    def test_holes_and_parts(self):
+        # Holes are cut from everything at the root, as scad_render() writes it
+        self.assertAlmostEqual(12, evaluate_2d(translate([1, 0])(square(4), hole()(square(2)))).area())
+        self.assertAlmostEqual(15, evaluate_2d(union()(part()(square(4)), hole()(square(1)))).area())
+        # while a part's own holes are cut from it alone
+        self.assertAlmostEqual(16, evaluate_2d(union()(part()(square(4), hole()(square(1))), square([1, 4]))).area())
+
+    def test_deep_tree(self):
+        # Nested far deeper than Python's recursion limit
+        depth = 5 * sys.getrecursionlimit()
+        chain = square(1)
+        nested = square(1)
+        for i in range(depth):
+            chain = chain + square(1)
+            nested = translate([1, 0])(nested)
+
+        self.assertAlmostEqual(1, evaluate_2d(chain).area())
+        self.assertBounds(evaluate_2d(nested), (depth, 0, depth + 1, 1))
+
+    def test_3d_not_supported(self):
+        self.assertRaises(ValueError, evaluate_2d, union()(square(1), cube(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
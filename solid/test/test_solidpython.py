@@ -3,6 +3,7 @@
 import os
 import sys
 import re
+import shutil
 
 import unittest
 import tempfile
@@ -223,6 +224,355 @@ class TestSolidPython(DiffOutput):
         actual = scad_render(a)
         self.assertEqual(expected, actual)
 
+    def test_separate_part_hole_with_outer_hole(self):
+        # The part's hole shouldn't also be cut from everything else when
+        # the whole model has holes of its own
+        p1 = part()(cube(10, center=True) - hole()(cylinder(r=2, h=12, center=True)))
+        p2 = cylinder(r=1.5, h=14, center=True)
+        a = union()(p1, p2, hole()(sphere(1)))
+
+        expected = '\n\ndifference(){\n\tunion() {\n\t\tdifference(){\n\t\t\tdifference() {\n\t\t\t\tcube(center = true, size = 10);\n\t\t\t}\n\t\t\t/* Holes Below*/\n\t\t\tdifference(){\n\t\t\t\tcylinder(center = true, h = 12, r = 2);\n\t\t\t} /* End Holes */ \n\t\t}\n\t\tcylinder(center = true, h = 14, r = 1.5000000000);\n\t}\n\t/* Holes Below*/\n\tunion(){\n\t\tsphere(r = 1);\n\t} /* End Holes */ \n}'
+        actual = scad_render(a)
+        self.assertEqual(expected, actual)
+
+        # Rendering leaves the tree as it was
+        self.assertFalse(any(node.has_hole_children for node in (a, p1, p2)))
+        self.assertEqual(expected, scad_render(a))
+
+    def test_hole_unions(self):
+        # Differences and intersections leading to several holes become
+        # unions in the hole section, so no hole cuts another.  The holes'
+        # own shapes, and any text in them, are left alone.
+        notch = hole()(difference()(cube(3), text("difference")))
+        a = cube(10) - notch - translate([5, 0, 0])(hole()(cube(1)))
+
+        expected = '\n\ndifference(){\n\tdifference() {\n\t\tdifference() {\n\t\t\tcube(size = 10);\n\t\t}\n\t\ttranslate(v = [5, 0, 0]) {\n\t\t}\n\t}\n\t/* Holes Below*/\n\tunion(){\n\t\tdifference(){\n\t\t\tdifference() {\n\t\t\t\tcube(size = 3);\n\t\t\t\ttext(text = "difference");\n\t\t\t}\n\t\t}\n\t\ttranslate(v = [5, 0, 0]){\n\t\t\tcube(size = 1);\n\t\t}\n\t} /* End Holes */ \n}'
+        actual = scad_render(a)
+        self.assertEqual(expected, actual)
+
+    def test_numeric_arrays(self):
+        from solid.solidpython import py2openscad
+        self.assertEqual('[[0.5000000000, 1], [2, 3.0000000000, 4]]', py2openscad([(0.5, 1), [2, 3.0, 4]]))
+        self.assertEqual('[[1, 2, 3], [4, 5, 6]]', py2openscad(((1, 2, 3), (4, 5, 6))))
+        self.assertEqual('[1, true, [], "a"]', py2openscad([1, True, [], 'a']))
+
+        # Anything with tolist(), like NumPy arrays and array.array, is
+        # taken as a list
+        import array
+        class FakeArray(object):
+            # Compares and converts to bool ambiguously, like a NumPy array
+            def __eq__(self, other):
+                raise ValueError
+
+            def __bool__(self):
+                raise ValueError
+
+            def __len__(self):
+                return 2
+
+            def tolist(self):
+                return [[0.0, 1.0], [2.0, 3.0]]
+
+        expected = '\n\npolygon(paths = [[0, 1]], points = [[0.0000000000, 1.0000000000], [2.0000000000, 3.0000000000]]);'
+        actual = scad_render(polygon(points=FakeArray()))
+        self.assertEqual(expected, actual)
+
+        expected = '\n\ntranslate(v = [1.0000000000, 2.0000000000, 0.0000000000]);'
+        actual = scad_render(translate(array.array('d', [1, 2, 0])))
+        self.assertEqual(expected, actual)
+
+    def test_compact(self):
+        a = translate([19.05, 0.1 + 0.2, -0.0])(
+                cube([1.5, 2, 1e-7]) - hole()(cylinder(r=2.0, h=3, segments=20)),
+                text("a, b = 1.50"))
+
+        expected = '\ndifference(){translate(v=[19.05,0.30000000000000004,0]){difference(){cube(size=[1.5,2,1e-07]);}text(text="a, b = 1.50");}translate(v=[19.05,0.30000000000000004,0]){difference(){cylinder($fn=20,h=3,r=2);}}}'
+        actual = scad_render(a, compact=True)
+        self.assertEqual(expected, actual)
+
+        expected = '\ndifference(){translate(v=[19.05,0.3,0]){difference(){cube(size=[1.5,2,0]);}text(text="a, b = 1.50");}translate(v=[19.05,0.3,0]){difference(){cylinder($fn=20,h=3,r=2);}}}'
+        actual = scad_render(a, compact=True, precision=3)
+        self.assertEqual(expected, actual)
+
+        expected = '\n\ncube(size = [1.500, 2, 0.000]);'
+        actual = scad_render(cube([1.5, 2, 1e-7]), precision=3)
+        self.assertEqual(expected, actual)
+
+        self.assertRaises(ValueError, scad_render, a, precision=-1)
+
+    def test_dedupe(self):
+        # The same node reused, and identical copies of it, are written once
+        # as a module.  The rotate() inside it is only written out once
+        # there, so it isn't a module of its own.  Subtrees with holes in
+        # them aren't shared.
+        leg = translate([1, 2, 0])(rotate(30)(cube([1, 2, 3]), sphere(1)))
+        notched = cube(1) - hole()(cylinder(r=0.5, h=2))
+        a = union()(leg, translate([5, 0, 0])(leg.copy()), translate([9, 0, 0])(leg), notched, notched.copy())
+
+        expected = ('\n'
+                    '\nmodule solid_subtree_0() {\n\ttranslate(v = [1, 2, 0]) {\n\t\trotate(a = 30) {\n\t\t\tcube(size = [1, 2, 3]);\n\t\t\tsphere(r = 1);\n\t\t}\n\t}\n}\n'
+                    '\ndifference(){\n\tunion() {\n\t\tsolid_subtree_0();\n\t\ttranslate(v = [5, 0, 0]) {\n\t\t\tsolid_subtree_0();\n\t\t}\n\t\ttranslate(v = [9, 0, 0]) {\n\t\t\tsolid_subtree_0();\n\t\t}'
+                    '\n\t\tdifference() {\n\t\t\tcube(size = 1);\n\t\t}\n\t\tdifference() {\n\t\t\tcube(size = 1);\n\t\t}\n\t}'
+                    '\n\t/* Holes Below*/\n\tunion(){\n\t\tdifference(){\n\t\t\tcylinder(h = 2, r = 0.5000000000);\n\t\t}\n\t\tdifference(){\n\t\t\tcylinder(h = 2, r = 0.5000000000);\n\t\t}\n\t} /* End Holes */ \n}')
+        actual = scad_render(a, dedupe=True)
+        self.assertEqual(expected, actual)
+
+        expected = '\nmodule solid_subtree_0(){rotate(a=30){cube(size=[1,2,3]);sphere(r=1);}}translate(v=[1,0,0]){solid_subtree_0();solid_subtree_0();}'
+        actual = scad_render(translate([1, 0, 0])(rotate(30)(cube([1, 2, 3]), sphere(1)), rotate(30)(cube([1, 2, 3]), sphere(1))),
+                             compact=True, dedupe=3)
+        self.assertEqual(expected, actual)
+
+        # Too small to be worth a module
+        self.assertEqual(scad_render(a), scad_render(a, dedupe=5))
+        self.assertNotIn('module', scad_render(union()(cube(1), cube(1)), dedupe=True))
+
+    def test_fingerprint(self):
+        a = translate([1, 2, 0])(cylinder(r=1, h=2, segments=12))
+        b = a.copy()
+        self.assertEqual(a.fingerprint(), b.fingerprint())
+        self.assertEqual(a.fingerprint(), translate([1, 2, 0])(cylinder(r=1, h=2, r1=None).add_param('$fn', 12)).fingerprint())
+
+        # Any change is seen all the way up, through every parent
+        u = union()(a, rotate(45)(a))
+        before = u.fingerprint()
+        a.children[0].set_modifier('#')
+        self.assertNotEqual(before, u.fingerprint())
+        self.assertNotEqual(b.fingerprint(), a.fingerprint())
+
+        # Other parents are reached while they're around, but not kept alive
+        import gc, weakref
+        c = cube(1)
+        uses = [translate([i, 0, 0])(c) for i in range(3)]
+        before = [u.fingerprint() for u in uses]
+        gone = weakref.ref(uses.pop(0))
+        gc.collect()
+        self.assertIsNone(gone())
+        c.set_modifier('#')
+        self.assertEqual([], [u for u, f in zip(uses, before[1:]) if u.fingerprint() == f])
+
+        # Parents fingerprinted before or after the node is added elsewhere
+        early = union()(c)
+        uses.append(translate([9, 0, 0])(c))
+        uses.append(early)
+        before = [u.fingerprint() for u in uses]
+        c.set_modifier('')
+        self.assertEqual([], [u for u, f in zip(uses, before) if u.fingerprint() == f])
+
+        # Params changed in place too, even through a dict kept from earlier
+        params = b.params
+        for change in (lambda: b.add(cube(1)), lambda: b.set_hole(), lambda: b.add_param('v', [1, 2, 0.5]),
+                       lambda: b.params.update(v=[0, 0, 1]), lambda: params.__setitem__('v', [3, 0, 0]),
+                       lambda: params.pop('v')):
+            before = b.fingerprint()
+            change()
+            self.assertNotEqual(before, b.fingerprint())
+
+        # 1 and 1.0 are written differently
+        self.assertNotEqual(cube(1).fingerprint(), cube(1.0).fingerprint())
+
+    def test_render_cache(self):
+        def tree():
+            leg = translate([1, 2, 0])(rotate(30)(cube([1, 2, 3]), sphere(1)))
+            return union()(leg, translate([5, 0, 0])(leg), cube(4) - hole()(translate([1, 0, 0])(cylinder(r=1, h=5))))
+
+        a = tree()
+        expected = scad_render(a)
+        cache = RenderCache()
+        self.assertEqual(expected, scad_render(a, cache=cache))
+        # The second time, the whole of every subtree cached is reused
+        misses = cache.misses
+        self.assertEqual(expected, scad_render(a, cache=cache))
+        self.assertEqual(misses, cache.misses)
+
+        # Each style is cached separately
+        self.assertEqual(scad_render(a, compact=True), scad_render(a, compact=True, cache=cache))
+
+        # Changing a subtree used in two places renders the new one in both
+        a.children[0].children[0].add(cylinder(r=1, h=1))
+        self.assertEqual(scad_render(a), scad_render(a, cache=cache))
+        self.assertEqual(2, scad_render(a, cache=cache).count('cylinder(h = 1, r = 1)'))
+
+        # Parents of one subtree fingerprinted by renders in several threads
+        # at once are all let go of when it changes
+        from concurrent.futures import ThreadPoolExecutor
+        shared = cube(3)
+        parents = [translate([i, 0, 0])(shared) for i in range(200)]
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda p: scad_render(p, cache=cache), parents))
+        before = [p.fingerprint() for p in parents]
+        shared.add_param('size', 4)
+        self.assertEqual([], [p for p, f in zip(parents, before) if p.fingerprint() == f])
+
+        # Saved and loaded again, for an identical tree built afresh
+        with TemporaryFileBuffer() as tmp:
+            cache.save(tmp.name)
+            loaded = RenderCache(tmp.name)
+        self.assertEqual(expected, scad_render(tree(), cache=loaded))
+        self.assertTrue(loaded.hits)
+        self.assertEqual(0, loaded.misses)
+
+    def test_compact_geometry(self):
+        # Compact code has every number the default code does, in the same
+        # order, equal to within the precision
+        import random
+        rand = random.Random(17)
+        points = [[rand.uniform(-1000, 1000) for i in range(3)] for j in range(50)]
+        a = union()(polyhedron(points=points, faces=[[0, 1, 2]]),
+                    rotate(a=rand.uniform(0, 360))(sphere(rand.random() * 1e-3)),
+                    scale([1e6, -0.0, 1])(cube(1)))
+
+        number = re.compile(r'-?\d+(?:\.\d*)?(?:e[-+]?\d+)?')
+        default = [float(n) for n in number.findall(scad_render(a))]
+        exact = [float(n) for n in number.findall(scad_render(a, compact=True))]
+        self.assertEqual(len(default), len(exact))
+        for n, m in zip(default, exact):
+            self.assertAlmostEqual(n, m, places=10)
+
+        for precision in (0, 3, 6, 10):
+            rounded = [float(n) for n in number.findall(scad_render(a, compact=True, precision=precision))]
+            self.assertEqual(len(exact), len(rounded))
+            for n, m in zip(exact, rounded):
+                self.assertLessEqual(abs(n - m), 0.5 * 10 ** -precision + 1e-9 * abs(n))
+
+    def test_parallel_render(self):
+        keys = [translate([i, i % 7, 0])(rotate(i)(cube([1, 2, 3]), sphere(1))) for i in range(100)]
+        a = union()(hole()(cylinder(r=1, h=5)), *keys)
+        a = a + part()(translate([0, 0, 10])(*keys[:40]))
+        for compact in (False, True):
+            self.assertEqual(scad_render(a, compact=compact), scad_render(a, compact=compact, jobs=2))
+
+        # Each file the same as it would be written on its own
+        renders = [(a, tempfile.mktemp()), (keys[0], tempfile.mktemp(), '$fn = 12;')]
+        try:
+            self.assertEqual([r[1] for r in renders], scad_render_to_files(renders, jobs=2))
+            for render in renders:
+                with TemporaryFileBuffer() as tmp:
+                    scad_render_to_file(render[0], tmp.name, *render[2:], include_orig_code=False)
+                with open(render[1]) as f:
+                    self.assertEqual(tmp.contents, f.read())
+        finally:
+            for render in renders:
+                os.remove(render[1])
+
+    def test_compact_nodes(self):
+        import pickle
+        a = circle(r=2, segments=8)
+        self.assertFalse(hasattr(a, '__dict__'))
+        # Unset params aren't kept, but the rest are there as before
+        self.assertEqual({'r': 2, 'segments': 8}, a.params)
+        a.params['d'] = 3
+        a.add_param('r', None)
+        self.assertEqual('\n\ncircle($fn = 8, d = 3);', scad_render(a))
+
+        b = union()(translate([1, 0, 0])(a), a)
+        c = pickle.loads(pickle.dumps(b))
+        self.assertEqual(scad_render(b), scad_render(c))
+        self.assertEqual(scad_render(b), scad_render(b.copy()))
+
+    def test_freeze(self):
+        leg = translate([1, 2, 0])(rotate(30)(cube([1, 2, 3]), sphere(1, segments=8))).freeze()
+        expected = scad_render(leg)
+        for change in (lambda: leg.add(cube(1)), lambda: leg.children[0].add_param('a', 45),
+                       lambda: leg.set_hole(), lambda: leg.set_modifier('#'), lambda: leg.children[0].children.append(cube(1))):
+            self.assertRaises((TypeError, AttributeError), change)
+        with self.assertRaises(TypeError):
+            leg.params['v'] = [0, 0, 0]
+        self.assertEqual({'v': [1, 2, 0]}, dict(leg.params))
+
+        # Copies share everything below the top, and are copied again only
+        # along the path to what's changed
+        b = leg.copy()
+        self.assertFalse(b.frozen)
+        self.assertIs(leg.children[0], b.children[0])
+        b.add_param('v', [0, 0, 0])
+        b.thaw_child(0).thaw_child(1).add_param('r', 2)
+        self.assertIsNot(leg.children[0], b.children[0])
+        self.assertIs(leg.children[0].children[0], b.children[0].children[0])
+        self.assertEqual(expected, scad_render(leg))
+        self.assertEqual(expected.replace('[1, 2, 0]', '[0, 0, 0]').replace('r = 1', 'r = 2'), scad_render(b))
+
+    def test_render_is_pure(self):
+        from concurrent.futures import ThreadPoolExecutor
+        notched = translate([1, 0, 0])(cube(2, center=True), hole()(cylinder(r=0.5, h=3, segments=6)))
+        shared = union()(*[rotate(i)(notched) for i in range(50)])
+        expected = scad_render(shared)
+
+        def state():
+            nodes, stack = [], [shared]
+            while stack:
+                node = stack.pop()
+                nodes.append((node.name, node._params, node.parent, node._parents, node.has_hole_children,
+                              [id(c) for c in node.children]))
+                stack.extend(node.children)
+            return nodes
+
+        before = state()
+        self.assertEqual(before, (scad_render(shared), state())[1])
+
+        # Adding the tree elsewhere doesn't change how it renders on its own,
+        # even while it's being rendered
+        def render(i):
+            if i % 4 == 0:
+                translate([i, 0, 0])(shared)
+            return scad_render(shared)
+
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual([expected] * 40, list(executor.map(render, range(40))))
+        self.assertIn('/* Holes Below*/', expected)
+
+    def test_fold_transforms(self):
+        key = translate([5, 5, 0])(rotate([0, 0, 90])(translate([-5, -5, 0])(translate([1, 2, 0])(square(2)))))
+        a = union()(key, translate([1, 0])(translate([-1, 0])(circle(1), square(1))), mirror([1, 0, 0])(mirror([1, 0, 0])(cube(1))))
+        before = scad_render(a)
+
+        expected = ('\n\nunion() {\n\tmultmatrix(m = [[0, -1, 0, 8], [1, 0, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]]) {\n\t\tsquare(size = 2);\n\t}'
+                    '\n\tcircle(r = 1);\n\tsquare(size = 1);\n\tcube(size = 1);\n}')
+        self.assertEqual(expected, scad_render(a, optimize=True))
+        # The original is left as it was
+        self.assertEqual(before, scad_render(a))
+
+        # Anything that isn't a plain chain of transforms is left be
+        for b in (translate([1, 0, 0])(rotate(30)(cube(1)).set_modifier('#')),
+                  translate([1, 0, 0])(rotate(30)(cube(1)), sphere(1)),
+                  translate([1, 0, 0])(hole()(cube(1))),
+                  translate([0, 0, 0])(translate([1, 0, 0])(cube(1)).set_hole()),
+                  translate(['$t', 0, 0])(rotate(30)(cube(1)))):
+            self.assertEqual(scad_render(b), scad_render(b, optimize=True))
+
+        self.assertEqual('\n\nmultmatrix(m = [[-2, 0, 0, 0], [0, 2, 0, 0], [0, 0, 2, 0], [0, 0, 0, 1]]) {\n\tcube(size = 1);\n}',
+                         scad_render(mirror([1, 0, 0])(scale(2)(cube(1))), optimize=True))
+        self.assertEqual('\n\nrotate(a = 120) {\n\tcube(size = 1);\n}',
+                         scad_render(rotate(90)(rotate([0, 0, 30])(cube(1))), optimize=True))
+
+    def test_simplify_booleans(self):
+        from solid.optimize import optimize, simplify_booleans
+        a, b, c, d = cube(1), sphere(1), cylinder(r=1, h=2), square(1)
+        flat = '\n\n%s() {\n\tcube(size = 1);\n\tsphere(r = 1);\n\tcylinder(h = 2, r = 1);\n}'
+
+        for expected, tree in (('union', a + b + c), ('union', a + (b + c)), ('intersection', (a * b) * c),
+                               ('difference', (a - b) - c), ('difference', a - (b + c)),
+                               ('union', union()(a, union(), translate([1, 0, 0])(), union()(b, c)))):
+            before = scad_render(tree)
+            self.assertEqual(flat % expected, scad_render(tree, optimize=True))
+            self.assertEqual(flat % expected, scad_render(simplify_booleans(tree)))
+            # The original is left as it was
+            self.assertEqual(before, scad_render(tree))
+
+        self.assertEqual('\n\ncube(size = 1);', scad_render(intersection()(union()(a)), optimize=True))
+
+        # Nothing that would render differently is flattened
+        for tree in (a - (b - c), (a - b) * c, (a + b).set_modifier('#') + c, (a + b).set_hole() + c,
+                     part()(a + b) + c, intersection()(intersection()(hole()(a)), b), union()(hole()(a)),
+                     difference()(part()(a), b - c), difference()(a, union()(hole()(b, c)))):
+            self.assertEqual(scad_render(tree), scad_render(simplify_booleans(tree)))
+
+        # Translates pushed down into translates are folded into them
+        tree = union()(translate([1, 0, 0])(translate([0, 1, 0])(a), translate([2, 0, 0])(b)), c)
+        expected = ('\n\nunion() {\n\ttranslate(v = [1, 1, 0]) {\n\t\tcube(size = 1);\n\t}'
+                    '\n\ttranslate(v = [3, 0, 0]) {\n\t\tsphere(r = 1);\n\t}\n\tcylinder(h = 2, r = 1);\n}')
+        self.assertEqual(expected, scad_render(optimize(tree, push_translations=True)))
+        self.assertNotEqual(expected, scad_render(optimize(tree)))
+
     def test_scad_render_animated_file(self):
         def my_animate(_time=0):
             import math
@@ -262,9 +612,57 @@ class TestSolidPython(DiffOutput):
 
         self.assertEqual(expected, actual)
 
+        # A render that fails part way leaves the file as it was, and nothing
+        # else behind
+        class Unwritable(object):
+            def __str__(self):
+                raise ValueError("can't be written")
+
+        directory = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(directory, 'a.scad')
+            scad_render_to_file(a, filepath, include_orig_code=False)
+            for render in (lambda: scad_render_to_file(a + cube(Unwritable()), filepath, include_orig_code=False),
+                           lambda: scad_render_to_files([(a + cube(Unwritable()), filepath)])):
+                self.assertRaises(ValueError, render)
+                self.assertEqual(['a.scad'], os.listdir(directory))
+                with open(filepath) as f:
+                    self.assertEqual('\n\ncircle(r = 10);', f.read())
+        finally:
+            shutil.rmtree(directory)
+
         # TODO: test include_orig_code=True, but that would have to
         # be done from a separate file, or include everything in this one
 
+    def test_scad_render_to_stream(self):
+        class Chunks(object):
+            def __init__(self):
+                self.chunks = []
+
+            def write(self, s):
+                self.chunks.append(s)
+
+        a = union()(cube(2), translate([1, 0, 0])(sphere(1)), hole()(cylinder(r=1, h=3)))
+        stream = Chunks()
+        scad_render_to_stream(a, stream, file_header='$fn = 24;')
+
+        self.assertEqual(scad_render(a, file_header='$fn = 24;'), ''.join(stream.chunks))
+        self.assertTrue(len(stream.chunks) > 3)
+
+    def test_deep_tree(self):
+        # Nested far deeper than Python's recursion limit
+        depth = 5 * sys.getrecursionlimit()
+        a = hole()(cube(1))
+        for i in range(depth):
+            a = translate([1, 0, 0])(a) - sphere(1)
+
+        actual = scad_render(a)
+        # Every level appears once in the positive geometry and once above
+        # the hole
+        self.assertEqual(2 * depth, actual.count('translate'))
+        self.assertEqual(1, actual.count('cube'))
+        self.assertEqual(actual, scad_render(a.copy()))
+
 
 def single_test(test_dict):
     name, args, kwargs, expected = test_dict['name'], test_dict['args'], test_dict['kwargs'], test_dict['expected']
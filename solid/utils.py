@@ -257,8 +257,9 @@ def arc(rad, start_degrees, end_degrees, segments=None):
     # not the arc itself.  That means a quarter-circle arc will
     # have segments/4 segments.
 
-    bottom_half_square = back(rad)(square([3 * rad, 2 * rad], center=True))
-    top_half_square = forward(rad)(square([3 * rad, 2 * rad], center=True))
+    # Frozen, so that each copy below shares the square
+    bottom_half_square = back(rad)(square([3 * rad, 2 * rad], center=True)).freeze()
+    top_half_square = forward(rad)(square([3 * rad, 2 * rad], center=True)).freeze()
 
     start_shape = circle(rad, segments=segments)
 
@@ -1248,19 +1249,26 @@ def obj_tree_str(sp_obj, vars_to_print=None):
     if not vars_to_print:
         vars_to_print = []
 
-    # Signify if object has parent or not
-    parent_sign = "\nL " if sp_obj.parent else "\n* "
+    # Walk the tree with an explicit stack of (object, depth), so that no
+    # depth of nesting can run into Python's recursion limit
+    lines = []
+    stack = [(sp_obj, 0)]
+    while stack:
+        obj, depth = stack.pop()
 
-    # Print object
-    s = parent_sign + str(sp_obj) + "\t"
+        # Signify if object has parent or not
+        parent_sign = "\nL " if obj.parent else "\n* "
 
-    # Extra desired fields
-    for v in vars_to_print:
-        if hasattr(sp_obj, v):
-            s += "%s: %s\t" % (v, getattr(sp_obj, v))
+        # Print object
+        s = parent_sign + str(obj) + "\t"
 
-    # Add all children
-    for c in sp_obj.children:
-        s += indent(obj_tree_str(c, vars_to_print))
+        # Extra desired fields
+        for v in vars_to_print:
+            if hasattr(obj, v):
+                s += "%s: %s\t" % (v, getattr(obj, v))
 
-    return s
+        # Indent children one tab per level
+        lines.append(s.replace("\n", "\n" + "\t" * depth))
+        stack.extend((c, depth + 1) for c in reversed(obj.children))
+
+    return "".join(lines)